@@ -4,6 +4,7 @@ Class for representing a single XLM formula (1 cell).
 """
 
 import json
+import re
 import six
 if six.PY3: unicode = str
 
@@ -12,11 +13,212 @@ import excel
 
 from XLM.stack_item import *
 import XLM.xlm_library
+import XLM.stack_optimizer
+import XLM.cell_graph
 import XLM.color_print
+import XLM.utils
 #import XLM.compute_decode_keys
 
 debug = False
 
+## Max function call nesting depth of compiled stacks. Compiled stacks are
+## evaluated with Python recursion, so more deeply nested stacks are evaluated
+## with the (non-recursive) stack interpreter.
+MAX_COMPILED_DEPTH = 50
+
+## Max total function call nesting depth of the compiled stacks being evaluated at
+## once. A cell referenced from a compiled stack is evaluated with its own compiled
+## stack (with Python recursion) until this is reached, and with the stack
+## interpreter after that. 0 turns off compiled stacks.
+MAX_COMPILED_NESTING = 150
+
+## The total nesting depth of the compiled stacks being evaluated.
+_compiled_nesting = 0
+
+## Max # of cells executed when following the control flow of the XLM macros.
+## Used to stop infinite loops.
+MAX_EXECUTED_CELLS = 100000
+
+## Defined names starting with these (lower case) start the XLM macros when the
+## workbook is opened.
+_entry_point_prefixes = ("auto_open", "auto_activate")
+
+## Functions handled when following the control flow of the XLM macros.
+_control_funcs = set(["GOTO", "RUN", "RETURN", "HALT", "IF", "ELSE.IF", "ELSE", "END.IF",
+                      "WHILE", "NEXT", "FOR", "FOR.CELL"])
+
+####################################################################
+class _FuncFrame(object):
+    """
+    A function call waiting on the values of its arguments in _eval_stack_at().
+    """
+
+    ####################################################################
+    def __init__(self, item, num_args):
+        """
+        Constructor.
+
+        @param item (stack_item object) The function stack item.
+        @param num_args (int) The # of arguments of the function.
+        """
+        self.item = item
+        self.args = [None] * num_args
+
+        # Index of the argument currently being evaluated. Arguments are popped off
+        # the stack last argument 1st.
+        self.i = num_args
+
+####################################################################
+class _CellFrame(object):
+    """
+    A referenced XLM cell being evaluated in _eval_stack_at().
+    """
+
+    ####################################################################
+    def __init__(self, xlm_cell, stack, end):
+        """
+        Constructor.
+
+        @param xlm_cell (XLM_Object object) The cell being evaluated.
+        @param stack (list) The stack containing the cell reference.
+        @param end (int) The end of the remaining stack containing the cell reference.
+        """
+        self.xlm_cell = xlm_cell
+        self.stack = stack
+        self.end = end
+
+####################################################################
+def _eval_stack_at(stack, end, sheet, cell_stack):
+    """
+    Evaluate the XLM stack item at the top of stack[:end]. The stack is walked by
+    index, so no copies of the stack are made. Nested function calls and referenced
+    XLM cells are tracked on an explicit stack of frames rather than with Python
+    recursion, so arbitrarily deep formulas and long chains of cell references can be
+    evaluated.
+
+    @param stack (list) The stack to emulate. This is not modified.
+    @param end (int) Only the 1st end items of the stack are looked at.
+    @param sheet (ExcelSheet object) The sheet containing the XLM cell with the given stack.
+    @param cell_stack (list) Stack of cells being analyzed. Used to break infinite recursion.
+
+    @return (tuple) A 2 element tuple where the 1st element is the fully emulated result value
+    of the top stack item and the 2nd element is the end of the remaining stack (the items
+    used by the top stack item are stack[new end:end]).
+    """
+
+    # Function calls and cells waiting on values.
+    frames = []
+    while True:
+
+        # Sanity check.
+        if (end < 1):
+            raise ValueError("The XLM cell stack is empty.")
+
+        # Get the current stack item.
+        end -= 1
+        curr_item = stack[end]
+        if debug:
+            print("===== START MID LEVEL EVAL " + str(curr_item) + " =======")
+            print(curr_item)
+            print(type(curr_item))
+            print(stack[:end])
+
+        # If this is not a function there is nothing much to do.
+        r = curr_item
+        if (hasattr(curr_item, "is_function") and (not curr_item.is_function())):
+
+            # Just return the stack item if it is fully resolved.
+            if (hasattr(curr_item, "eval")):
+                r = curr_item.eval(sheet)
+            if debug:
+                print("????????")
+                print(r)
+                print(type(r))
+
+            # Is this a reference to a new XLM cell?
+            if (isinstance(r, XLM_Object)):
+
+                # Yes, eval that cell. The cell stack is evaluated in place and the
+                # current stack is picked up again when the cell value is known.
+                done, cell_val = _cell_result(r, cell_stack)
+                if (not done):
+                    if debug:
+                        print("==== START TOP LEVEL EVAL " + str(r) + " ======")
+                    frames.append(_CellFrame(r, stack, end))
+                    cell_stack.append(r)
+                    stack = r.stack
+                    end = len(stack)
+                    continue
+                r = cell_val
+
+        # Got a function?
+        got_value = True
+        if (hasattr(r, "is_function") and r.is_function()):
+
+            # Sanity check.
+            curr_item = r
+            num_args = curr_item.get_num_args()
+            if debug:
+                print("num args = " + str(num_args))
+            if (end < num_args):
+                print(stack[:end])
+                raise ValueError("Operator '" + str(curr_item) + "' requires " + str(num_args) + " arguments.")
+            frames.append(_FuncFrame(curr_item, num_args))
+            got_value = False
+        elif debug:
+            print("===== DONE MID LEVEL EVAL " + str(r) + " =======")
+
+        # Hand the value to the function or cell waiting on it, evaluating
+        # the functions whose arguments are all resolved.
+        while (len(frames) > 0):
+            frame = frames[-1]
+
+            # Done evaluating a referenced cell?
+            if (isinstance(frame, _CellFrame)):
+                frames.pop()
+                cell_stack.pop()
+                frame.xlm_cell.value = str(r)
+                r = frame.xlm_cell.value
+                stack = frame.stack
+                end = frame.end
+                if debug:
+                    print("==== DONE TOP LEVEL EVAL " + str(frame.xlm_cell) + " ======")
+                continue
+
+            # Save the argument value.
+            if (got_value):
+                frame.args[frame.i] = r
+            got_value = True
+            frame.i -= 1
+
+            # If we are currently looking at a 2 element FORMULA function the top argument
+            # on the stack is actually the destination to where to write the formula value,
+            # so we don't want to read the current value of that cell and pass that as an
+            # argument to FORMULA. Likewise, if we are looking at a SET.VALUE() call the 1st
+            # argument is a reference to the cell to update. Keep these as cell ref strings.
+            name = frame.item.name
+            if (((name == "FORMULA") and (len(frame.args) == 2) and (frame.i == 1)) or
+                ((name == "SET.VALUE") and (frame.i == 0))):
+                end -= 1
+                frame.args[frame.i] = str(stack[end])
+                frame.i -= 1
+
+            # More arguments to evaluate?
+            if (frame.i >= 0):
+                break
+
+            # Evaluate the function.
+            frames.pop()
+            r = XLM.xlm_library.eval(name, frame.args, sheet)
+            if debug:
+                print(r)
+                print(stack[:end])
+                print("===== DONE MID LEVEL EVAL " + str(frame.item) + " =======")
+
+        # Done with the top stack item?
+        else:
+            return (r, end)
+
 ####################################################################
 def _eval_stack(stack, sheet, cell_stack):
     """
@@ -38,98 +240,184 @@ def _eval_stack(stack, sheet, cell_stack):
     if (len(stack) == 0):
         raise ValueError("The XLM cell stack is empty.")
 
-    # Get the current stack item. Make sure the original stack is not modified.
-    tmp_stack = list(stack)
-    curr_item = tmp_stack.pop()
+    # Evaluate the top stack item.
+    r, end = _eval_stack_at(stack, len(stack), sheet, cell_stack)
+    return (r, stack[:end])
     
-    if debug:
-        print("===== START MID LEVEL EVAL " + str(curr_item) + " =======")
-        print(curr_item)
-        print(type(curr_item))
-        print(tmp_stack)
+####################################################################
+class _CannotCompile(Exception):
+    """
+    Raised when a stack cannot be compiled. The stack is interpreted with
+    _eval_stack() instead.
+    """
+    pass
 
-    # If this has already been resolved to a constant we are done.
-    if (not hasattr(curr_item, "is_function")):
-        if debug:            
-            print("===== DONE MID LEVEL EVAL " + str(curr_item) + " =======")
-        return (curr_item, tmp_stack)
-        
-    # If this is not a function there is nothing much to do.
-    if (not curr_item.is_function()):
+####################################################################
+def _compile_leaf(item, stack, end):
+    """
+    Compile a stack item that is not a function.
 
-        # Just return the stack item if it is fully resolved.
-        if (hasattr(curr_item, "eval")):
-            curr_item = curr_item.eval(sheet)
-        if debug:
-            print("????????")
-            print(curr_item)
-            print(type(curr_item))
+    @param item (stack_item object) The stack item.
+    @param stack (list) The stack being compiled.
+    @param end (int) The item is the top of stack[:end].
+
+    @return (function) The evaluator for the item.
+    """
+
+    # Literals always evaluate to the same value.
+    if (isinstance(item, (stack_str, stack_int, stack_bool))):
+        value = item.value
+        return lambda sheet, cell_stack: value
+
+    def eval_leaf(sheet, cell_stack):
+        r = item.eval(sheet)
 
         # Is this a reference to a new XLM cell?
-        if (isinstance(curr_item, XLM_Object)):
+        if (isinstance(r, XLM_Object)):
+            r = _eval_cell(r, sheet, cell_stack)
 
-            # Yes, eval that cell.
-            curr_item = _eval_cell(curr_item, sheet, cell_stack)
+        # The item evaluated to a function that works on the stack below it. Let
+        # the stack interpreter handle this.
+        if (hasattr(r, "is_function") and r.is_function()):
+            r, _ = _eval_stack_at(stack, end, sheet, cell_stack)
+        return r
+    return eval_leaf
 
-        # Done emulating this item?
-        if ((not hasattr(curr_item, "is_function")) or (not curr_item.is_function())):
-            if debug:
-                print("===== DONE MID LEVEL EVAL " + str(curr_item) + " =======")
-            return (curr_item, tmp_stack)
+####################################################################
+def _compile_function(item, arg_evals):
+    """
+    Compile a function call stack item.
 
-    # We have a function.
+    @param item (stack_item object) The function stack item.
+    @param arg_evals (list) The evaluators of the function arguments, in the
+    order the arguments are popped off the stack (last argument 1st).
 
-    # Sanity check.
+    @return (function) The evaluator for the function call.
+    """
+
+    # Look up the function emulator now. FORMULA() and unknown functions go
+    # through xlm_library.eval().
+    name = item.name
+    func = XLM.xlm_library.func_lookup.get(name, None)
+    if ((name == "FORMULA") or (func is None)):
+        def eval_func(sheet, cell_stack):
+            args = [arg_eval(sheet, cell_stack) for arg_eval in arg_evals]
+            args.reverse()
+            return XLM.xlm_library.eval(name, args, sheet)
+        return eval_func
+
+    # Most functions have 1 or 2 arguments, so these are called without building
+    # and reversing a list of argument values. The arguments are still evaluated
+    # last argument 1st.
+    if (len(arg_evals) == 1):
+        eval_0 = arg_evals[0]
+        def call_func_1(sheet, cell_stack):
+            a = eval_0(sheet, cell_stack)
+            return func([(a.eval(sheet) if hasattr(a, "eval") else a)], sheet)
+        return call_func_1
+    if (len(arg_evals) == 2):
+        eval_1, eval_0 = arg_evals
+        def call_func_2(sheet, cell_stack):
+            b = eval_1(sheet, cell_stack)
+            a = eval_0(sheet, cell_stack)
+            return func([(a.eval(sheet) if hasattr(a, "eval") else a),
+                         (b.eval(sheet) if hasattr(b, "eval") else b)], sheet)
+        return call_func_2
+    def call_func(sheet, cell_stack):
+        args = [arg_eval(sheet, cell_stack) for arg_eval in arg_evals]
+        args.reverse()
+        return func([(arg.eval(sheet) if hasattr(arg, "eval") else arg) for arg in args], sheet)
+    return call_func
+
+####################################################################
+def _compile_top(stack, end, depth=0, max_depth=None):
+    """
+    Compile the top item of a stack (and its arguments) into an evaluator.
+
+    @param stack (list) The stack being compiled.
+    @param end (int) The stack is treated as stack[:end].
+    @param depth (int) The function call nesting depth of the item.
+    @param max_depth (list) If given, the 1st element is updated to the max
+    nesting depth of the compiled items.
+
+    @return (tuple) A 2 element tuple where the 1st element is the evaluator
+    (a function taking the sheet and the cell stack and returning the value of the
+    stack item) and the 2nd element is the end of the remaining stack.
+
+    @throws _CannotCompile Thrown if the stack cannot be compiled.
+    """
+    if ((end < 1) or (depth > MAX_COMPILED_DEPTH)):
+        raise _CannotCompile()
+    if ((max_depth is not None) and (depth > max_depth[0])):
+        max_depth[0] = depth
+    curr_item = stack[end - 1]
+    end -= 1
+
+    # Already a constant?
+    if (not hasattr(curr_item, "is_function")):
+        return ((lambda sheet, cell_stack: curr_item), end)
+
+    # Not a function?
+    if (not curr_item.is_function()):
+        return (_compile_leaf(curr_item, stack, end + 1), end)
+
+    # We have a function. Compile the arguments in the order _eval_stack() pops
+    # them.
     num_args = curr_item.get_num_args()
-    if debug:
-        print("num args = " + str(num_args))
-    if (len(tmp_stack) < num_args):
-        print(tmp_stack)
-        raise ValueError("Operator '" + str(curr_item) + "' requires " + str(num_args) + " arguments.")
-
-    # If we are currently looking at a 2 element FORMULA function we will need to tweak the top
-    # argument on the stack. This is actually the destination to where to write the formula value,
-    # so we don't want to read the current value of that cell and pass that as an argument to
-    # FORMULA.
-    if ((curr_item.name == "FORMULA") and (num_args == 2)):
-        ref_item = tmp_stack.pop()
-        tmp_stack.append(str(ref_item))
-    
-    # Resolve all the arguments.
-    args = []
+    if (end < num_args):
+        raise _CannotCompile()
+    arg_evals = []
     for i in range(0, num_args):
 
-        # If we are looking at a SET.VALUE() call the 1st argument is a reference to
-        # the cell to update. Keep the 1st arg as a cell ref string in this case.
-        arg = None
-        if ((curr_item.name == "SET.VALUE") and (i == (num_args - 1))):
-            cell_ref = tmp_stack.pop()
-            arg = str(cell_ref)            
-        else:
-            arg, tmp_stack = _eval_stack(tmp_stack, sheet, cell_stack)
-        args.insert(0, arg)
+        # The destination of a 2 argument FORMULA() and the cell updated by
+        # SET.VALUE() are passed as cell reference strings.
+        if (((curr_item.name == "FORMULA") and (num_args == 2) and (i == 0)) or
+            ((curr_item.name == "SET.VALUE") and (i == (num_args - 1)))):
+            ref_str = str(stack[end - 1])
+            end -= 1
+            arg_evals.append(lambda sheet, cell_stack, ref_str=ref_str: ref_str)
+            continue
+        arg_eval, end = _compile_top(stack, end, depth + 1, max_depth)
+        arg_evals.append(arg_eval)
+    return (_compile_function(curr_item, arg_evals), end)
 
-    # Evaluate the function.
-    r = XLM.xlm_library.eval(curr_item.name, args, sheet)
-    if debug:
-        print(r)
-        print(tmp_stack)
-        print("===== DONE MID LEVEL EVAL " + str(curr_item) + " =======")
-    return (r, tmp_stack)
-    
 ####################################################################
-def _eval_cell(xlm_cell, sheet, cell_stack):
+def _compile_stack(stack):
     """
-    Emulate the behavior of a single XLM cell.
+    Compile an XLM stack into a tree of Python closures. Evaluating the
+    compiled stack gives the same result as _eval_stack(), but the stack walking,
+    type checks and function lookups are only done once.
+
+    @param stack (list) The stack to compile.
+
+    @return (tuple) A 2 element tuple where the 1st element is the compiled
+    stack, a function taking the sheet and the cell stack (see _eval_stack()) and
+    returning the value of the top stack item, and the 2nd element is the function
+    call nesting depth of the compiled stack. (None, 0) is returned if the stack
+    cannot be compiled or is nested too deeply to be evaluated with Python
+    recursion.
+    """
+    if (stack is None):
+        return (None, 0)
+    max_depth = [0]
+    try:
+        r, _ = _compile_top(stack, len(stack), 0, max_depth)
+        return (r, max_depth[0] + 1)
+    except _CannotCompile:
+        return (None, 0)
 
-    @param xlm_cell (XLM_Object object) The XLM cell to emulate.
+####################################################################
+def _cell_result(xlm_cell, cell_stack):
+    """
+    Check to see if the value of an XLM cell is known without emulating the cell.
 
-    @param sheet (ExcelSheet object) The sheet containing the cell. Intermediate
-    XLM cell values will be updated in this object.
+    @param xlm_cell (XLM_Object object) The XLM cell.
 
     @param cell_stack (list) Stack of cells being analyzed. Used to break infinite recursion.
 
-    @return (str) The final value of the XLM function.
+    @return (tuple) A 2 element tuple where the 1st element is True if the value is
+    known (False if the cell stack needs to be emulated) and the 2nd element is the
+    known value.
     """
 
     # Did we already compute the value for this cell?
@@ -137,24 +425,64 @@ def _eval_cell(xlm_cell, sheet, cell_stack):
         if debug:
             print("Short circuit eval of '" + str(xlm_cell) + "'. Alerady got val.")
             print(xlm_cell.value)
-        return xlm_cell.value
+        return (True, xlm_cell.value)
     
     # Are we getting into infinite recursion?
     if (xlm_cell in cell_stack):
         msg = "WARNING: Infinite recursion detected when resolving '" + xlm_cell.cell_id + ":" + str(xlm_cell) + "'."
         XLM.color_print.output('y', msg)
-        return ''
+        return (True, '')
     
-    # Evaluate the XLM stack for the cell.
+    # Is there a stack to emulate?
     if (not hasattr(xlm_cell, "stack")):
-        return str(xlm_cell)
+        return (True, str(xlm_cell))
+    return (False, None)
+
+####################################################################
+def _eval_cell(xlm_cell, sheet, cell_stack):
+    """
+    Emulate the behavior of a single XLM cell.
+
+    @param xlm_cell (XLM_Object object) The XLM cell to emulate.
+
+    @param sheet (ExcelSheet object) The sheet containing the cell. Intermediate
+    XLM cell values will be updated in this object.
+
+    @param cell_stack (list) Stack of cells being analyzed. Used to break infinite recursion.
+
+    @return (str) The final value of the XLM function.
+    """
+
+    # Is the value of the cell already known?
+    done, r = _cell_result(xlm_cell, cell_stack)
+    if (done):
+        return r
+    
+    # Evaluate the XLM stack for the cell. Compiled stacks are evaluated with
+    # Python recursion, so they are only used while the compiled stacks being
+    # evaluated are not nested too deeply.
+    global _compiled_nesting
     stack = xlm_cell.stack
     if debug:
         print("==== START TOP LEVEL EVAL " + str(xlm_cell) + " ======")
         print(xlm_cell)
         print(stack)
+    evaluator = None
+    nesting = 0
+    if (not debug):
+        evaluator = xlm_cell.compiled()
+        nesting = xlm_cell._compiled_nesting
+        if (_compiled_nesting + nesting > MAX_COMPILED_NESTING):
+            evaluator = None
     cell_stack.append(xlm_cell)
-    final_val, _ = _eval_stack(stack, sheet, cell_stack)
+    if (evaluator is not None):
+        _compiled_nesting += nesting
+        try:
+            final_val = evaluator(sheet, cell_stack)
+        finally:
+            _compiled_nesting -= nesting
+    else:
+        final_val, _ = _eval_stack(stack, sheet, cell_stack)
     if debug:
         print("==== DONE TOP LEVEL EVAL " + str(xlm_cell) + " ======")
 
@@ -178,16 +506,33 @@ def _pull_actions(sheet):
     # Cycle through the XLM cells in numeric order.
     indices = sheet.xlm_cell_indices
     indices.sort()
-    r = []
+    values = []
     for index in indices:
 
         # Get the current cell value.
-        curr_value = None
         try:
-            curr_val = str(sheet.cell(index[0], index[1]))
+            values.append(str(sheet.cell(index[0], index[1])))
         except KeyError:
             continue
 
+    # Pull out the actions.
+    return _pull_value_actions(values)
+
+####################################################################
+def _pull_value_actions(values):
+    """
+    Pull the actions from the given resolved XLM cell values.
+
+    @param values (list) The resolved XLM cell values (str), in the order the
+    actions were performed.
+
+    @return (list) A list of 3 element tuples where the 1st element is the general 
+    action type, the 2nd element is details of the action, and the 3rd element is a 
+    general note.
+    """
+    r = []
+    for curr_val in values:
+
         # Is this an action?
         # 'ACTION: CALL(['URLDownloadToFileA', 0, 'foo', 0, 'http:/bar.com', 'C:\\ProgramData\\junk', 0, 0])'
         if (curr_val.startswith("ACTION: ")):
@@ -260,59 +605,60 @@ def _pull_actions(sheet):
     return r
 
 ####################################################################
-def _eval_certain_cells(result_sheet, cell_types, done_cells):
+def _eval_queued_cells(result_sheet, cell_graph):
     """
-    Emulate the behavior of cells running certain functions.
+    Emulate the XLM cells queued in the dependency graph of a sheet, in dependency
+    order. Cells whose dependencies are changed by emulation are queued again.
 
     @param result_sheet (ExcelSheet object) The sheet to emulate. Thie will
     be modified and updated.
 
-    @param cell_types (set) The names of the functions for which to emulate 
-    cells. All cells will be emulated if this is None.
+    @param cell_graph (CellGraph object) The dependency graph of the XLM cells
+    of the sheet.
+    """
 
-    @param done_cells (set) Cells that were already emulated. They will not
-    be emulated again.
+    # Cycle through each queued cell.
+    while True:
+        cell_index = cell_graph.next_cell()
+        if (cell_index is None):
+            break
+        xlm_cell = cell_graph.formulas[cell_index]
 
-    @return (set) The cells that were emulated (set of str).
+        # Evaluate the cell.
+        cell_graph.current = cell_index
+        resolved_cell = _eval_cell(xlm_cell, result_sheet, [])
+        cell_graph.current = None
+        if debug:
+            print("-------")
+            print(xlm_cell)
+            print(resolved_cell)
+
+        # Save the value unless emulating the cell wrote something else to it.
+        if (cell_graph.formulas.get(cell_index, None) is xlm_cell):
+            result_sheet.cells[cell_index] = resolved_cell
+    
+####################################################################
+def _get_xlm_code(sheet):
     """
+    Get the human readable XLM code of the XLM cells of a sheet.
 
-    # Cycle through each cell.
-    for cell_index in result_sheet.xlm_cell_indices:
+    @param sheet (ExcelSheet object) The sheet with the XLM cells.
 
-        # Get the XLM cell (XLM_Object) to emulate.
+    @return (str) The XLM code, 1 cell per line in cell order.
+    """
+    sheet.xlm_cell_indices.sort()
+    xlm_code = ""
+    for cell_index in sheet.xlm_cell_indices:
         xlm_cell = None
         try:
-            xlm_cell = result_sheet.cell(cell_index[0], cell_index[1])
+            xlm_cell = sheet.cell(cell_index[0], cell_index[1])
         except KeyError:
             XLM.color_print.output('y', "WARNING: Cell " + str(cell_index) + " not found. Skipping.")
             continue
-        if (not isinstance(xlm_cell, XLM_Object)):
-            continue
-        if (str(xlm_cell) in done_cells):
-            continue
-        
-        # Is this a cell of interest?
-        if (cell_types is not None):
-            interesting = False
-            for interesting_func in cell_types:
-                if (interesting_func + "(" in str(xlm_cell)):
-                    interesting = True
-                    break
-            if (not interesting):
-                continue
-
-        # This is an interesting cell. Evaluate it.
-        resolved_cell = _eval_cell(xlm_cell, result_sheet, [])
-        if debug:
-            print("-------")
-            print(xlm_cell)
-            print(resolved_cell)
-        result_sheet.cells[cell_index] = resolved_cell
-        done_cells.add(str(xlm_cell))
+        cell_id = "$R" + str(cell_index[0]) + "$C" + str(cell_index[1]) + ":"
+        xlm_code += cell_id + " ---> " + str(xlm_cell) + "\n"
+    return xlm_code
 
-    # Return the emulated cells.
-    return done_cells
-    
 ####################################################################
 def eval(sheet):
     """
@@ -332,38 +678,22 @@ def eval(sheet):
 
     # Get the human readable XLM code.
     result_sheet = sheet
-    result_sheet.xlm_cell_indices = sheet.xlm_cell_indices
-    result_sheet.xlm_cell_indices.sort()
-    xlm_code = ""
-    for cell_index in result_sheet.xlm_cell_indices:
-        xlm_cell = None
-        try:
-            xlm_cell = result_sheet.cell(cell_index[0], cell_index[1])
-        except KeyError:
-            XLM.color_print.output('y', "WARNING: Cell " + str(cell_index) + " not found. Skipping.")
-            continue
-        cell_id = "$R" + str(cell_index[0]) + "$C" + str(cell_index[1]) + ":"
-        xlm_code += cell_id + " ---> " + str(xlm_cell) + "\n"
+    xlm_code = _get_xlm_code(result_sheet)
         
     # Emulate the XLM cells.
     #
     # XLM macros are fancy Excel formulas, so we should be able to ignore the execution
-    # flow of the XLM macros and just evaluate every XLM cell in an arbitrary order. This
-    # assumes that the XLM macros do not modify the program state, where program state is tracked
-    # by updating constant values stored in cells.
-
-    # Evaluate all the SET.VALUE() cells first since they can modify cell values.
-    done_cells = _eval_certain_cells(result_sheet, set(["SET.VALUE"]), set())
-
-    # Compute the decode keys used to decode characters so we can build FORMULAs.
-    #XLM.compute_decode_keys.resolve_char_keys(result_sheet)
-
-    # Now decode the FORMULAs.
-    done_cells = _eval_certain_cells(result_sheet, set(["FORMULA"]), done_cells)
-
-    # Emulate each remaining XLM cell.
+    # flow of the XLM macros and just evaluate every XLM cell. The cells are evaluated
+    # in dependency order, so the SET.VALUE() and FORMULA() cells writing a cell are
+    # evaluated before the cells reading it. If emulating a cell changes a cell that
+    # was already used, the XLM cells depending on the changed cell are evaluated again.
     result_sheet.xlm_cell_indices.sort()
-    done_cells = _eval_certain_cells(result_sheet, None, done_cells)
+    cell_graph = XLM.cell_graph.CellGraph(result_sheet)
+    result_sheet.cell_graph = cell_graph
+    try:
+        _eval_queued_cells(result_sheet, cell_graph)
+    finally:
+        result_sheet.cell_graph = None
         
     if debug:
         print("------- FINAL SHEET --------")
@@ -375,6 +705,452 @@ def eval(sheet):
     # Done.
     return (r, xlm_code)
         
+####################################################################
+def _get_entry_points(sheet):
+    """
+    Find the cells where execution of the XLM macros starts when the workbook is
+    opened. These are the cells referenced by the Auto_Open and Auto_Activate
+    defined names.
+
+    @param sheet (ExcelSheet object) The sheet with the XLM cells. The defined
+    names are read from the defined_names field of the sheet.
+
+    @return (list) The (row, column) indices of the starting cells.
+    """
+    sheet_name = getattr(sheet, "name", None)
+    r = []
+    for name, name_sheet, cell_index in getattr(sheet, "defined_names", []):
+        if ((cell_index is None) or (not name.lower().startswith(_entry_point_prefixes))):
+            continue
+        if ((name_sheet is not None) and (sheet_name is not None) and (name_sheet != sheet_name)):
+            XLM.color_print.output('y', "WARNING: " + name + " starts on sheet '" + name_sheet + "', not the XLM sheet. Skipping.")
+            continue
+        if (cell_index not in r):
+            r.append(cell_index)
+    return r
+
+####################################################################
+def _get_arg_ends(stack, end, num_args):
+    """
+    Find the arguments of a function call on a stack without evaluating them.
+
+    @param stack (list) The stack.
+    @param end (int) The function is at stack[end], so its arguments end at end.
+    @param num_args (int) The # of arguments of the function.
+
+    @return (list) The end of each argument (the argument is the top item of
+    stack[:arg end]), 1st argument 1st.
+
+    @throws ValueError Thrown if the stack does not have the arguments.
+    """
+    r = [None] * num_args
+    for i in range(num_args - 1, -1, -1):
+        r[i] = end
+
+        # Skip over the stack items making up the argument.
+        need = 1
+        while (need > 0):
+            end -= 1
+            if (end < 0):
+                raise ValueError("Not enough arguments for function at stack position " + str(r[-1]) + ".")
+            item = stack[end]
+            need -= 1
+            if (hasattr(item, "is_function") and item.is_function()):
+                need += item.get_num_args()
+    return r
+
+####################################################################
+def _is_true(value):
+    """
+    Check to see if an emulated XLM value is TRUE.
+
+    @param value (any) The value.
+
+    @return (boolean) True if the value is TRUE or a non-zero number, False if not.
+    """
+    if (isinstance(value, bool)):
+        return value
+    value = str(value).strip()
+    if (value.upper() in ("TRUE", "FALSE")):
+        return (value.upper() == "TRUE")
+    try:
+        return (float(value) != 0)
+    except ValueError:
+        return False
+
+## Matches a cell reference string like '$R5$C1' or 'R5C1'.
+_r1c1_ref_pat = re.compile(r"^\$?R(\d+)\$?C(\d+)$", re.IGNORECASE)
+
+####################################################################
+def _get_jump_target(stack, end, sheet, cell_stack):
+    """
+    Find the cell jumped to by a GOTO() or RUN() call.
+
+    @param stack (list) The stack of the cell making the call.
+    @param end (int) The target argument is the top item of stack[:end].
+    @param sheet (ExcelSheet object) The sheet being emulated.
+    @param cell_stack (list) Stack of cells being analyzed. Used to break infinite recursion.
+
+    @return (tuple) The (row, column) of the target cell, None if the target cannot
+    be figured out.
+    """
+
+    # Direct cell reference?
+    item = stack[end - 1]
+    if (isinstance(item, (stack_cell_ref, stack_area))):
+        return (item.row, item.column)
+
+    # Reference to a defined name (ptgName, 1 based)?
+    names = getattr(sheet, "defined_names", [])
+    if (isinstance(item, stack_name)):
+        try:
+            index = int(item.hexcode, 16)
+        except ValueError:
+            index = 0
+        if ((0 < index <= len(names)) and (names[index - 1][2] is not None)):
+            return names[index - 1][2]
+        return None
+
+    # Compute the target. This may be a cell reference string or a defined name.
+    target, _ = _eval_stack_at(stack, end, sheet, cell_stack)
+    target = str(target).strip()
+    m = _r1c1_ref_pat.match(target)
+    if (m is not None):
+        return (int(m.group(1)), int(m.group(2)))
+    for name, _, cell_index in names:
+        if ((cell_index is not None) and (name.lower() == target.lower())):
+            return cell_index
+    return None
+
+####################################################################
+def _exec_stack(stack, end, sheet, cell_stack):
+    """
+    Execute the function call at the top of stack[:end] of a cell being executed
+    when following the control flow of the XLM macros. Control flow functions are
+    not emulated, they are returned for the caller to act on.
+
+    @param stack (list) The stack of the cell being executed.
+    @param end (int) The function call is the top item of stack[:end].
+    @param sheet (ExcelSheet object) The sheet being emulated.
+    @param cell_stack (list) Stack of cells being analyzed. Used to break infinite recursion.
+
+    @return (tuple) A 2 element tuple where the 1st element is the name of the
+    control flow function ("GOTO", "RUN", "RETURN", "IF", "ELSE.IF", "ELSE",
+    "END.IF", "WHILE", "NEXT", "FOR"), None if the cell is not a control flow
+    function, and the 2nd element is the value of the cell (the target cell for
+    GOTO and RUN, the truth of the condition for IF, ELSE.IF and WHILE).
+    """
+
+    # Not a function call?
+    item = stack[end - 1]
+    if ((not hasattr(item, "is_function")) or (not item.is_function()) or
+        (getattr(item, "name", None) not in _control_funcs)):
+        r, _ = _eval_stack_at(stack, end, sheet, cell_stack)
+        return (None, r)
+    name = item.name
+    num_args = item.get_num_args()
+    arg_ends = _get_arg_ends(stack, end - 1, num_args)
+
+    # Jump to a cell?
+    if (name in ("GOTO", "RUN")):
+        if (num_args < 1):
+            return (None, name)
+        return (name, _get_jump_target(stack, arg_ends[0], sheet, cell_stack))
+
+    # Conditionals.
+    if (name in ("IF", "ELSE.IF", "WHILE")):
+        if (num_args < 1):
+            return (None, name)
+        cond, _ = _eval_stack_at(stack, arg_ends[0], sheet, cell_stack)
+        cond = _is_true(cond)
+
+        # IF(cond, then, else) only executes the chosen branch.
+        if ((name == "IF") and (num_args > 1)):
+            branch = 1 if cond else 2
+            if (branch >= num_args):
+                return (None, False)
+            return _exec_stack(stack, arg_ends[branch], sheet, cell_stack)
+        return (name, cond)
+
+    # HALT() is emulated to record the action. FOR() and FOR.CELL() are not
+    # emulated, their loop bodies are executed once.
+    if (name in ("HALT", "FOR", "FOR.CELL")):
+        r, _ = _eval_stack_at(stack, end, sheet, cell_stack)
+        return ("FOR" if (name != "HALT") else name, r)
+    return (name, None)
+
+####################################################################
+def _skip_block(sheet, cell_index, max_row, openers, closers):
+    """
+    Find the cell closing a block (like the END.IF() of an IF()) in the column of
+    the cell starting the block. Nested blocks are skipped.
+
+    @param sheet (ExcelSheet object) The sheet being emulated.
+    @param cell_index (tuple) The (row, column) of the cell starting the block.
+    @param max_row (int) The row of the last XLM cell in the column.
+    @param openers (tuple) The names of the functions starting nested blocks.
+    @param closers (tuple) The names of the functions that can close the block.
+
+    @return (tuple) A 2 element tuple where the 1st element is the (row, column) of
+    the closing cell and the 2nd element is the name of the closing function. (None,
+    None) is returned if the block is not closed.
+    """
+    row, col = cell_index
+    depth = 0
+    for row in range(row + 1, max_row + 1):
+        try:
+            xlm_cell = sheet.cell(row, col)
+        except KeyError:
+            continue
+        if ((not isinstance(xlm_cell, XLM_Object)) or (len(xlm_cell.stack) == 0)):
+            continue
+        item = xlm_cell.stack[-1]
+        name = getattr(item, "name", None)
+        if ((not hasattr(item, "is_function")) or (not item.is_function())):
+            continue
+
+        # Block IF()s have only a condition.
+        if ((name in openers) and ((name != "IF") or (item.get_num_args() == 1))):
+            depth += 1
+        elif (name in closers):
+            if (depth == 0):
+                return ((row, col), name)
+            if (name in ("END.IF", "NEXT")):
+                depth -= 1
+    return (None, None)
+
+####################################################################
+def eval_control_flow(sheet):
+    """
+    Emulate the XLM behavior of an Excel sheet by following the control flow of the
+    macros. Execution starts at the Auto_Open and Auto_Activate cells and goes down
+    the column (until a blank cell), following GOTO(), RUN(), RETURN(), IF(), WHILE()
+    and NEXT(). Only the executed cells are emulated, in execution order. If no
+    starting cells are known all the cells are emulated (see eval()).
+
+    @param sheet (ExcelSheet object) The workbook to emulate.
+
+    @return (tuple) 1st element is a list of 3 element tuples containing the actions performed
+    by the sheet, 2nd element is the human readable XLM code.
+    """
+
+    # Sanity check.
+    if (not isinstance(sheet, excel.ExcelSheet)):
+        raise ValueError("sheet arg is a '" + str(type(sheet)) + "', not a 'ExcelSheet'.")
+    if (not hasattr(sheet, "xlm_cell_indices")):
+        raise ValueError("sheet arg does not have 'xlm_cell_indices' field.")
+
+    # Where does execution start?
+    entry_points = _get_entry_points(sheet)
+    if (len(entry_points) == 0):
+        XLM.color_print.output('y', "WARNING: No Auto_Open cells found. Emulating all XLM cells.")
+        return eval(sheet)
+
+    # Get the human readable XLM code.
+    xlm_code = _get_xlm_code(sheet)
+
+    # Blocks are only looked for down to the last XLM cell of each column. FORMULA()
+    # can add XLM cells, so this is updated as cells are added.
+    max_rows = {}
+    num_indices = 0
+
+    # Run the macros from each starting cell.
+    values = []
+    num_executed = 0
+    collapsed_loops = set()
+    for entry_point in entry_points:
+        pc = entry_point
+        call_stack = []
+        loop_stack = []
+        in_else_if = False
+        while (pc is not None):
+
+            # Stop infinite loops.
+            num_executed += 1
+            if (num_executed > MAX_EXECUTED_CELLS):
+                XLM.color_print.output('y', "WARNING: Executed " + str(MAX_EXECUTED_CELLS) + " XLM cells. Stopping emulation.")
+                break
+
+            # Execution ends at a blank cell. Cells with just a value are skipped.
+            try:
+                xlm_cell = sheet.cell(pc[0], pc[1])
+            except KeyError:
+                xlm_cell = None
+            if ((not isinstance(xlm_cell, XLM_Object)) or (len(xlm_cell.stack) == 0)):
+                if ((xlm_cell is None) or (len(str(xlm_cell).strip()) == 0)):
+                    if debug:
+                        print("Control flow: no XLM at " + str(pc) + ". Stopping.")
+                    break
+                pc = (pc[0] + 1, pc[1])
+                continue
+
+            # Track the last XLM cell of each column.
+            if (num_indices != len(sheet.xlm_cell_indices)):
+                for row, col in sheet.xlm_cell_indices[num_indices:]:
+                    max_rows[col] = max(row, max_rows.get(col, 0))
+                num_indices = len(sheet.xlm_cell_indices)
+
+            # Execute the cell. The value of a cell executed again is recomputed.
+            if debug:
+                print("Control flow: executing " + str(pc) + " " + str(xlm_cell))
+            top_item = xlm_cell.stack[-1]
+            try:
+                if (getattr(top_item, "name", None) in _control_funcs):
+                    action, value = _exec_stack(xlm_cell.stack, len(xlm_cell.stack), sheet, [xlm_cell])
+                else:
+                    xlm_cell.value = None
+                    action, value = (None, _eval_cell(xlm_cell, sheet, []))
+            except ValueError as e:
+                XLM.color_print.output('r', "ERROR: Cannot execute cell " + str(pc) + ". " + str(e))
+                action, value = (None, "")
+            next_pc = (pc[0] + 1, pc[1])
+            if (action in (None, "HALT")):
+                xlm_cell.value = str(value)
+                values.append(xlm_cell.value)
+            if (action == "HALT"):
+                next_pc = None
+
+            # Jumps.
+            elif (action in ("GOTO", "RUN")):
+                if (value is None):
+                    XLM.color_print.output('y', "WARNING: Cannot find the target of " + action + "() in cell " + str(pc) + ". Stopping.")
+                    break
+                if (action == "RUN"):
+                    call_stack.append(next_pc)
+                next_pc = value
+            elif (action == "RETURN"):
+                next_pc = call_stack.pop() if (len(call_stack) > 0) else None
+
+            # Block IF()s. A false condition skips to the next ELSE.IF(), ELSE() or
+            # END.IF(). The end of a branch that was run skips to the END.IF().
+            elif ((action == "IF") or ((action == "ELSE.IF") and in_else_if)):
+                if (not value):
+                    next_pc, closer = _skip_block(sheet, pc, max_rows.get(pc[1], 0), ("IF",), ("ELSE.IF", "ELSE", "END.IF"))
+                    if (closer == "ELSE.IF"):
+                        in_else_if = True
+                        pc = next_pc
+                        continue
+                    if (next_pc is not None):
+                        next_pc = (next_pc[0] + 1, next_pc[1])
+            elif (action in ("ELSE.IF", "ELSE")):
+                next_pc, _ = _skip_block(sheet, pc, max_rows.get(pc[1], 0), ("IF",), ("END.IF",))
+
+            # Loops. NEXT() goes back to the WHILE() to check the condition again.
+            elif (action == "WHILE"):
+                if (value):
+                    if ((len(loop_stack) == 0) or (loop_stack[-1] != pc)):
+                        loop_stack.append(pc)
+                else:
+                    if ((len(loop_stack) > 0) and (loop_stack[-1] == pc)):
+                        loop_stack.pop()
+                    next_pc, _ = _skip_block(sheet, pc, max_rows.get(pc[1], 0), ("WHILE", "FOR", "FOR.CELL"), ("NEXT",))
+                    if (next_pc is not None):
+                        next_pc = (next_pc[0] + 1, next_pc[1])
+            elif (action == "FOR"):
+                loop_stack.append(None)
+                if (pc not in collapsed_loops):
+                    collapsed_loops.add(pc)
+                    XLM.color_print.output('y', "WARNING: " + str(top_item.name) + "() loop in cell " + str(pc) +
+                                           " is not emulated. Running its body once.")
+            elif (action == "NEXT"):
+                if ((len(loop_stack) > 0) and (loop_stack[-1] is not None)):
+                    next_pc = loop_stack[-1]
+                elif (len(loop_stack) > 0):
+                    loop_stack.pop()
+            in_else_if = False
+            pc = next_pc
+
+    if debug:
+        print("------- FINAL SHEET --------")
+        print(sheet)
+
+    # Pull the actions from the executed XLM cells.
+    r = _pull_value_actions(values)
+
+    # Done.
+    return (r, xlm_code)
+
+####################################################################
+def _format_call(item, args):
+    """
+    Get the string representation of a function call.
+
+    @param item (stack_item object) The function stack item.
+    @param args (list) The string representations of the function arguments.
+
+    @return (str) The string representation of the function call.
+    """
+    if (item.is_infix_function()):
+        if (len(args) == 1):
+            return str(item) + str(args[0])
+        return str(args[0]) + str(item) + str(args[1])
+    return str(item) + "(" + ",".join([str(arg) for arg in args]) + ")"
+
+####################################################################
+def _get_str_at(stack, end):
+    """
+    Get the string representation for the single function at the top of
+    stack[:end]. The stack is walked by index, so no copies of the stack are made,
+    and nested function calls are tracked on an explicit stack of frames rather than
+    with Python recursion.
+
+    @param stack (list) The current stack. This is not modified.
+    @param end (int) Only the 1st end items of the stack are looked at.
+        
+    @return (tuple) A 2 element tuple with the 1st element being the 
+    string representation of the topmost stack item and the 2nd item being 
+    the end of the remaining stack.
+    """
+
+    # Function calls waiting on the strings of their arguments.
+    frames = []
+    while True:
+
+        # Sanity check.
+        if (end < 1):
+            raise ValueError("The stack is empty.")
+
+        # Get the current stack item.
+        end -= 1
+        curr_item = stack[end]
+        
+        # If this is not a function just convert the top stack item to a string.
+        if (not curr_item.is_function()):
+            r = str(curr_item)
+
+        # We have a function. Infix functions have 2 arguments (1 for the unary
+        # operators), the others have a variable # of arguments.
+        else:
+            if (curr_item.is_infix_function()):
+                num_args = curr_item.get_num_args()
+                if (end < num_args):
+                    raise ValueError("Infix operator '" + str(curr_item) + "' requires " + str(num_args) + " arguments.")
+            else:
+                num_args = curr_item.get_num_args()
+                if (end < num_args):
+                    print(stack[:end])
+                    raise ValueError("Operator '" + str(curr_item) + "' requires " + str(num_args) + " arguments.")
+            if (num_args > 0):
+                frames.append(_FuncFrame(curr_item, num_args))
+                frames[-1].i -= 1
+                continue
+            r = _format_call(curr_item, [])
+
+        # Hand the string to the function waiting on it. Arguments are popped off
+        # the stack last argument 1st.
+        while (len(frames) > 0):
+            frame = frames[-1]
+            frame.args[frame.i] = r
+            frame.i -= 1
+            if (frame.i >= 0):
+                break
+            frames.pop()
+            r = _format_call(frame.item, frame.args)
+
+        # Done with the top stack item?
+        else:
+            return (r, end)
+
 ####################################################################
 def _get_str(stack):
     """
@@ -393,55 +1169,144 @@ def _get_str(stack):
     if (len(stack) == 0):
         raise ValueError("The stack is empty.")
 
-    # Get the current stack item. Make sure the original stack is not modified.
-    tmp_stack = list(stack)
-    curr_item = tmp_stack.pop()
-        
-    # If this is not a function there is nothing to do.
-    if (not curr_item.is_function()):
+    # Get the string for the top stack item.
+    r, end = _get_str_at(stack, len(stack))
+    return (r, stack[:end])
 
-        # Just convert the top stack item to a string and we are done.
-        r = str(curr_item)
-        return (r, tmp_stack)
+####################################################################
+def _get_dependencies(stack):
+    """
+    Find the cells read and written by a stack. The destination cell of a
+    2 argument FORMULA() call and the 1st argument of a SET.VALUE() call are
+    written, all other cell references are read.
 
-    # We have a function.
+    @param stack (list) The stack.
 
-    # Infix function? These always have 2 arguments.
-    if (curr_item.is_infix_function()):
+    @return (tuple) A 3 element tuple where the 1st element is a tuple of the (row, column)
+    indices of the cells read, the 2nd element is a tuple of the (row, column) indices
+    of the cells written and the 3rd element is a frozenset of the names of the cell
+    writing functions (FORMULA and SET.VALUE) called by the stack.
+    """
 
-        # Sanity check.
-        if (len(tmp_stack) < 2):
-            raise ValueError("Infix operator '" + str(curr_item) + "' requires 2 arguments.")
+    # Find the cell references and the cell writing function calls.
+    refs = []
+    write_funcs = set()
+    targets = set()
+    for i in range(0, len(stack)):
+        item = stack[i]
+        if (isinstance(item, (stack_cell_ref, stack_area))):
+            refs.append(i)
+            continue
+        name = getattr(item, "name", None)
+        if ((name not in ("FORMULA", "SET.VALUE")) or
+            (not hasattr(item, "is_function")) or (not item.is_function())):
+            continue
 
-        # Resolve the strings for the 2 function arguments.
-        arg2, tmp_stack = _get_str(tmp_stack)
-        arg1, tmp_stack = _get_str(tmp_stack)
+        # Track the stack position of the destination cell of the write.
+        write_funcs.add(name)
+        num_args = item.get_num_args()
+        if ((name == "FORMULA") and (num_args == 2)):
+            targets.add(i - 1)
+        elif ((name == "SET.VALUE") and (num_args > 0)):
+            try:
+                targets.add(_get_arg_ends(stack, i, num_args)[0] - 1)
+            except ValueError:
+                pass
+
+    # Sort the cell references into reads and writes.
+    reads = []
+    writes = []
+    for i in refs:
+        if (i in targets):
+            writes.append((stack[i].row, stack[i].column))
+        else:
+            reads.append((stack[i].row, stack[i].column))
+    return (tuple(reads), tuple(writes), frozenset(write_funcs))
 
-        # Return the string for the function now that we have the arguments.
-        r = str(arg1) + str(curr_item) + str(arg2)
-        return (r, tmp_stack)
+## Matches the start of a cell writing function call in the text of a formula.
+_write_call_pat = re.compile(r"(?<![\w\.])(FORMULA|SET\.VALUE)\(")
 
-    # Non-infix function. These have a variable # of arguments.
-    num_args = curr_item.get_num_args()
-    
-    # Sanity check.
-    if (len(tmp_stack) < num_args):
-        print(tmp_stack)
-        raise ValueError("Operator '" + str(curr_item) + "' requires " + str(num_args) + " arguments.")
-
-    # Resolve the strings for all the arguments.
-    first = True
-    args = ""
-    for i in range(0,num_args):
-        if (not first):
-            args = "," + args
-        first = False
-        arg, tmp_stack = _get_str(tmp_stack)
-        args = str(arg) + args
-
-    # Return the string for the function.
-    r = str(curr_item) + "(" + args + ")"
-    return (r, tmp_stack)
+## Matches a cell or area reference that is a whole function argument.
+_ref_arg_pat = re.compile(r"\$?[A-Za-z]{1,3}\$?\d+(:\$?[A-Za-z]{1,3}\$?\d+)?$")
+
+####################################################################
+def _get_arg_spans(code, start):
+    """
+    Find the arguments of a function call in the text of a formula.
+
+    @param code (str) The formula text, with the string literals blanked out.
+    @param start (int) The position right after the '(' of the call.
+
+    @return (list) The (start, end) positions of the arguments, with surrounding
+    spaces left out.
+    """
+    r = []
+    depth = 0
+    arg_start = start
+    for i in range(start, len(code)):
+        c = code[i]
+        if (c == "("):
+            depth += 1
+        elif ((c == ")") and (depth > 0)):
+            depth -= 1
+        elif ((c in ",)") and (depth == 0)):
+            arg = code[arg_start:i]
+            arg_end = arg_start + len(arg.rstrip())
+            r.append((arg_end - len(arg.strip()), arg_end))
+            if (c == ")"):
+                break
+            arg_start = i + 1
+    return r
+
+####################################################################
+def _get_formula_dependencies(formula):
+    """
+    Find the cells read and written by the text of an unparsed formula, without
+    parsing it. This gives the same cells as _get_dependencies() does for the
+    parsed formula. Formulas the MS XLM grammar cannot parse (like ones with areas)
+    still give the cells they reference. References to other sheets are left out.
+
+    @param formula (str) The raw A1 formula text (like '=SET.VALUE(A1,B2)').
+
+    @return (tuple) The same as _get_dependencies().
+    """
+
+    # Blank out the string literals so they are not taken as code.
+    pieces = str(formula).split('"')
+    for i in range(1, len(pieces), 2):
+        pieces[i] = " " * len(pieces[i])
+    code = '"'.join(pieces)
+
+    # Find the destination cells of the cell writing function calls, the 2nd
+    # argument of a 2 argument FORMULA() call and the 1st argument of a
+    # SET.VALUE() call.
+    write_funcs = set()
+    targets = set()
+    for m in _write_call_pat.finditer(code):
+        name = m.group(1)
+        write_funcs.add(name)
+        args = _get_arg_spans(code, m.end())
+        target = None
+        if ((name == "FORMULA") and (len(args) == 2)):
+            target = args[1]
+        elif ((name == "SET.VALUE") and (len(args) > 0)):
+            target = args[0]
+        if ((target is not None) and (_ref_arg_pat.match(code[target[0]:target[1]]) is not None)):
+            targets.add(target[0])
+
+    # Sort the cell references into reads and writes. Only the 1st cell of an
+    # area is used.
+    reads = []
+    writes = []
+    for m in XLM.utils.a1_ref_pat.finditer(code):
+        if ((m.start() > 0) and (code[m.start() - 1] in "!:")):
+            continue
+        cell_index = XLM.utils.parse_cell_index(m.group(2).upper() + m.group(4))
+        if (m.start() in targets):
+            writes.append(cell_index)
+        else:
+            reads.append(cell_index)
+    return (tuple(reads), tuple(writes), frozenset(write_funcs))
 
 ####################################################################
 class XLM_Object(object):
@@ -459,11 +1324,12 @@ class XLM_Object(object):
         @param col (int) The column of the cell containing the formula.
 
         @param stack (list) List of stack_item objects representing the XLM formula elements on
-        the evaluation stack.
+        the evaluation stack. Operations on literals in the stack are folded into
+        literals.
         """
         self.row = row
         self.col = col
-        self.stack = stack
+        self.stack = XLM.stack_optimizer.fold_constants(stack)
         self.update_cell_id((self.row, self.col))
         self.gloss = None
         self.value = None
@@ -486,16 +1352,57 @@ class XLM_Object(object):
                 continue
             
             # Fix relative cell references since we know the cell index now.
-            if ((isinstance(item, stack_cell_ref)) and (self.row > 0) and (self.col > 0)):
+            if ((isinstance(item, (stack_cell_ref, stack_area))) and (self.row > 0) and (self.col > 0)):
 
-                # Relative access?
-                if ((item.row < 1) or (item.is_relative)):
+                # Relative access? Only the relative parts of a mixed reference move.
+                if ((item.row < 1) or (item.row_relative)):
                     item.row = self.row + item.row
-                if ((item.column < 1) or (item.is_relative)):
+                if ((item.column < 1) or (item.col_relative)):
                     item.column = self.col + item.column
             new_stack.append(item)
         self.stack = new_stack
         
+    ####################################################################
+    def compiled(self):
+        """
+        Get the compiled version of the stack of this formula (see _compile_stack()).
+        The compiled stack is kept until the stack changes, so a cell emulated many
+        times is only compiled once. Its nesting depth is saved in the
+        _compiled_nesting field.
+
+        @return (function) The compiled stack, None if it cannot be compiled.
+        """
+        stack = self.stack
+        if (getattr(self, "_compiled_stack", None) is not stack):
+            self._compiled, self._compiled_nesting = _compile_stack(stack)
+            self._compiled_stack = stack
+        return self._compiled
+
+    ####################################################################
+    def dependencies(self):
+        """
+        Get the cells read and written by this formula (see _get_dependencies()).
+        They are found once per parsed (or relocated) stack.
+
+        @return (tuple) The cells read, the cells written and the names of the
+        cell writing functions called.
+        """
+        stack = self.stack
+        if (getattr(self, "_deps_stack", None) is not stack):
+            self._deps = _get_dependencies(stack)
+            self._deps_stack = stack
+        return self._deps
+
+    ####################################################################
+    def __getstate__(self):
+        """
+        Compiled stacks cannot be pickled, so leave them out.
+        """
+        state = dict(self.__dict__)
+        state.pop("_compiled", None)
+        state.pop("_compiled_stack", None)
+        return state
+
     ####################################################################
     def is_function(self):
         """
@@ -533,3 +1440,114 @@ class XLM_Object(object):
     ####################################################################
     def __repr__(self):
         return self.full_str()
+
+####################################################################
+class LazyXLM_Object(XLM_Object):
+    """
+    Class for representing a single MS XLM formula (1 cell) that is only parsed the
+    1st time its stack is used (when the cell is emulated or referenced). Cells
+    that are never reached are never parsed.
+    """
+
+    ####################################################################
+    def __init__(self, row, col, formula, shared=None):
+        """
+        Create a lazily parsed XLM formula object.
+
+        @param row (int) The row of the cell containing the formula.
+
+        @param col (int) The column of the cell containing the formula.
+
+        @param formula (str) The raw MS XLM formula (like '=CHAR(A1)').
+
+        @param shared (SharedFormula object) The shared formula the cell is part of
+        (see XLM.ms_stack_transformer.SharedFormula), None if the formula is not
+        shared.
+        """
+        self.row = row
+        self.col = col
+        self.cell_id = "$R" + str(self.row) + "$C" + str(self.col) + ":"
+        self.formula = formula
+        self.shared = shared
+        self._stack = None
+        self.gloss = None
+        self.value = None
+
+    ####################################################################
+    def is_parsed(self):
+        """
+        Check to see if the formula has been parsed yet.
+
+        @return (boolean) True if the formula has been parsed, False if not.
+        """
+        return (self._stack is not None)
+
+    ####################################################################
+    @property
+    def stack(self):
+        """
+        The stack_item objects of the formula. The formula is parsed the 1st time
+        this is used.
+        """
+        if (self._stack is None):
+            import XLM.ms_stack_transformer
+            if (self.shared is not None):
+                parsed = self.shared.parse_cell(self.formula, (self.row, self.col))
+            else:
+                parsed = XLM.ms_stack_transformer.parse_ms_xlm_cell(self.formula, (self.row, self.col))
+            if debug:
+                print("Lazily parsed " + self.cell_id + " " + str(self.formula))
+            self._stack = parsed.stack
+            self.formula = None
+            self.shared = None
+        return self._stack
+
+    ####################################################################
+    @stack.setter
+    def stack(self, new_stack):
+        self._stack = new_stack
+
+    ####################################################################
+    def dependencies(self):
+        """
+        Get the cells read and written by this formula. This does not parse the
+        formula. The cells are found from the raw formula text (see
+        _get_formula_dependencies()) until the formula has been parsed.
+
+        @return (tuple) The cells read, the cells written and the names of the
+        cell writing functions called.
+        """
+        if (self._stack is None):
+            if (getattr(self, "_formula_deps", None) is None):
+                self._formula_deps = _get_formula_dependencies(self.formula)
+            return self._formula_deps
+        return XLM_Object.dependencies(self)
+
+    ####################################################################
+    def full_str(self):
+        """
+        A human readable version of this XLM formula. This does not parse the
+        formula. The raw formula text (without the leading '=') is used until the
+        formula has been parsed.
+        """
+        if (self._stack is None):
+            formula = str(self.formula)
+            if (formula.startswith("=")):
+                formula = formula[1:]
+            return formula
+        return XLM_Object.full_str(self)
+
+    ####################################################################
+    def update_cell_id(self, new_id):
+        """
+        Change the row and column of the cell. An unparsed formula is parsed
+        relative to the new cell when it is used.
+
+        @param new_id (tuple) A 2 element tuple of the from (row, column).
+        """
+        if (self._stack is None):
+            self.row = new_id[0]
+            self.col = new_id[1]
+            self.cell_id = "$R" + str(self.row) + "$C" + str(self.col) + ":"
+            return
+        XLM_Object.update_cell_id(self, new_id)
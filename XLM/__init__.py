@@ -16,23 +16,35 @@ import excel
 import XLM.color_print
 import XLM.stack_transformer
 import XLM.XLM_Object
+import XLM.cell_graph
 import XLM.xlm_library
 import XLM.utils
 import XLM.ms_stack_transformer
+import XLM.formula_cache
 import XLM.excel2007
+import XLM.excel97
+import XLM.office_pool
 
 ## Check installation prerequisites.
 
-# Make sure olevba is installed.
+# olevba is only used as a fallback for Excel 97 files that cannot be read by the
+# native BIFF8 reader, so it is not required.
+have_olevba = True
 try:
     subprocess.check_output(["olevba", "-h"])
 except Exception as e:
-    color_print.output('r', "ERROR: It looks like olevba is not installed. " + str(e) + "\n")
-    sys.exit(101)
+    have_olevba = False
 
 # Debugging flag.
 debug = False
 
+## # of worker processes used to parse the formulas of Excel 2007+ macro sheets.
+parse_workers = 1
+
+## Follow the control flow of the macros from the Auto_Open cells rather than
+## emulating every XLM cell.
+follow_control_flow = False
+
 ####################################################################
 def set_debug(flag):
     """
@@ -43,62 +55,166 @@ def set_debug(flag):
     global debug
     debug = flag
     XLM.XLM_Object.debug = flag
+    XLM.cell_graph.debug = flag
     XLM.xlm_library.debug = flag
     XLM.ms_stack_transformer.debug = flag
     XLM.stack_transformer.debug = flag
     XLM.excel2007.debug = flag
+    XLM.excel97.debug = flag
+    XLM.office_pool.debug = flag
+
+####################################################################
+def set_parse_workers(num_workers):
+    """
+    Set the # of worker processes used to parse the formulas of large Excel
+    2007+ macro sheets.
+
+    @param num_workers (int) The # of worker processes. 1 means parse in this
+    process.
+    """
+    global parse_workers
+    parse_workers = max(int(num_workers), 1)
+
+####################################################################
+def set_follow_control_flow(flag):
+    """
+    Turn following the control flow of the XLM macros on or off. When on, execution
+    starts at the Auto_Open/Auto_Activate cells and only the executed cells are
+    emulated.
+
+    @param flag (boolean) True means follow the control flow, False means emulate
+    every XLM cell.
+    """
+    global follow_control_flow
+    follow_control_flow = flag
+    
+## Start of the olevba output section containing the XLM lines.
+_olevba_xlm_start = b"in file: xlm_macro - OLE stream: 'xlm_macro'"
+
+## An XLM line in the olevba output.
+_olevba_xlm_line_pat = re.compile(br"' \d\d\d\d {1,10}\d{1,6} [^\n]+")
+
+####################################################################
+class _OlevbaXLMLines(object):
+    """
+    Iterates over the XLM macro code lines in the output of olevba as olevba
+    produces them. The olevba output is never held in memory all at once.
+    """
+
+    ####################################################################
+    def __init__(self, maldoc):
+        """
+        Constructor.
+
+        @param maldoc (str) The fully qualified name of the Excel file to
+        analyze.
+        """
+        self.maldoc = maldoc
+
+        ## Set to False if running olevba failed or the file cannot be analyzed.
+        self.ok = True
+
+        ## The # of XLM lines generated.
+        self.num_lines = 0
+
+    ####################################################################
+    def __iter__(self):
+        """
+        Run olevba on the file and generate the XLM macro code lines.
+
+        @return (generator) Generates the XLM lines (str, without the trailing
+        newline).
+        """
+
+        # Run olevba on the given file.
+        FNULL = open(os.devnull, 'w')
+        try:
+            cmd = "timeout 30 olevba -c \"" + str(self.maldoc) + "\""
+            proc = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=FNULL)
+        except Exception as e:
+            color_print.output('r', "ERROR: Running olevba on " + str(self.maldoc) + " failed. " + str(e))
+            self.ok = False
+            FNULL.close()
+            return
+
+        # Read the output a line at a time.
+        in_xlm = False
+        skip_separator = False
+        try:
+            for line in proc.stdout:
+
+                # Not handling encrypted Excel files.
+                if (b"FILEPASS record: file is password protected" in line):
+                    color_print.output('y', "WARNING: " + str(self.maldoc) + " is password protected. Not emulating.")
+                    self.ok = False
+                    break
+
+                # Look for the start of the XLM section. It is followed by a
+                # "- - - ..." separator line.
+                if (not in_xlm):
+                    if (_olevba_xlm_start in line):
+                        in_xlm = True
+                        skip_separator = True
+                    continue
+                if skip_separator:
+                    skip_separator = False
+                    if (line.startswith(b"- - -")):
+                        continue
+
+                # Pull out the XLM line, if this is one.
+                m = _olevba_xlm_line_pat.search(line.rstrip(b"\r\n"))
+                if (m is None):
+                    continue
+                xlm_line = m.group(0)
+
+                # Convert characters so this can be parsed.
+                try:
+                    xlm_line = XLM.utils.to_str(xlm_line)
+                except UnicodeDecodeError:
+                    xlm_line = XLM.utils.strip_unprintable(xlm_line)
+                if debug:
+                    print(xlm_line)
+                self.num_lines += 1
+                yield xlm_line
+        finally:
+
+            # Make sure olevba is gone.
+            if (proc.poll() is None):
+                proc.kill()
+            proc.stdout.close()
+            proc.wait()
+            FNULL.close()
+
+        # Did olevba fail?
+        if (self.ok and (proc.returncode != 0)):
+            color_print.output('r', "ERROR: Running olevba on " + str(self.maldoc) + " failed. Exit status " +
+                               str(proc.returncode) + ".")
+            self.ok = False
     
 ####################################################################
 def _extract_xlm(maldoc):
     """
-    Run olevba on the given file and extract the XLM macro code lines.
+    Set up running olevba on the given file to extract the XLM macro code lines.
 
     @param maldoc (str) The fully qualified name of the Excel file to
     analyze.
 
-    @return (str) The XLM macro cells extracted from running olevba on the
-    given file. None will be returned on error.
+    @return (_OlevbaXLMLines object) An iterable generating the XLM macro lines
+    from the olevba output as they are produced. None will be returned on error.
     """
 
-    # Run olevba on the given file.
-    olevba_out = None
-    FNULL = open(os.devnull, 'w')
-    try:
-        cmd = "timeout 30 olevba -c \"" + str(maldoc) + "\""
-        olevba_out = subprocess.check_output(cmd, shell=True, stderr=FNULL)
-    except Exception as e:
-        color_print.output('r', "ERROR: Running olevba on " + str(maldoc) + " failed. " + str(e))
+    # olevba needs a file on disk.
+    if (maldoc is None):
+        color_print.output('r', "ERROR: olevba cannot be run on in memory data. Cannot extract XLM.")
         return None
 
-    # Not handling encrypted Excel files.
-    if (b"FILEPASS record: file is password protected" in olevba_out):
-        color_print.output('y', "WARNING: " + str(maldoc) + " is password protected. Not emulating.")
-        return None
-    
-    # Pull out the chunks containing the XLM lines.
-    chunk_pat = b"in file: xlm_macro \- OLE stream: 'xlm_macro'\n(?:\- ){39}\n(.+)"
-    chunks = re.findall(chunk_pat, olevba_out, re.DOTALL)
-    
-    # Pull out all the XLM lines from each chunk.
-    r = b""
-    xlm_pat = br"' \d\d\d\d {1,10}\d{1,6} [^\n]+\n"
-    for chunk in chunks:
-        for line in re.findall(xlm_pat, chunk):
-            r += line
-
-    # Convert characters so this can be parsed.
-    try:
-        r = XLM.utils.to_str(r)
-    except UnicodeDecodeError:
-        r = XLM.utils.strip_unprintable(r)
-
-    # Did we find XLM?
-    if (len(r.strip()) == 0):
-        color_print.output('y', "WARNING: No XLM found.")
+    # Is olevba available?
+    if (not have_olevba):
+        color_print.output('r', "ERROR: It looks like olevba is not installed. Cannot extract XLM from " + str(maldoc) + ".")
         return None
-            
-    # Done. Return XLM lines.
-    return r
+
+    # olevba is run as the lines are read.
+    return _OlevbaXLMLines(maldoc)
 
 ####################################################################
 def _guess_xlm_sheet(workbook):
@@ -134,7 +250,7 @@ def _guess_xlm_sheet(workbook):
     return xlm_sheet                
     
 ####################################################################
-def _merge_XLM_cells(maldoc, xlm_cells):
+def _merge_XLM_cells(maldoc, xlm_cells, xlm_sheet_name=None, workbook=None):
     """
     Merge the given XLM cells into the value cells read from the
     given Excel file.
@@ -145,6 +261,13 @@ def _merge_XLM_cells(maldoc, xlm_cells):
     @param xlm_cells (dict) A dict of XLM formula objects (XLM_Object objects) where
     dict[ROW][COL] gives the XLM cell at (ROW, COL).
 
+    @param xlm_sheet_name (str) The name of the sheet containing the XLM cells. If
+    this is None or the sheet is not found the XLM sheet will be guessed.
+
+    @param workbook (ExcelBook object) The value cells of the workbook, if they have
+    already been read. If this is None the value cells are read with office_dumper
+    using the shared LibreOffice converter pool.
+
     @return (tuple) A 3 element tuple where the 1st element is the updated ExcelWorkbook and 
     2nd element is a list of 2 element tuples containing the XLM cell indices on success and 
     the 3rd element is the XLM sheet object, (None, None, None) on error.
@@ -152,13 +275,15 @@ def _merge_XLM_cells(maldoc, xlm_cells):
 
     # Read in the Excel workbook data.
     color_print.output('g', "Merging XLM macro cells with data cells ...")
-    workbook = excel.read_excel_sheets(maldoc)
+    if ((workbook is None) and (maldoc is not None)):
+        workbook = XLM.office_pool.read_excel_sheets(maldoc)
     if (workbook is None):
-        color_print.output('r', "ERROR: Reading in Excel file " + str(maldoc) + " failed.")
+        color_print.output('r', "ERROR: Reading in Excel file " + XLM.utils.input_name(maldoc) + " failed.")
         return (None, None, None)
 
-    # Guess the name of the sheet containing the XLM macros.
-    xlm_sheet_name = _guess_xlm_sheet(workbook)
+    # Guess the name of the sheet containing the XLM macros if we don't know it.
+    if (xlm_sheet_name not in workbook.sheet_names()):
+        xlm_sheet_name = _guess_xlm_sheet(workbook)
     if debug:
         print("XLM Sheet:")
         print(xlm_sheet_name)
@@ -192,24 +317,27 @@ def _merge_XLM_cells(maldoc, xlm_cells):
     return (workbook, xlm_cell_indices, xlm_sheet)
 
 ####################################################################
-def _read_workbook_2007(maldoc):
+def _read_workbook_2007(maldoc, data=None):
     """
     Read in an Excel 2007+ workbook and the XLM macros in the workbook.
 
     @param maldoc (str) The fully qualified name of the Excel file to
     analyze.
 
+    @param data (bytes) The contents of the Excel file, if already read.
+
     @return (tuple) A 3 element tuple where the 1st element is the workbook object,
     the 2nd element is a list of XLM cell indices ((row, column) tuples) and the 3rd
     element is a sheet element for the sheet with XLM macros.
     """
 
-    # Read in the 2007+ cells.
+    # Read in the 2007+ formula and value cells.
     color_print.output('g', "Analyzing Excel 2007+ file ...")
-    workbook_info = XLM.excel2007.read_excel_2007_XLM(maldoc)    
+    workbook_data = XLM.excel2007.read_excel_2007_workbook(maldoc, data)
     color_print.output('g', "Extracted XLM from ZIP archive.")
-    if (workbook_info is None):
+    if (workbook_data is None):
         return (None, None, None)
+    workbook_info, value_workbook = workbook_data
     if (len(workbook_info) == 0):
         color_print.output('y', "WARNING: No XLM macros found.")
         return (None, None, None)
@@ -234,6 +362,7 @@ def _read_workbook_2007(maldoc):
 
     # Parse each formula and add it to a sheet object.
     xlm_cells = {}
+    formulas = []
     for cell_index in workbook_info[xlm_sheet_name].keys():
 
         # Value only cell?
@@ -251,10 +380,31 @@ def _read_workbook_2007(maldoc):
                 # Just save the value in the cell.
                 xlm_cells[row][col] = formula_val
             continue
+        formulas.append((cell_index, "=" + raw_formula))
             
-        # Parse the formula into an XLM object.
-        formula_str = b"=" + raw_formula
-        formula = XLM.ms_stack_transformer.parse_ms_xlm(formula_str)
+    # The cells of a shared formula range relocate the parsed formula of the 1st
+    # cell of the range rather than parsing their own moved formulas.
+    shared_cells = getattr(value_workbook, "shared_formula_cells", {}).get(xlm_sheet_name, {})
+    shared_formulas = {}
+    cell_shared_formulas = {}
+    for cell_index, (master_index, master_formula) in shared_cells.items():
+        if (master_index not in shared_formulas):
+            shared_formulas[master_index] = XLM.ms_stack_transformer.SharedFormula("=" + master_formula, master_index)
+        cell_shared_formulas[cell_index] = shared_formulas[master_index]
+    
+    # Parse the formulas into XLM objects. If we are parsing in parallel, every
+    # formula is parsed up front. Otherwise the formulas are only parsed when they
+    # are used.
+    if (parse_workers > 1):
+        parsed_formulas = XLM.ms_stack_transformer.parse_ms_xlm_cells([f for f in formulas if (f[0] not in cell_shared_formulas)],
+                                                                      parse_workers)
+        parsed_formulas.extend([(cell_index, cell_shared_formulas[cell_index].parse_cell(formula, cell_index))
+                                for cell_index, formula in formulas if (cell_index in cell_shared_formulas)])
+    else:
+        parsed_formulas = [(cell_index, XLM.XLM_Object.LazyXLM_Object(cell_index[0], cell_index[1], formula,
+                                                                     cell_shared_formulas.get(cell_index, None)))
+                           for cell_index, formula in formulas]
+    for cell_index, formula in parsed_formulas:
 
         # Set the value of the formula if we know it.
         formula_val = workbook_info[xlm_sheet_name][cell_index][1]
@@ -262,13 +412,14 @@ def _read_workbook_2007(maldoc):
             formula.value = formula_val
 
         # Save the XLM object.
-        formula.update_cell_id(cell_index)
-        xlm_cells[row][col] = formula
+        xlm_cells[cell_index[0]][cell_index[1]] = formula
     color_print.output('g', "Parsed MS XLM macros.")
+    if debug:
+        print(XLM.formula_cache.formula_cache)
         
     # Merge the XLM cells with the value cells into a single unified spereadsheet
     # object.
-    workbook, xlm_cell_indices, xlm_sheet = _merge_XLM_cells(maldoc, xlm_cells)
+    workbook, xlm_cell_indices, xlm_sheet = _merge_XLM_cells(maldoc, xlm_cells, xlm_sheet_name, value_workbook)
     if (workbook is None):
         color_print.output('r', "ERROR: Merging XLM cells failed. Emulation aborted.")
         return (None, None, None)
@@ -277,40 +428,78 @@ def _read_workbook_2007(maldoc):
     return (workbook, xlm_cell_indices, xlm_sheet)
     
 ####################################################################
-def _read_workbook_97(maldoc):
+def _read_workbook_97(maldoc, data=None):
     """
     Read in an Excel 97 workbook and the XLM macros in the workbook.
 
     @param maldoc (str) The fully qualified name of the Excel file to
     analyze.
 
+    @param data (bytes) The contents of the Excel file, if already read.
+
     @return (tuple) A 3 element tuple where the 1st element is the workbook object,
     the 2nd element is a list of XLM cell indices ((row, column) tuples) and the 3rd
     element is a sheet element for the sheet with XLM macros.
     """
 
-    # Run olevba on the file and extract the XLM macro code lines.
+    # Read the XLM macro cells and the data cells directly from the BIFF8 Workbook
+    # stream.
     color_print.output('g', "Analyzing Excel 97 file ...")
-    xlm_code = _extract_xlm(maldoc)
-    color_print.output('g', "Extracted XLM with olevba.")
-    if debug:
-        print("=========== START RAW XLM ==============")
-        print(xlm_code)
-        print("=========== DONE RAW XLM ==============")
-    if (xlm_code is None):
-        color_print.output('r', "ERROR: Unable to extract XLM. Emulation aborted.")
-        return (None, None, None)
+    r = XLM.excel97.read_excel_97_workbook(maldoc, data)
+    xlm_sheet_name = None
+    value_workbook = None
+    if (r is not None):
+        workbook_info, value_workbook = r
+        color_print.output('g', "Extracted XLM from Workbook stream.")
+        if (len(workbook_info) == 0):
+            color_print.output('y', "WARNING: No XLM macros found.")
+            return (None, None, None)
+
+        # Figure out which macro sheet probably has the XLM macros.
+        max_formulas = -1
+        for sheet in workbook_info.keys():
+            num_formulas = sum([len(cols) for cols in workbook_info[sheet].values()])
+            if (num_formulas > max_formulas):
+                max_formulas = num_formulas
+                xlm_sheet_name = sheet
+        xlm_cells = workbook_info[xlm_sheet_name]
+        if debug:
+            print("=========== START NATIVE XLM ==============")
+            for row in sorted(xlm_cells.keys()):
+                for col in sorted(xlm_cells[row].keys()):
+                    print(xlm_cells[row][col].raw_str())
+            print("=========== DONE NATIVE XLM ==============")
+
+    # Fall back to olevba for files the BIFF8 reader cannot handle.
+    else:
 
-    # Parse the XLM text and get XLM objects that can be emulated.
-    xlm_cells = XLM.stack_transformer.parse_olevba_xlm(xlm_code)
-    color_print.output('g', "Parsed olevba XLM macros.")
-    if (xlm_cells is None):
-        color_print.output('r', "ERROR: Parsing of XLM failed. Emulation aborted.")
-        return (None, None, None)
+        # Run olevba on the file and parse the XLM macro code lines as olevba
+        # generates them.
+        xlm_lines = _extract_xlm(maldoc)
+        if (xlm_lines is None):
+            color_print.output('r', "ERROR: Unable to extract XLM. Emulation aborted.")
+            return (None, None, None)
+        if debug:
+            print("=========== START RAW XLM ==============")
+        xlm_cells = XLM.stack_transformer.parse_olevba_xlm(xlm_lines)
+        if debug:
+            print("=========== DONE RAW XLM ==============")
+        if (not xlm_lines.ok):
+            color_print.output('r', "ERROR: Unable to extract XLM. Emulation aborted.")
+            return (None, None, None)
+        if (xlm_lines.num_lines == 0):
+            color_print.output('y', "WARNING: No XLM found.")
+            color_print.output('r', "ERROR: Unable to extract XLM. Emulation aborted.")
+            return (None, None, None)
+        color_print.output('g', "Extracted XLM with olevba.")
+        color_print.output('g', "Parsed olevba XLM macros.")
+        if (xlm_cells is None):
+            color_print.output('r', "ERROR: Parsing of XLM failed. Emulation aborted.")
+            return (None, None, None)
 
     # Merge the XLM cells with the value cells into a single unified spereadsheet
     # object.
-    workbook, xlm_cell_indices, xlm_sheet = _merge_XLM_cells(maldoc, xlm_cells)
+    workbook, xlm_cell_indices, xlm_sheet = _merge_XLM_cells(maldoc, xlm_cells, xlm_sheet_name, value_workbook)
     if (workbook is None):
         color_print.output('r', "ERROR: Merging XLM cells failed. Emulation aborted.")
         return (None, None, None)
@@ -319,43 +508,140 @@ def _read_workbook_97(maldoc):
     return (workbook, xlm_cell_indices, xlm_sheet)
     
 ####################################################################
-def emulate(maldoc):
+def has_XLM(maldoc, file_type=None, data=None):
     """
-    Emulate the behavior of a given Excel file containing XLM macros.
+    Cheaply check to see if an Excel file may contain XLM macros. This only
+    looks for macro sheets in the workbook structure, so it reads just a few
+    kilobytes of the file.
 
     @param maldoc (str) The fully qualified name of the Excel file to
     analyze.
 
+    @param file_type (str) The type of the Excel file (XLM.utils.EXCEL_97 or
+    XLM.utils.EXCEL_2007) if already known. This is computed if not given.
+
+    @param data (bytes) The contents of the Excel file, if already read.
+
+    @return (boolean) False if the file definitely has no XLM macros, True if
+    it may have XLM macros.
+    """
+    if (file_type is None):
+        file_type = XLM.utils.get_excel_file_type(maldoc, data)
+    if (file_type == XLM.utils.EXCEL_97):
+        return XLM.excel97.has_excel_97_XLM(maldoc, data)
+    if (file_type == XLM.utils.EXCEL_2007):
+        return XLM.excel2007.has_excel_2007_XLM(maldoc, data)
+    return False
+
+####################################################################
+def emulate(maldoc, file_type=None, data=None):
+    """
+    Emulate the behavior of a given Excel file containing XLM macros.
+
+    @param maldoc (str) The fully qualified name of the Excel file to
+    analyze. This is None if only the file contents are given.
+
+    @param file_type (str) The type of the Excel file (XLM.utils.EXCEL_97 or
+    XLM.utils.EXCEL_2007) if already known. This is computed if not given.
+
+    @param data (bytes) The contents of the Excel file, if already read. The
+    file is memory mapped (once) if this is None and the mapping is closed when
+    the emulation is done. Mappings passed in are left open for the caller to close.
+
     @return (tuple) 1st element is a list of 3 element tuples containing the actions performed
     by the sheet, 2nd element is the human readable XLM code.
     """
 
+    # Memory map the file once. All of the readers work on the same mapping, so
+    # only the parts of the file they look at are read from disk.
+    if (data is None):
+        try:
+            data = XLM.utils.map_file(maldoc)
+        except (IOError, ValueError) as e:
+            color_print.output('r', "ERROR: Cannot read " + str(maldoc) + ". " + str(e))
+            return ([], "")
+        try:
+            return _emulate_data(maldoc, file_type, data)
+        finally:
+            XLM.utils.close_mapped_file(data)
+    return _emulate_data(maldoc, file_type, data)
+
+####################################################################
+def _emulate_data(maldoc, file_type, data):
+    """
+    Emulate the behavior of a given Excel file containing XLM macros that has
+    been read or memory mapped.
+
+    @param maldoc (str) The fully qualified name of the Excel file to
+    analyze. This is None if only the file contents are given.
+
+    @param file_type (str) The type of the Excel file (XLM.utils.EXCEL_97 or
+    XLM.utils.EXCEL_2007) if already known. This is computed if not given.
+
+    @param data (bytes) The contents of the Excel file.
+
+    @return (tuple) 1st element is a list of 3 element tuples containing the actions performed
+    by the sheet, 2nd element is the human readable XLM code.
+    """
+    
+    # Figure out the type of the file if we don't already know it.
+    if (file_type is None):
+        file_type = XLM.utils.get_excel_file_type(maldoc, data)
+
+    # Skip the full analysis of files with no macro sheets.
+    if ((file_type is not None) and (not has_XLM(maldoc, file_type, data))):
+        color_print.output('y', "WARNING: No XLM macros found.")
+        return ([], "")
+    
     # Excel 97 file?
-    if (XLM.utils.is_excel_file_97(maldoc)):
-        workbook, xlm_cell_indices, xlm_sheet = _read_workbook_97(maldoc)
+    if (file_type == XLM.utils.EXCEL_97):
+        workbook, xlm_cell_indices, xlm_sheet = _read_workbook_97(maldoc, data)
         if (workbook is None):
             color_print.output('r', "ERROR: Reading Excel 97 file failed. Emulation aborted.")
             return ([], "")
 
     # Excel 2007+ file?
-    elif (XLM.utils.is_excel_file_2007(maldoc)):
-        workbook, xlm_cell_indices, xlm_sheet = _read_workbook_2007(maldoc)
+    elif (file_type == XLM.utils.EXCEL_2007):
+        workbook, xlm_cell_indices, xlm_sheet = _read_workbook_2007(maldoc, data)
         if (workbook is None):
             color_print.output('r', "ERROR: Reading Excel 2007 file failed. Emulation aborted.")
             return ([], "")
 
     else:
-        color_print.output('y', "WARNING: " + maldoc + " is not an Excel file. Emulation aborted.")
+        color_print.output('y', "WARNING: " + XLM.utils.input_name(maldoc) + " is not an Excel file. Emulation aborted.")
         return ([], "")
         
     # Save the indices of the XLM cells in the workbook. We do this here directly so that
     # the base definition of the ExcelWorkbook class does not need to be changed.
     xlm_sheet.xlm_cell_indices = xlm_cell_indices
+    xlm_sheet.defined_names = getattr(workbook, "defined_names", [])
     
     # Emulate the XLM.
     color_print.output('g', "Starting XLM emulation ...")
-    r = XLM_Object.eval(xlm_sheet)
+    if (follow_control_flow):
+        r = XLM_Object.eval_control_flow(xlm_sheet)
+    else:
+        r = XLM_Object.eval(xlm_sheet)
     color_print.output('g', "Finished XLM emulation.")
+    if debug:
+        print(XLM.formula_cache.formula_cache)
     
     # Done.
     return r
+
+####################################################################
+def emulate_bytes(data, file_type=None):
+    """
+    Emulate the behavior of an Excel file containing XLM macros that has been
+    read into memory. Nothing is written to disk.
+
+    @param data (bytes) The contents of the Excel file. This can also be a
+    bytearray or memoryview.
+
+    @param file_type (str) The type of the Excel file (XLM.utils.EXCEL_97 or
+    XLM.utils.EXCEL_2007) if already known. This is computed if not given.
+
+    @return (tuple) 1st element is a list of 3 element tuples containing the actions performed
+    by the sheet, 2nd element is the human readable XLM code.
+    """
+    return emulate(None, file_type, data)
@@ -0,0 +1,275 @@
+"""@package cell_graph
+
+Dependency graph of the XLM cells of a sheet. The graph is built from the cell
+references in the XLM formulas and is used to emulate the cells in dependency
+order (cells that write a cell with SET.VALUE() or FORMULA() before the cells
+reading it, referenced cells before the cells referencing them). The references
+of cells that have not been parsed yet are found from their formula text, so
+building the graph does not parse them.
+
+When emulation writes a cell the cached values of the XLM cells depending on the
+cell are thrown away and just those cells are emulated again.
+"""
+
+from __future__ import print_function
+import heapq
+
+import XLM.color_print
+
+debug = False
+
+## Max # of times a single XLM cell is emulated. Used to stop cells that keep
+## changing the cells they depend on from being emulated forever.
+MAX_CELL_EVALS = 10
+
+####################################################################
+def _eval_phase(write_funcs):
+    """
+    Cells that are not ordered by their dependencies are emulated SET.VALUE() cells
+    1st, then FORMULA() cells, then all the other cells.
+
+    @param write_funcs (frozenset) The names of the cell writing functions called by a cell.
+
+    @return (int) The phase in which to emulate the cell.
+    """
+    if ("SET.VALUE" in write_funcs):
+        return 0
+    if ("FORMULA" in write_funcs):
+        return 1
+    return 2
+
+####################################################################
+class CellGraph(object):
+    """
+    Dependency graph and work queue of the XLM cells of a sheet.
+    """
+
+    ####################################################################
+    def __init__(self, sheet):
+        """
+        Build the dependency graph of the XLM cells of a sheet and queue all the
+        XLM cells for emulation in dependency order.
+
+        @param sheet (ExcelSheet object) The sheet with the XLM cells (the cells
+        listed in the xlm_cell_indices field of the sheet).
+        """
+        self.sheet = sheet
+
+        # Map from cell indices to the XLM formula (XLM_Object) of the cell and to
+        # the dependencies (see XLM_Object.dependencies()) the cell was added with.
+        # Unparsed cells give dependencies found from their formula text, so the
+        # dependencies are saved to remove the same edges after they are parsed.
+        self.formulas = {}
+        self.dependencies = {}
+
+        # Map from cell indices to the cell indices of the XLM cells reading/writing
+        # the cell.
+        self.readers = {}
+        self.writers = {}
+
+        # The queue of XLM cells to emulate. Entries are (rank, cell index).
+        self.ranks = {}
+        self.queue = []
+        self.queued = set()
+        self.num_evals = {}
+        self._num_sub_ranks = 0
+
+        # The XLM cell currently being emulated.
+        self.current = None
+
+        # Add the XLM cells.
+        for cell_index in sheet.xlm_cell_indices:
+            xlm_cell = sheet.cells.get(cell_index, None)
+            if (hasattr(xlm_cell, "dependencies") and (cell_index not in self.formulas)):
+                self._add_formula(cell_index, xlm_cell)
+
+        # Queue them in dependency order.
+        order = self._topological_order()
+        for i in range(0, len(order)):
+            self.ranks[order[i]] = (i, 0)
+            self._enqueue(order[i])
+
+    ####################################################################
+    def _add_formula(self, cell_index, xlm_cell):
+        """
+        Add the edges of an XLM cell to the graph.
+
+        @param cell_index (tuple) The (row, column) of the cell.
+        @param xlm_cell (XLM_Object object) The formula of the cell.
+        """
+        self.formulas[cell_index] = xlm_cell
+        self.dependencies[cell_index] = xlm_cell.dependencies()
+        reads, writes, _ = self.dependencies[cell_index]
+        for read_index in reads:
+            self.readers.setdefault(read_index, set()).add(cell_index)
+        for write_index in writes:
+            self.writers.setdefault(write_index, set()).add(cell_index)
+
+    ####################################################################
+    def _remove_formula(self, cell_index):
+        """
+        Remove the edges of an XLM cell from the graph.
+
+        @param cell_index (tuple) The (row, column) of the cell.
+        """
+        del self.formulas[cell_index]
+        reads, writes, _ = self.dependencies.pop(cell_index)
+        for read_index in reads:
+            self.readers.get(read_index, set()).discard(cell_index)
+        for write_index in writes:
+            self.writers.get(write_index, set()).discard(cell_index)
+
+    ####################################################################
+    def _topological_order(self):
+        """
+        Order the XLM cells so that each cell comes after the cells it depends on.
+        Cells that are not ordered by their dependencies are put in phase order (see
+        _eval_phase()) and then cell order. Dependency cycles are broken by taking the
+        1st remaining cell in this order.
+
+        @return (list) The cell indices of the XLM cells in emulation order.
+        """
+
+        # A cell depends on the cells it reads, the cells writing the cells it reads
+        # and the cells writing the cell itself.
+        succs = {}
+        num_preds = {}
+        for cell_index in self.formulas:
+            num_preds[cell_index] = 0
+        for cell_index in self.formulas:
+            reads, _, _ = self.dependencies[cell_index]
+            preds = set(self.writers.get(cell_index, ()))
+            for read_index in reads:
+                if (read_index in self.formulas):
+                    preds.add(read_index)
+                preds.update(self.writers.get(read_index, ()))
+            preds.discard(cell_index)
+            for pred in preds:
+                succs.setdefault(pred, []).append(cell_index)
+            num_preds[cell_index] = len(preds)
+
+        # Repeatedly take the 1st cell (in phase order) with no unhandled dependencies.
+        keys = {}
+        for cell_index in self.formulas:
+            _, _, write_funcs = self.dependencies[cell_index]
+            keys[cell_index] = (_eval_phase(write_funcs), cell_index)
+        ready = [keys[cell_index] for cell_index in self.formulas if (num_preds[cell_index] == 0)]
+        heapq.heapify(ready)
+        remaining = sorted(keys.values())
+        next_remaining = 0
+        done = set()
+        r = []
+        while (len(r) < len(keys)):
+
+            # Break a dependency cycle if nothing is ready.
+            if (len(ready) == 0):
+                while (remaining[next_remaining][1] in done):
+                    next_remaining += 1
+                key = remaining[next_remaining]
+                if debug:
+                    print("Breaking dependency cycle at " + str(key[1]))
+            else:
+                key = heapq.heappop(ready)
+                if (key[1] in done):
+                    continue
+
+            # Emulate this cell next.
+            cell_index = key[1]
+            done.add(cell_index)
+            r.append(cell_index)
+            for succ in succs.get(cell_index, ()):
+                num_preds[succ] -= 1
+                if ((num_preds[succ] == 0) and (succ not in done)):
+                    heapq.heappush(ready, keys[succ])
+        return r
+
+    ####################################################################
+    def _enqueue(self, cell_index):
+        """
+        Queue an XLM cell for emulation.
+
+        @param cell_index (tuple) The (row, column) of the cell.
+        """
+        if (cell_index in self.queued):
+            return
+        self.queued.add(cell_index)
+        heapq.heappush(self.queue, (self.ranks[cell_index], cell_index))
+
+    ####################################################################
+    def next_cell(self):
+        """
+        Get the next XLM cell to emulate. Cells are handed out in dependency order.
+        Cells whose dependencies were changed after they were emulated are handed
+        out again.
+
+        @return (tuple) The (row, column) of the next cell to emulate, None if there
+        are no more cells to emulate.
+        """
+        while (len(self.queue) > 0):
+            _, cell_index = heapq.heappop(self.queue)
+            self.queued.discard(cell_index)
+            if (cell_index not in self.formulas):
+                continue
+
+            # Stop cells that keep changing their own dependencies.
+            num_evals = self.num_evals.get(cell_index, 0) + 1
+            self.num_evals[cell_index] = num_evals
+            if (num_evals > MAX_CELL_EVALS):
+                if (num_evals == MAX_CELL_EVALS + 1):
+                    XLM.color_print.output('y', "WARNING: Cell " + str(cell_index) + " emulated " + str(MAX_CELL_EVALS) + " times. Not emulating it again.")
+                continue
+            return cell_index
+        return None
+
+    ####################################################################
+    def cell_changed(self, cell_index, old_value):
+        """
+        Update the graph after emulation wrote a cell. The cached values of the XLM
+        cells that (directly or indirectly) read the cell are thrown away and these
+        cells are queued to be emulated again. An XLM formula written to the cell is
+        queued to be emulated.
+
+        @param cell_index (tuple) The (row, column) of the written cell.
+        @param old_value (any) The value of the cell before it was written.
+        """
+
+        # Nothing to do if the cell did not change.
+        new_value = self.sheet.cells.get(cell_index, None)
+        if ((new_value is old_value) or
+            ((not hasattr(new_value, "dependencies")) and (not hasattr(old_value, "dependencies")) and
+             (str(new_value) == str(old_value)))):
+            return
+
+        # Track a new XLM formula for the cell. It is emulated right after the
+        # current cell.
+        if (cell_index in self.formulas):
+            self._remove_formula(cell_index)
+        if (hasattr(new_value, "dependencies")):
+            self._add_formula(cell_index, new_value)
+            if (cell_index not in self.ranks):
+                base = self.ranks.get(self.current, (-1, 0))[0]
+                self._num_sub_ranks += 1
+                self.ranks[cell_index] = (base, self._num_sub_ranks)
+            self._enqueue(cell_index)
+        if debug:
+            print("Cell " + str(cell_index) + " changed from '" + str(old_value) + "' to '" + str(new_value) + "'")
+
+        # Throw away the values of the cells depending on the changed cell. The cell
+        # being emulated is not emulated again because of its own writes.
+        todo = [cell_index]
+        seen = set(todo)
+        while (len(todo) > 0):
+            for reader in self.readers.get(todo.pop(), ()):
+                if ((reader in seen) or (reader not in self.formulas)):
+                    continue
+                seen.add(reader)
+                todo.append(reader)
+                if (reader == self.current):
+                    continue
+                xlm_cell = self.formulas[reader]
+                xlm_cell.value = None
+                if (self.sheet.cells.get(reader, None) is not xlm_cell):
+                    self.sheet.cells[reader] = xlm_cell
+                if debug:
+                    print("Cell " + str(reader) + " is dirty.")
+                self._enqueue(reader)
@@ -0,0 +1,313 @@
+"""@package compound_file
+
+Minimal reader for OLE2 Compound File Binary (CFB) files. Only what is
+needed to pull streams like Workbook out of Excel 97 files is supported.
+
+The file data can be a memory mapped file (see XLM.utils.map_file()). Streams
+stored in contiguous sectors are returned as zero-copy memoryview slices of
+the file data, so only the parts of the file that are actually looked at are
+paged in.
+"""
+
+import struct
+
+import XLM.utils
+
+# OLE2 file signature.
+CFB_MAGIC = b"\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1"
+
+# Special sector IDs.
+MAXREGSECT = 0xFFFFFFFA
+DIFSECT = 0xFFFFFFFC
+FATSECT = 0xFFFFFFFD
+ENDOFCHAIN = 0xFFFFFFFE
+FREESECT = 0xFFFFFFFF
+
+# Directory entry types.
+STGTY_STORAGE = 1
+STGTY_STREAM = 2
+STGTY_ROOT = 5
+
+####################################################################
+def is_cfb_data(data):
+    """
+    Check to see if the given data starts with the OLE2 magic bytes.
+
+    @param data (bytes) The data to check.
+
+    @return (boolean) True if this looks like a CFB file, False if not.
+    """
+    return (bytes(data[:len(CFB_MAGIC)]) == CFB_MAGIC)
+
+####################################################################
+class CompoundFile(object):
+    """
+    Class for reading streams from an OLE2 Compound File Binary file.
+    """
+
+    ####################################################################
+    def __init__(self, data):
+        """
+        Parse the header, FAT, mini FAT and directory of a CFB file.
+
+        @param data (bytes) The contents of the CFB file.
+
+        @throws ValueError Thrown if the data is not a valid CFB file.
+        """
+
+        # Sanity check.
+        if (not is_cfb_data(data)):
+            raise ValueError("Data is not an OLE2 compound file.")
+        if (len(data) < 512):
+            raise ValueError("OLE2 compound file is truncated.")
+        self.data = data
+        self.view = memoryview(data)
+
+        # Read the header fields we care about.
+        self.sector_shift = struct.unpack_from("<H", data, 0x1E)[0]
+        self.mini_sector_shift = struct.unpack_from("<H", data, 0x20)[0]
+        if ((self.sector_shift not in (9, 12)) or (self.mini_sector_shift != 6)):
+            raise ValueError("Unsupported OLE2 sector size.")
+        self.sector_size = 1 << self.sector_shift
+        self.mini_sector_size = 1 << self.mini_sector_shift
+        num_fat_sectors = struct.unpack_from("<I", data, 0x2C)[0]
+        first_dir_sector = struct.unpack_from("<I", data, 0x30)[0]
+        self.mini_stream_cutoff = struct.unpack_from("<I", data, 0x38)[0]
+        first_mini_fat_sector = struct.unpack_from("<I", data, 0x3C)[0]
+        first_difat_sector = struct.unpack_from("<I", data, 0x44)[0]
+        num_difat_sectors = struct.unpack_from("<I", data, 0x48)[0]
+
+        # Maximum # of sectors in the file. Used to break sector chain loops.
+        self.max_sectors = (len(data) >> self.sector_shift) + 1
+
+        # Collect the FAT sector IDs from the header DIFAT and any DIFAT sectors.
+        # The FAT itself is read lazily, one entry at a time, so that only the
+        # sectors of the streams actually read are ever touched.
+        fat_sectors = list(struct.unpack_from("<109I", data, 0x4C))
+        difat_sector = first_difat_sector
+        self.ids_per_sector = self.sector_size // 4
+        seen = set()
+        for _ in range(0, num_difat_sectors):
+            if ((difat_sector > MAXREGSECT) or (difat_sector in seen)):
+                break
+            seen.add(difat_sector)
+            entries = struct.unpack_from("<" + str(self.ids_per_sector) + "I", self._sector(difat_sector))
+            fat_sectors.extend(entries[:-1])
+            difat_sector = entries[-1]
+        self.fat_sectors = [s for s in fat_sectors if (s <= MAXREGSECT)][:num_fat_sectors]
+
+        # Read in the directory entries.
+        self.entries = []
+        dir_data = self._read_chain(first_dir_sector)
+        for pos in range(0, len(dir_data) - 127, 128):
+            self.entries.append(self._parse_dir_entry(dir_data[pos:pos + 128]))
+
+        # The mini FAT and mini stream are read the 1st time a small stream is read.
+        self.first_mini_fat_sector = first_mini_fat_sector
+        self.mini_fat = None
+        self.mini_stream = None
+
+    ####################################################################
+    def _next_sector(self, sector_id):
+        """
+        Look up the next sector in a sector chain in the FAT.
+
+        @param sector_id (int) The ID of the current sector.
+
+        @return (int) The ID of the next sector, ENDOFCHAIN if the FAT does not
+        cover the current sector.
+        """
+        fat_index = sector_id // self.ids_per_sector
+        if (fat_index >= len(self.fat_sectors)):
+            return ENDOFCHAIN
+        pos = ((self.fat_sectors[fat_index] + 1) << self.sector_shift) + ((sector_id % self.ids_per_sector) * 4)
+        if ((pos + 4) > len(self.data)):
+            return ENDOFCHAIN
+        return struct.unpack_from("<I", self.data, pos)[0]
+
+    ####################################################################
+    def _load_mini_stream(self):
+        """
+        Read in the mini FAT and the mini stream.
+        """
+        self.mini_fat = []
+        mini_fat_data = self._read_chain(self.first_mini_fat_sector)
+        if (len(mini_fat_data) > 0):
+            self.mini_fat = list(struct.unpack_from("<" + str(len(mini_fat_data) // 4) + "I", mini_fat_data))
+
+        # The root entry tracks the mini stream.
+        if ((len(self.entries) > 0) and (self.entries[0] is not None) and (self.entries[0][1] == STGTY_ROOT)):
+            root = self.entries[0]
+            self.mini_stream = self._read_chain(root[2], root[3])
+
+    ####################################################################
+    def _sector(self, sector_id):
+        """
+        Get the raw contents of a regular sector.
+
+        @param sector_id (int) The ID of the sector.
+
+        @return (bytes) The sector contents.
+        """
+        start = (sector_id + 1) << self.sector_shift
+        if (start >= len(self.data)):
+            raise ValueError("OLE2 sector " + str(sector_id) + " is past the end of the file.")
+        return self.data[start:start + self.sector_size]
+
+    ####################################################################
+    def _read_chain(self, start_sector, size=None):
+        """
+        Read the data in a regular FAT sector chain.
+
+        @param start_sector (int) The 1st sector in the chain.
+        @param size (int) The number of bytes to read. The whole chain is read if
+        this is None.
+
+        @return (bytes) The data in the sector chain. This is a memoryview of the
+        file data if the chain is stored in contiguous sectors.
+        """
+
+        # Walk the chain.
+        sectors = []
+        sector = start_sector
+        max_count = self.max_sectors
+        if (size is not None):
+            max_count = min(max_count, (size >> self.sector_shift) + 1)
+        while ((sector <= MAXREGSECT) and (len(sectors) < max_count)):
+            sectors.append(sector)
+            sector = self._next_sector(sector)
+        if (len(sectors) == 0):
+            return b""
+
+        # Contiguous sectors can be sliced directly out of the file data.
+        first = sectors[0]
+        if all([(sectors[i] == first + i) for i in range(1, len(sectors))]):
+            start = (first + 1) << self.sector_shift
+            end = min(start + (len(sectors) << self.sector_shift), len(self.data))
+            if (start >= len(self.data)):
+                raise ValueError("OLE2 sector " + str(first) + " is past the end of the file.")
+            if (size is not None):
+                end = min(end, start + size)
+            return self.view[start:end]
+
+        # Fragmented chain. Copy out the sectors.
+        r = b"".join([bytes(self._sector(s)) for s in sectors])
+        if (size is not None):
+            r = r[:size]
+        return r
+
+    ####################################################################
+    def _read_mini_chain(self, start_sector, size):
+        """
+        Read the data in a mini FAT sector chain.
+
+        @param start_sector (int) The 1st mini sector in the chain.
+        @param size (int) The number of bytes to read.
+
+        @return (bytes) The data in the mini sector chain.
+        """
+        if (self.mini_fat is None):
+            self._load_mini_stream()
+        if (self.mini_stream is None):
+            raise ValueError("OLE2 file has no mini stream.")
+        chunks = []
+        sector = start_sector
+        count = 0
+        max_count = len(self.mini_fat) + 1
+        while ((sector <= MAXREGSECT) and (count < max_count)):
+            start = sector << self.mini_sector_shift
+            chunks.append(self.mini_stream[start:start + self.mini_sector_size])
+            count += 1
+            if (sector >= len(self.mini_fat)):
+                break
+            sector = self.mini_fat[sector]
+        return b"".join(chunks)[:size]
+
+    ####################################################################
+    def _parse_dir_entry(self, entry):
+        """
+        Parse a single 128 byte directory entry.
+
+        @param entry (bytes) The raw directory entry.
+
+        @return (tuple) A 4 element tuple of the form (name, type, start sector, size),
+        None if the directory entry is unused.
+        """
+        name_len = struct.unpack_from("<H", entry, 0x40)[0]
+        entry_type = struct.unpack_from("<B", entry, 0x42)[0]
+        if ((entry_type == 0) or (name_len < 2) or (name_len > 64)):
+            return None
+        name = bytes(entry[:name_len - 2]).decode("utf-16-le", "replace")
+        start_sector, size = struct.unpack_from("<II", entry, 0x74)
+        return (name, entry_type, start_sector, size)
+
+    ####################################################################
+    def stream_names(self):
+        """
+        Get the names of all the streams in the file. Storage paths are not
+        tracked, so only the base stream names are returned.
+
+        @return (list) The stream names (str).
+        """
+        return [e[0] for e in self.entries if ((e is not None) and (e[1] == STGTY_STREAM))]
+
+    ####################################################################
+    def has_stream(self, name):
+        """
+        Check to see if the file contains a stream with the given name.
+
+        @param name (str) The stream name (case insensitive).
+
+        @return (boolean) True if the stream exists, False if not.
+        """
+        return (self._find_entry(name) is not None)
+
+    ####################################################################
+    def _find_entry(self, name):
+        """
+        Find the directory entry for a stream.
+
+        @param name (str) The stream name (case insensitive).
+
+        @return (tuple) The directory entry, None if not found.
+        """
+        name = XLM.utils.to_str(name).lower()
+        for entry in self.entries:
+            if ((entry is not None) and (entry[1] == STGTY_STREAM) and (entry[0].lower() == name)):
+                return entry
+        return None
+
+    ####################################################################
+    def read_stream(self, name, max_size=None):
+        """
+        Read the contents of a stream.
+
+        @param name (str) The stream name (case insensitive).
+        @param max_size (int) If given, only read (at most) this many bytes from
+        the start of the stream.
+
+        @return (bytes) The stream contents, None if the stream does not exist.
+        """
+        entry = self._find_entry(name)
+        if (entry is None):
+            return None
+        _, _, start_sector, size = entry
+        if (size < self.mini_stream_cutoff):
+            return self._read_mini_chain(start_sector, size)[:max_size]
+        if (max_size is not None):
+            size = min(size, max_size)
+        return self._read_chain(start_sector, size)
+
+    ####################################################################
+    def stream_size(self, name):
+        """
+        Get the size of a stream.
+
+        @param name (str) The stream name (case insensitive).
+
+        @return (int) The stream size in bytes, None if the stream does not exist.
+        """
+        entry = self._find_entry(name)
+        if (entry is None):
+            return None
+        return entry[3]
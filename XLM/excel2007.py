@@ -3,27 +3,40 @@
 Functions for reading XLM macros from Excel 2007+ files.
 """
 
+from __future__ import print_function
 import zipfile
-import re
+import functools
 import random
 import os
 import sys
+import xml.etree.ElementTree as ET
+
+# https://github.com/kirk-sayre-work/office_dumper.git
+import excel
 
 import XLM.utils
+import XLM.color_print
 
 debug = False
 
 ####################################################################
-def unzip_file(fname):
+def unzip_file(fname, data=None):
     """
     Unzip a zipped file into memory.
 
     @param fname (str) The name of the file to unzip.
 
+    @param data (bytes) The contents of the file, if already read. The file is
+    read from disk if this is None.
+
     @return (ZipFile object) A zipfile.ZipFile object with the unzipped file
     contents.
     """
 
+    # Work directly on the file contents if we have them.
+    if (data is not None):
+        fname = XLM.utils.BufferFile(data)
+
     # Is this a ZIP file?
     if (not zipfile.is_zipfile(fname)):
         return None
@@ -35,170 +48,549 @@ def unzip_file(fname):
     return unzipped_data
 
 ####################################################################
-def _read_excel_2007_sheet(zip_subfile, unzipped_data):
+def has_excel_2007_XLM(fname, data=None):
+    """
+    Cheaply check to see if an Excel 2007+ file may contain XLM macros. Only
+    the ZIP central directory and (if needed) the workbook relationships part
+    are read.
+
+    @param fname (str) The name of the Excel 2007+ file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    read from disk if this is None.
+
+    @return (boolean) False if the file definitely has no macro sheets, True
+    if it has macro sheets or the file could not be checked.
+    """
+    if (data is not None):
+        fname = XLM.utils.BufferFile(data)
+    try:
+        unzipped_data = zipfile.ZipFile(fname, 'r')
+    except (zipfile.BadZipfile, IOError, RuntimeError):
+        return True
+    try:
+
+        # Macro sheet parts?
+        for name in unzipped_data.namelist():
+            if (_is_macro_sheet_file(name.lower())):
+                return True
+
+        # Macro sheets stored under other part names still need a macro sheet
+        # relationship from the workbook.
+        rels_name = "xl/_rels/workbook.xml.rels"
+        if (rels_name not in unzipped_data.namelist()):
+            return False
+        rels = unzipped_data.read(rels_name)
+        return (b"xlmacrosheet" in rels.lower()) or (b"xlintlmacrosheet" in rels.lower())
+    except (zipfile.BadZipfile, KeyError, IOError, RuntimeError):
+        return True
+    finally:
+        unzipped_data.close()
+
+####################################################################
+def _local_tag(tag):
+    """
+    Strip the namespace from an ElementTree tag name.
+
+    @param tag (str) The tag name, possibly of the form '{namespace}name'.
+
+    @return (str) The tag name without the namespace.
+    """
+    if (tag[0] == "{"):
+        return tag[tag.index("}") + 1:]
+    return tag
+
+####################################################################
+def _convert_cell_value(raw_value, cell_type, shared_strings):
+    """
+    Convert the raw <v> text of a cell to a Python value based on the cell type.
+
+    @param raw_value (str) The raw cell value text.
+    @param cell_type (str) The cell type (the 't' attribute of the cell).
+    @param shared_strings (list) The shared strings of the workbook, if read.
+
+    @return (str, int, float, or boolean) The converted cell value.
+    """
+
+    # Shared string?
+    if (cell_type == "s"):
+        if (shared_strings is not None):
+            try:
+                return shared_strings[int(raw_value)]
+            except (ValueError, IndexError):
+                pass
+        return raw_value
+
+    # Boolean?
+    if (cell_type == "b"):
+        return (raw_value.strip() not in ("0", ""))
+
+    # String formula result, inline string or error?
+    if (cell_type in ("str", "inlineStr", "e")):
+        return raw_value
+
+    # Number. Try some numeric conversions. If these fail we will just track it as a
+    # string.
+    try:
+        return int(raw_value)
+    except ValueError:
+        try:
+            return float(raw_value)
+        except ValueError:
+            return raw_value
+
+####################################################################
+def _read_shared_strings(unzipped_data):
+    """
+    Read in the shared strings table (xl/sharedStrings.xml) of a 2007+ file.
+
+    @param unzipped_data (ZipFile object) The Excel 2007+ ZIP data.
+
+    @return (list) The shared strings (str), in index order. An empty list is
+    returned if the workbook has no shared strings.
+    """
+    r = []
+    zip_subfile = 'xl/sharedStrings.xml'
+    if (zip_subfile not in unzipped_data.namelist()):
+        return r
+    f1 = unzipped_data.open(zip_subfile)
+    try:
+        # Strings are removed from the <sst> element once read, so memory use
+        # does not grow with the # of strings.
+        sst = None
+        for event, elem in ET.iterparse(f1, events=("start", "end")):
+            if (event == "start"):
+                if ((sst is None) and (_local_tag(elem.tag) == "sst")):
+                    sst = elem
+                continue
+            if (_local_tag(elem.tag) != "si"):
+                continue
+
+            # Rich text strings are split over multiple runs. Phonetic
+            # runs (<rPh>) are not part of the string value.
+            pieces = []
+            for child in elem:
+                child_tag = _local_tag(child.tag)
+                if ((child_tag == "t") and (child.text is not None)):
+                    pieces.append(child.text)
+                elif (child_tag == "r"):
+                    for t in child:
+                        if ((_local_tag(t.tag) == "t") and (t.text is not None)):
+                            pieces.append(t.text)
+            r.append("".join(pieces))
+            elem.clear()
+            if (sst is not None):
+                sst.remove(elem)
+    except ET.ParseError as e:
+        XLM.color_print.output('y', "WARNING: Parsing shared strings failed. " + str(e))
+    f1.close()
+    return r
+
+####################################################################
+def _shift_formula(formula, d_row, d_col):
+    """
+    Move the relative A1 cell references in a formula by the given # of rows and
+    columns, like Excel does when a formula is filled into other cells. Absolute
+    ('$') parts of references and text in string literals are not changed.
+
+    @param formula (str) The formula text.
+    @param d_row (int) The # of rows to move the references.
+    @param d_col (int) The # of columns to move the references.
+
+    @return (str) The moved formula text.
+    """
+    if ((d_row == 0) and (d_col == 0)):
+        return formula
+    def shift_ref(m):
+        col_abs, col, row_abs, row = m.groups()
+        col = XLM.utils.excel_col_letter_to_index(col.upper())
+        row = int(row)
+        if (col_abs == ""):
+            col += d_col
+        if (row_abs == ""):
+            row += d_row
+        if ((col < 1) or (row < 1)):
+            return "#REF!"
+        return col_abs + XLM.utils.excel_col_index_to_letter(col) + row_abs + str(row)
+
+    # Only change the references outside of the string literals (the even
+    # numbered pieces between double quotes).
+    pieces = formula.split('"')
+    for i in range(0, len(pieces), 2):
+        pieces[i] = XLM.utils.a1_ref_pat.sub(shift_ref, pieces[i])
+    return '"'.join(pieces)
+
+####################################################################
+def iter_excel_2007_sheet_cells(zip_subfile, unzipped_data, shared_strings=None, shared_cells=None):
+    """
+    Incrementally read the cells from a given 2007+ sheet file. The sheet XML is
+    streamed out of the ZIP archive and each cell is discarded once it has been
+    generated, so memory use does not depend on the size of the sheet.
+
+    @param zip_subfile (str) The full name of the sheet file in the Excel 2007+
+    ZIP archive.
+
+    @param unzipped_data (ZipFile object) The Excel 2007+ ZIP data.
+
+    @param shared_strings (list) The shared strings of the workbook. Shared string
+    cells are left as the raw string index if this is None.
+
+    @param shared_cells (dict) If given, the cells of shared formula ranges are
+    saved here. This is a map from the cell index of each cell in a shared formula
+    range to a 2 element tuple of the form (cell index, formula) giving the 1st cell
+    of the range and its raw formula.
+
+    @return (generator) Generates 4 element tuples of the form (cell index, formula,
+    value, type) where the cell index is a 2 element (row, column) tuple, the formula is
+    the raw cell formula (str, None if there is no formula), the value is the computed
+    cell value (str, int, float or boolean, None if not known) and type is the cell type
+    (the 't' attribute of the cell, 'n' if not given).
+    """
+
+    # <sheetData>
+    #  <row r="1">
+    #   <c r="HO1" t="str"><f>CHAR($EC$210-123)</f><v>e</v></c>
+    #   <c r="EY1"><v>383</v></c>
+    #   <c r="FE23" t="b"><f>RUN($IK$1673)</f><v>0</v></c>
+    #   <c r="A2" t="str"><f t="shared" ref="A2:A900" si="0">CHAR(B2-123)</f><v>e</v></c>
+    #   <c r="A3" t="str"><f t="shared" si="0"/><v>x</v></c>
+    #  </row>
+    # </sheetData>
+    #
+    # Shared formulas only give the formula text in the 1st cell of the shared
+    # range. Map from shared formula index to the 1st cell and its formula.
+    shared_formulas = {}
+    f1 = unzipped_data.open(zip_subfile)
+    try:
+        # Rows are removed from the <sheetData> element once read. Clearing them is
+        # not enough, since the emptied row elements would still pile up in
+        # <sheetData>.
+        sheet_data = None
+        for event, elem in ET.iterparse(f1, events=("start", "end")):
+            tag = _local_tag(elem.tag)
+            if (event == "start"):
+                if ((sheet_data is None) and (tag == "sheetData")):
+                    sheet_data = elem
+                continue
+
+            # Done with a row? Throw it away.
+            if (tag == "row"):
+                elem.clear()
+                if (sheet_data is not None):
+                    sheet_data.remove(elem)
+                continue
+            if (tag != "c"):
+                continue
+
+            # Get the cell index.
+            cell_id_raw = elem.get("r")
+            if (cell_id_raw is None):
+                elem.clear()
+                continue
+            cell_index = XLM.utils.parse_cell_index(cell_id_raw)
+
+            # Get the possible raw formula and value.
+            cell_type = elem.get("t", "n")
+            formula = None
+            raw_value = None
+            for child in elem:
+                child_tag = _local_tag(child.tag)
+                if (child_tag == "f"):
+                    formula = child.text
+
+                    # Fill in the formula of a shared formula cell from the
+                    # 1st cell of the shared range. Array formulas only give
+                    # the formula in the 1st cell of the array, which is the
+                    # cell that gets evaluated.
+                    if (child.get("t") == "shared"):
+                        shared_index = child.get("si")
+                        if (formula is not None):
+                            shared_formulas[shared_index] = (cell_index, formula)
+                        elif (shared_index in shared_formulas):
+                            master_index, master_formula = shared_formulas[shared_index]
+                            formula = _shift_formula(master_formula,
+                                                     cell_index[0] - master_index[0],
+                                                     cell_index[1] - master_index[1])
+                        if ((shared_cells is not None) and (shared_index in shared_formulas)):
+                            shared_cells[cell_index] = shared_formulas[shared_index]
+                elif (child_tag == "v"):
+                    raw_value = child.text
+                elif (child_tag == "is"):
+                    raw_value = "".join([t.text for t in child.iter() if ((_local_tag(t.tag) == "t") and (t.text is not None))])
+            elem.clear()
+
+            # Do we know the computed formula value?
+            formula_val = None
+            if (raw_value is not None):
+                formula_val = _convert_cell_value(raw_value, cell_type, shared_strings)
+
+            # Skip cells with no formula or value.
+            if ((formula is None) and (formula_val is None)):
+                continue
+            if debug:
+                print((cell_index, formula, formula_val, cell_type))
+            yield (cell_index, formula, formula_val, cell_type)
+
+    except ET.ParseError as e:
+        XLM.color_print.output('y', "WARNING: Parsing " + str(zip_subfile) + " failed. " + str(e))
+    finally:
+        f1.close()
+
+####################################################################
+def _is_macro_sheet_file(zip_subfile):
+    """
+    Check to see if a sheet file in an Excel 2007+ ZIP archive is an XLM macro sheet.
+
+    @param zip_subfile (str) The full name of the sheet file in the ZIP archive.
+
+    @return (boolean) True if this is a macro sheet, False if not.
+    """
+    return ("macrosheets/" in zip_subfile)
+
+####################################################################
+def _read_excel_2007_sheet(zip_subfile, unzipped_data, shared_strings=None):
     """
     Read in the formulas from a given 2007+ sheet file.
 
-    @param zip_subfile (str) The name of the macro sheet file in the Excel 2007+
+    @param zip_subfile (str) The full name of the macro sheet file in the Excel 2007+
     ZIP archive.
 
     @param unzipped_data (ZipFile object) The Excel 2007+ ZIP data.
 
+    @param shared_strings (list) The shared strings of the workbook.
+
     @return (dict) A map from a cell index (2 element (row, column) tuple) to a 2 element 
     tuple where the 1st element is the raw cell formula (str) and the 2nd element is the
-    computed formula value (str, int, or float if the value is known, None if it is not
-    known).
+    computed formula value (str, int, float, or boolean if the value is known, None if it
+    is not known).
     """
     
     # Only reading formulas.
-    if (not zip_subfile.startswith(b"macrosheets/")):
+    if (not _is_macro_sheet_file(zip_subfile)):
         return None
-    
-    # Read in the formula file.
-    zip_subfile = XLM.utils.to_str(b"xl/" + zip_subfile)
     if (zip_subfile not in unzipped_data.namelist()):
         return None
-    f1 = unzipped_data.open(zip_subfile)
-    contents = f1.read()
-    f1.close()
 
     # Pull out the cell ID, raw formula, and formula computed value (if there is one)
     # for each cell.
-    #
-    # <c r="HO1" t="str"><f>CHAR($EC$210-123)</f><v>e</v></c>
-    # <c r="EY1"><v>383</v></c>
-    # <c r="FE23" t="b"><f>RUN($IK$1673)</f><v>0</v></c>
-    cell_pat = b'<c +r="(\w+)".+?(?:(<f>[^<]+)</f>)?(?:(<v>[^<]+)</v>)?</c>'
-    cell_raw_info = re.findall(cell_pat, contents)
     r = {}
-    for curr_cell_info in cell_raw_info:
-
-        # Sanity check.
-        if (len(curr_cell_info) < 2):
-            continue
-        
-        # Tuple cell index.
-        cell_id_raw = curr_cell_info[0]
-        row, col = XLM.utils.parse_cell_index(cell_id_raw)
-        cell_index = (row, col)
-
-        # Get the possible raw formula and value.
-        item1 = curr_cell_info[1]
-        item1 = item1.replace(b"&lt;", b"<").\
-                replace(b"&amp;", b"&").\
-                replace(b"&gt;", b">").\
-                replace(b"&quot;", b'"').\
-                replace(b"&apos;", b"'")
-        item2 = None
-        if (len(curr_cell_info) > 2):
-            item2 = curr_cell_info[2]
-            item2 = item2.replace(b"&lt;", b"<").\
-                    replace(b"&amp;", b"&").\
-                    replace(b"&gt;", b">").\
-                    replace(b"&quot;", b'"').\
-                    replace(b"&apos;", b"'")
-        formula = None
-        formula_val = None
-        if (item1.startswith(b"<f>")):
-            formula = item1[len(b"<f>"):]
-        if (item2.startswith(b"<f>")):
-            formula = item2[len(b"<f>"):]
-        if (item1.startswith(b"<v>")):
-            formula_val = item1[len(b"<v>"):]
-        if (item2.startswith(b"<v>")):
-            formula_val = item2[len(b"<v>"):]
-        
-        # Do we know the computed formula value?
-        if (formula_val is not None):
-
-            # Try some numeric conversions. If these fail we will just track it as a
-            # string.
-            try:
-                formula_val = int(formula_val)
-            except:
-                try:
-                    formula_val = float(formula_val)
-                except:
-                    pass
-                
-        # Save the cell data.
+    for cell_index, formula, formula_val, _ in iter_excel_2007_sheet_cells(zip_subfile, unzipped_data, shared_strings):
         r[cell_index] = (formula, formula_val)
-        if debug:
-            print(curr_cell_info)
-
     return r
 
 ####################################################################
-def read_excel_2007_XLM(fname):
+def _get_sheet_files(unzipped_data):
     """
-    Read in the formula cells of each sheet in an Excel 2007+ file.
+    Get the names of the sheets in an Excel 2007+ file and the ZIP archive
+    files containing the sheets.
 
-    @param fname (str) The name of the Excel 2007+ file.
+    @param unzipped_data (ZipFile object) The Excel 2007+ ZIP data.
 
-    @return (dict) A map from sheet names (str) to sheet formula information
-    (see _read_excel_2007_sheet() for how the cell contents for each sheet are
-    represented).
+    @return (list) A list of 2 element tuples of the form (sheet name, sheet file name),
+    in workbook order. None is returned if the workbook parts cannot be read.
     """
-    
-    # Make sure this is an Excel 2007 file.
-    if (not XLM.utils.is_excel_file_2007(fname)):
+
+    # Read in xl/workbook.xml and xl/_rels/workbook.xml.rels.
+    names = unzipped_data.namelist()
+    if (('xl/workbook.xml' not in names) or ('xl/_rels/workbook.xml.rels' not in names)):
         return None
-    
-    # Unzip the file.
-    unzipped_data = unzip_file(fname)
-    if (fname is None):
+    try:
+        workbook_xml = ET.fromstring(unzipped_data.read('xl/workbook.xml'))
+        rels_xml = ET.fromstring(unzipped_data.read('xl/_rels/workbook.xml.rels'))
+    except ET.ParseError as e:
+        XLM.color_print.output('r', "ERROR: Cannot parse workbook XML. " + str(e))
         return None
 
-    # Get internal ID to sheet name mapping from ./xl/workbook.xml.
+    # Get ID to sheet file name mapping from xl/_rels/workbook.xml.rels.
+    # <Relationship Id="rId8" Type="http://schemas.microsoft.com/office/2006/relationships/xlMacrosheet" Target="macrosheets/sheet8.xml"/>
+    id_to_file_map = {}
+    for rel in rels_xml.iter():
+        if (_local_tag(rel.tag) != "Relationship"):
+            continue
+        target = rel.get("Target")
+        if ((rel.get("Id") is None) or (target is None)):
+            continue
+        if (target.startswith("/")):
+            target = target[1:]
+        else:
+            target = "xl/" + target
+        id_to_file_map[rel.get("Id")] = target
+
+    # Get the sheet names and IDs from xl/workbook.xml.
+    # <sheet name="DynIxoDNvviVwTft" sheetId="2" state="hidden" r:id="rId1"/>
+    r = []
+    for sheet in workbook_xml.iter():
+        if (_local_tag(sheet.tag) != "sheet"):
+            continue
+        rel_id = None
+        for attr in sheet.keys():
+            if (_local_tag(attr) == "id"):
+                rel_id = sheet.get(attr)
+        if (rel_id not in id_to_file_map):
+            continue
+        r.append((sheet.get("name"), id_to_file_map[rel_id]))
+    return r
+
+####################################################################
+def _read_defined_names(unzipped_data):
+    """
+    Read the defined names (like Auto_Open) from xl/workbook.xml.
+
+    @param unzipped_data (ZipFile object) The Excel 2007+ ZIP data.
+
+    @return (list) A list of 3 element tuples of the form (name, sheet name, (row,
+    column)). The sheet name is None if it is not known and the sheet name and cell
+    are both None if the name does not refer to a cell.
+    """
 
     # Read in xl/workbook.xml.
-    zip_subfile = 'xl/workbook.xml'
-    if (zip_subfile not in unzipped_data.namelist()):
-        return None
-    f1 = unzipped_data.open(zip_subfile)
-    contents = f1.read()
-    f1.close()
+    try:
+        workbook_xml = ET.fromstring(unzipped_data.read('xl/workbook.xml'))
+    except (KeyError, ET.ParseError):
+        return []
 
-    # Pull out sheet names and IDs.
-    # <sheet name="DynIxoDNvviVwTft" sheetId="2" state="hidden" r:id="rId1"/>
-    name_id_pat = b'<sheet +name="(\w+)"[^>]+r:id="(\w+)"'
-    name_id_info = re.findall(name_id_pat, contents)
+    # <definedName name="_xlnm.Auto_Open" hidden="1">Macro1!$A$1</definedName>
+    r = []
+    for defined_name in workbook_xml.iter():
+        if (_local_tag(defined_name.tag) != "definedName"):
+            continue
+        name = defined_name.get("name", "")
+        if (name.startswith("_xlnm.")):
+            name = name[len("_xlnm."):]
 
-    # Make a map from sheet IDs to names.
-    id_to_name_map = {}
-    for i in name_id_info:
-        id_to_name_map[i[1]] = i[0]
+        # Pull out the sheet and the (top left) cell of the reference.
+        ref = (defined_name.text or "").strip().lstrip("=")
+        sheet_name = None
+        if ("!" in ref):
+            sheet_name, ref = ref.rsplit("!", 1)
+            sheet_name = sheet_name.strip("'").replace("''", "'")
+        m = XLM.utils.a1_ref_pat.match(ref.split(":")[0])
+        if (m is None):
+            r.append((name, None, None))
+            continue
+        cell_index = XLM.utils.parse_cell_index(m.group(2) + m.group(4))
+        r.append((name, sheet_name, cell_index))
+    return r
 
-    # Get ID to formula XML file name mapping from xl/_rels/workbook.xml.rels.
+####################################################################
+def _cell_value_str(value):
+    """
+    Convert a cell value to the string form used for data cells in a workbook
+    object.
 
-    # Read in xl/_rels/workbook.xml.rels.
-    zip_subfile = 'xl/_rels/workbook.xml.rels'
-    if (zip_subfile not in unzipped_data.namelist()):
-        return None
-    f1 = unzipped_data.open(zip_subfile)
-    contents = f1.read()
-    f1.close()
+    @param value (str, int, float, or boolean) The cell value.
 
-    # Pull out sheet files and IDs.
-    # <Relationship Id="rId8" Type="http://schemas.microsoft.com/office/2006/relationships/xlMacrosheet" Target="macrosheets/sheet8.xml"/>
-    id_file_pat = b'<Relationship +Id="(\w+)"[^>]+Target="([\w\./]+)"'
-    file_id_info = re.findall(id_file_pat, contents)
+    @return (str) The string version of the value.
+    """
+    if (isinstance(value, bool)):
+        return str(value).upper()
+    return str(value)
 
-    # Make a map from sheet IDs to formula file names.
-    id_to_file_map = {}
-    for i in file_id_info:
-        id_to_file_map[i[0]] = i[1]
+####################################################################
+def _read_sheet_values(sheet_file, unzipped_data, shared_strings):
+    """
+    Read in the value cells of a sheet in an Excel 2007+ file.
+
+    @param sheet_file (str) The name of the sheet file in the ZIP archive.
+    @param unzipped_data (ZipFile object) The unzipped Excel 2007+ file.
+    @param shared_strings (list) The shared strings of the workbook.
+
+    @return (dict) A map from (row, column) tuples to cell values (str).
+    """
+    r = {}
+    for cell_index, _, formula_val, _ in iter_excel_2007_sheet_cells(sheet_file, unzipped_data, shared_strings):
+        if (formula_val is not None):
+            r[cell_index] = _cell_value_str(formula_val)
+    return r
+
+####################################################################
+def read_excel_2007_workbook(fname, data=None):
+    """
+    Read in the formula cells and the value cells of the macro sheets in an Excel
+    2007+ file. The value cells of the other sheets are read on demand. Each sheet
+    file is only read once.
+
+    @param fname (str) The name of the Excel 2007+ file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    read from disk if this is None.
+
+    @return (tuple) A 2 element tuple where the 1st element is a map from macro sheet
+    names (str) to sheet formula information (see _read_excel_2007_sheet() for how the
+    cell contents for each sheet are represented) and the 2nd element is an ExcelBook
+    object with every sheet. The cells of the sheets that are not macro sheets are
+    read when they are first looked at (see XLM.utils.LazyCells). The defined names of the workbook (see _read_defined_names())
+    are saved in the defined_names field of the ExcelBook and the shared formula
+    cells of each macro sheet (a map from macro sheet names to shared formula cells,
+    see iter_excel_2007_sheet_cells()) are saved in the shared_formula_cells field.
+    None is returned on error.
+    """
+
+    # Unzip the file. The caller has already checked that this is an Excel 2007+ file.
+    unzipped_data = unzip_file(fname, data)
+    if (unzipped_data is None):
+        return None
 
-    # Read in the formulas from each sheet.
+    # Get the sheet names and the files containing the sheets.
+    sheet_files = _get_sheet_files(unzipped_data)
+    if (sheet_files is None):
+        return None
+
+    # Read in the formulas and values from the macro sheets.
+    shared_strings = _read_shared_strings(unzipped_data)
     formulas = {}
-    for curr_id in id_to_name_map.keys():
-        curr_sheet = id_to_name_map[curr_id]
-        curr_file = id_to_file_map[curr_id]
-        curr_formulas = _read_excel_2007_sheet(curr_file, unzipped_data)
-        if ((curr_formulas is not None) and (len(curr_formulas) > 0)):
+    cells = {}
+    shared_cells = {}
+    names = set(unzipped_data.namelist())
+    for curr_sheet, curr_file in sheet_files:
+        if ((curr_file not in names) or (not _is_macro_sheet_file(curr_file))):
+            continue
+        curr_formulas = {}
+        curr_cells = {}
+        shared_cells[curr_sheet] = {}
+        for cell_index, formula, formula_val, _ in iter_excel_2007_sheet_cells(curr_file, unzipped_data, shared_strings,
+                                                                              shared_cells[curr_sheet]):
+            curr_formulas[cell_index] = (formula, formula_val)
+            if (formula_val is not None):
+                curr_cells[cell_index] = _cell_value_str(formula_val)
+        if (len(curr_formulas) > 0):
             formulas[curr_sheet] = curr_formulas
-    
-    return formulas
+        cells[curr_sheet] = curr_cells
+
+    # The values of the other sheets are only read when they are first looked at.
+    # Sheets that are never looked at (often junk padding) are never decompressed.
+    workbook = excel.ExcelBook(None)
+    for curr_sheet, curr_file in sheet_files:
+        if (curr_file not in names):
+            continue
+        if (curr_sheet not in cells):
+            cells[curr_sheet] = XLM.utils.LazyCells(functools.partial(_read_sheet_values, curr_file,
+                                                                      unzipped_data, shared_strings))
+        workbook.sheets.append(excel.ExcelSheet(cells[curr_sheet], curr_sheet))
+
+    # Save the defined names in the workbook. This is done here directly so the
+    # ExcelBook class does not need to be changed.
+    workbook.defined_names = _read_defined_names(unzipped_data)
+    workbook.shared_formula_cells = shared_cells
+
+    # Done.
+    return (formulas, workbook)
+
+####################################################################
+def read_excel_2007_XLM(fname):
+    """
+    Read in the formula cells of each sheet in an Excel 2007+ file.
+
+    @param fname (str) The name of the Excel 2007+ file.
+
+    @return (dict) A map from sheet names (str) to sheet formula information
+    (see _read_excel_2007_sheet() for how the cell contents for each sheet are
+    represented).
+    """
+    r = read_excel_2007_workbook(fname)
+    if (r is None):
+        return None
+    return r[0]
 
 ###########################################################################
 # Main Program (for testing).
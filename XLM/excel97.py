@@ -0,0 +1,1000 @@
+"""@package excel97
+
+Functions for reading XLM macros directly from the BIFF8 Workbook stream of
+Excel 97 files.
+"""
+
+from __future__ import print_function
+import functools
+import mmap
+import struct
+import sys
+
+# https://github.com/kirk-sayre-work/office_dumper.git
+import excel
+
+import XLM.color_print
+import XLM.compound_file
+import XLM.utils
+import XLM.biff_functions
+from XLM.stack_item import *
+from XLM.XLM_Object import *
+
+debug = False
+
+## BIFF8 record types.
+REC_FORMULA = 0x0006
+REC_EOF = 0x000A
+REC_EXTERNSHEET = 0x0017
+REC_NAME = 0x0018
+REC_FILEPASS = 0x002F
+REC_CONTINUE = 0x003C
+REC_BOUNDSHEET = 0x0085
+REC_MULRK = 0x00BD
+REC_SST = 0x00FC
+REC_LABELSST = 0x00FD
+REC_NUMBER = 0x0203
+REC_LABEL = 0x0204
+REC_BOOLERR = 0x0205
+REC_STRING = 0x0207
+REC_ARRAY = 0x0221
+REC_RK = 0x027E
+REC_SHRFMLA = 0x04BC
+REC_BOF = 0x0809
+
+## Initial # of Workbook stream bytes read when probing for macro sheets.
+PROBE_READ_SIZE = 4096
+
+## BOUNDSHEET sheet type of worksheets (and dialog sheets).
+SHEET_TYPE_WORKSHEET = 0x00
+
+## BOUNDSHEET sheet type of Excel 4.0 macro sheets.
+SHEET_TYPE_MACRO = 0x01
+
+## Names of the built-in defined names (NAME records with the fBuiltin flag set).
+builtin_names = {0x00 : "Consolidate_Area",
+                 0x01 : "Auto_Open",
+                 0x02 : "Auto_Close",
+                 0x03 : "Extract",
+                 0x04 : "Database",
+                 0x05 : "Criteria",
+                 0x06 : "Print_Area",
+                 0x07 : "Print_Titles",
+                 0x08 : "Recorder",
+                 0x09 : "Data_Form",
+                 0x0A : "Auto_Activate",
+                 0x0B : "Auto_Deactivate",
+                 0x0C : "Sheet_Title",
+                 0x0D : "_FilterDatabase"}
+
+## Error codes used by ptgErr tokens.
+error_values = {0x00 : "#NULL!",
+                0x07 : "#DIV/0!",
+                0x0F : "#VALUE!",
+                0x17 : "#REF!",
+                0x1D : "#NAME?",
+                0x24 : "#NUM!",
+                0x2A : "#N/A"}
+
+## ptg tokens that map directly to operator stack items.
+operator_ptgs = {0x03 : stack_add,
+                 0x04 : stack_sub,
+                 0x05 : stack_mul,
+                 0x06 : stack_div,
+                 0x07 : stack_power,
+                 0x08 : stack_concat,
+                 0x09 : stack_less_than,
+                 0x0A : stack_less_equal,
+                 0x0B : stack_equal,
+                 0x0C : stack_greater_equal,
+                 0x0D : stack_greater_than,
+                 0x0E : stack_not_equal,
+                 0x11 : stack_range,
+                 0x12 : stack_uplus,
+                 0x13 : stack_uminus,
+                 0x14 : stack_percent,
+                 0x15 : stack_paren,
+                 0x16 : stack_missing_arg}
+
+####################################################################
+def read_workbook_stream(fname, data=None):
+    """
+    Read the BIFF8 Workbook stream from an Excel 97 file.
+
+    @param fname (str) The name of the Excel 97 file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    read if this is None.
+
+    @return (bytes) The Workbook stream contents, None if the file is not an
+    OLE2 file or has no BIFF8 Workbook stream.
+    """
+    try:
+        if (data is None):
+            with open(fname, "rb") as f:
+                data = f.read()
+        ole = XLM.compound_file.CompoundFile(data)
+    except (IOError, ValueError, struct.error) as e:
+        XLM.color_print.output('r', "ERROR: Cannot read OLE2 file " + XLM.utils.input_name(fname) + ". " + str(e))
+        return None
+
+    # Only BIFF8 (Workbook) streams are handled. BIFF5 files use a Book stream.
+    return ole.read_stream("Workbook")
+
+####################################################################
+def has_excel_97_XLM(fname, data=None):
+    """
+    Cheaply check to see if an Excel 97 file may contain XLM macros. Only the
+    OLE2 directory and the start of the Workbook stream are read, until the
+    BOUNDSHEET records of the workbook globals have been seen.
+
+    @param fname (str) The name of the Excel 97 file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    memory mapped if this is None.
+
+    @return (boolean) False if the file definitely has no macro sheets, True
+    if it has macro sheets or the file could not be checked.
+    """
+    if (data is None):
+        try:
+            data = XLM.utils.map_file(fname)
+        except (IOError, ValueError, mmap.error):
+            return True
+        try:
+            return has_excel_97_XLM(fname, data)
+        finally:
+            XLM.utils.close_mapped_file(data)
+    try:
+        ole = XLM.compound_file.CompoundFile(data)
+        stream_size = ole.stream_size("Workbook")
+
+        # Not a BIFF8 file? Let the full pipeline handle it.
+        if (stream_size is None):
+            return True
+
+        # Read a growing prefix of the Workbook stream until the end of the
+        # workbook globals is seen.
+        read_size = PROBE_READ_SIZE
+        while True:
+            prefix = ole.read_stream("Workbook", read_size)
+            for rec_type, pos, size in _iter_records(prefix):
+                if ((rec_type == REC_BOUNDSHEET) and (size >= 6) and
+                    (struct.unpack_from("<B", prefix, pos + 5)[0] == SHEET_TYPE_MACRO)):
+                    return True
+                if (rec_type == REC_EOF):
+                    return False
+            # Whole stream read (or the sector chain is shorter than the stream)?
+            if ((len(prefix) >= stream_size) or (len(prefix) < read_size)):
+                return False
+            read_size *= 4
+    except (ValueError, struct.error):
+        return True
+
+####################################################################
+def _iter_records(stream, pos=0):
+    """
+    Iterate over the BIFF records in a Workbook stream.
+
+    @param stream (bytes) The Workbook stream.
+    @param pos (int) The stream offset at which to start reading records.
+
+    @return (generator) Generates 3 element tuples of the form (record type,
+    record data offset, record data size).
+    """
+    end = len(stream)
+    while ((pos + 4) <= end):
+        rec_type, size = struct.unpack_from("<HH", stream, pos)
+        pos += 4
+        if ((pos + size) > end):
+            break
+        yield (rec_type, pos, size)
+        pos += size
+
+####################################################################
+def _read_short_unicode_string(data, pos):
+    """
+    Read a ShortXLUnicodeString (8 bit character count).
+
+    @param data (bytes) The data containing the string.
+    @param pos (int) The offset of the string.
+
+    @return (tuple) A 2 element tuple where the 1st element is the string (str)
+    and the 2nd element is the offset of the 1st byte after the string.
+    """
+    cch, flags = struct.unpack_from("<BB", data, pos)
+    pos += 2
+    if (flags & 0x01):
+        r = bytes(data[pos:pos + (cch * 2)]).decode("utf-16-le", "replace")
+        pos += cch * 2
+    else:
+        r = bytes(data[pos:pos + cch]).decode("latin-1")
+        pos += cch
+    return (r, pos)
+
+####################################################################
+def _read_unicode_string(data, pos):
+    """
+    Read a XLUnicodeString (16 bit character count).
+
+    @param data (bytes) The data containing the string.
+    @param pos (int) The offset of the string.
+
+    @return (str) The string.
+    """
+    cch, flags = struct.unpack_from("<HB", data, pos)
+    pos += 3
+    if (flags & 0x01):
+        return bytes(data[pos:pos + (cch * 2)]).decode("utf-16-le", "replace")
+    return bytes(data[pos:pos + cch]).decode("latin-1")
+
+####################################################################
+class _ContinuedRecordReader(object):
+    """
+    Read data from a record whose contents are split over CONTINUE records.
+    """
+
+    ####################################################################
+    def __init__(self, segments):
+        """
+        Constructor.
+
+        @param segments (list) The data of the record and each of its CONTINUE
+        records (list of bytes).
+        """
+        self.segments = segments
+        self.seg = 0
+        self.pos = 0
+
+    ####################################################################
+    def _next_segment(self):
+        """
+        Move to the start of the next CONTINUE record.
+
+        @throws ValueError Thrown if there is no more data.
+        """
+        self.seg += 1
+        self.pos = 0
+        if (self.seg >= len(self.segments)):
+            raise ValueError("Read past the end of a continued record.")
+
+    ####################################################################
+    def read(self, size):
+        """
+        Read raw bytes. The bytes may span CONTINUE record boundaries.
+
+        @param size (int) The number of bytes to read.
+
+        @return (bytes) The read bytes.
+        """
+        chunks = []
+        while (size > 0):
+            if (self.pos >= len(self.segments[self.seg])):
+                self._next_segment()
+            chunk = self.segments[self.seg][self.pos:self.pos + size]
+            self.pos += len(chunk)
+            size -= len(chunk)
+            chunks.append(bytes(chunk))
+        return b"".join(chunks)
+
+    ####################################################################
+    def read_chars(self, cch, high_byte):
+        """
+        Read the characters of a string. When the characters are split over a
+        CONTINUE record the continuation starts with a new option flags byte.
+
+        @param cch (int) The number of characters to read.
+        @param high_byte (boolean) True if the characters start out as UTF-16.
+
+        @return (str) The characters.
+        """
+        pieces = []
+        while (cch > 0):
+            if (self.pos >= len(self.segments[self.seg])):
+                self._next_segment()
+                high_byte = (struct.unpack_from("<B", self.segments[self.seg], 0)[0] & 0x01) != 0
+                self.pos = 1
+            char_size = 2 if high_byte else 1
+            avail = (len(self.segments[self.seg]) - self.pos) // char_size
+            n = min(cch, avail)
+            if (n == 0):
+                # Misaligned data. Skip to the next record.
+                self.pos = len(self.segments[self.seg])
+                continue
+            raw = bytes(self.segments[self.seg][self.pos:self.pos + (n * char_size)])
+            self.pos += n * char_size
+            cch -= n
+            if high_byte:
+                pieces.append(raw.decode("utf-16-le", "replace"))
+            else:
+                pieces.append(raw.decode("latin-1"))
+        return "".join(pieces)
+
+####################################################################
+def _read_sst(stream):
+    """
+    Read the shared string table (SST) from the workbook globals substream.
+
+    @param stream (bytes) The Workbook stream.
+
+    @return (list) The shared strings (str), in index order.
+    """
+
+    # Collect the SST record and its CONTINUE records.
+    segments = None
+    for rec_type, pos, size in _iter_records(stream):
+        if (rec_type == REC_SST):
+            segments = [stream[pos:pos + size]]
+        elif ((rec_type == REC_CONTINUE) and (segments is not None)):
+            segments.append(stream[pos:pos + size])
+        elif (segments is not None):
+            break
+        if (rec_type == REC_EOF):
+            break
+    if (segments is None):
+        return []
+
+    # Read each XLUnicodeRichExtendedString.
+    r = []
+    reader = _ContinuedRecordReader(segments)
+    try:
+        _, num_strings = struct.unpack("<II", reader.read(8))
+        for _ in range(0, num_strings):
+            cch, flags = struct.unpack("<HB", reader.read(3))
+            num_runs = 0
+            ext_size = 0
+            if (flags & 0x08):
+                num_runs = struct.unpack("<H", reader.read(2))[0]
+            if (flags & 0x04):
+                ext_size = struct.unpack("<i", reader.read(4))[0]
+            r.append(reader.read_chars(cch, (flags & 0x01) != 0))
+            reader.read((num_runs * 4) + max(ext_size, 0))
+    except (ValueError, struct.error):
+        XLM.color_print.output('y', "WARNING: Shared string table is truncated. Read " + str(len(r)) + " strings.")
+    return r
+
+####################################################################
+def read_bound_sheets(stream):
+    """
+    Read the BOUNDSHEET records from the workbook globals substream.
+
+    @param stream (bytes) The Workbook stream.
+
+    @return (list) A list of 3 element tuples of the form (sheet name, sheet type,
+    substream offset). None is returned if the workbook is encrypted.
+    """
+    r = []
+    for rec_type, pos, size in _iter_records(stream):
+
+        # Not handling encrypted workbooks.
+        if (rec_type == REC_FILEPASS):
+            return None
+
+        # Sheet information.
+        if (rec_type == REC_BOUNDSHEET):
+            offset, _, sheet_type = struct.unpack_from("<IBB", stream, pos)
+            name, _ = _read_short_unicode_string(stream, pos + 6)
+            r.append((name, sheet_type, offset))
+
+        # End of the workbook globals?
+        if (rec_type == REC_EOF):
+            break
+    return r
+
+####################################################################
+def _read_name_cell(rgce, itab, xti_sheets, sheets):
+    """
+    Find the cell referenced by the formula of a defined name.
+
+    @param rgce (bytes) The formula token data of the name.
+    @param itab (int) The 1 based index of the sheet a local name is defined on, 0
+    for global names.
+    @param xti_sheets (list) The index (in BOUNDSHEET order) of the 1st sheet of
+    each XTI entry of the EXTERNSHEET record.
+    @param sheets (list) The BOUNDSHEET information (see read_bound_sheets()).
+
+    @return (tuple) A 2 element tuple where the 1st element is the name of the
+    referenced sheet (None if not known) and the 2nd element is the (row, column) of
+    the referenced cell (the top left cell of an area). (None, None) is returned if
+    the name does not refer to a cell.
+    """
+    try:
+        ptg = struct.unpack_from("<B", rgce, 0)[0]
+
+        # ptgRef3d or ptgArea3d.
+        if (ptg in (0x3A, 0x5A, 0x7A, 0x3B, 0x5B, 0x7B)):
+            ixti = struct.unpack_from("<H", rgce, 1)[0]
+            if (ptg in (0x3A, 0x5A, 0x7A)):
+                row, col = struct.unpack_from("<HH", rgce, 3)
+            else:
+                row, _, col = struct.unpack_from("<HHH", rgce, 3)
+            sheet_name = None
+            if ((ixti < len(xti_sheets)) and (0 <= xti_sheets[ixti] < len(sheets))):
+                sheet_name = sheets[xti_sheets[ixti]][0]
+            return (sheet_name, (row + 1, (col & 0x3FFF) + 1))
+
+        # ptgRef or ptgArea on the sheet of a local name.
+        if (ptg in (0x24, 0x44, 0x64, 0x25, 0x45, 0x65)):
+            if (ptg in (0x24, 0x44, 0x64)):
+                row, col = struct.unpack_from("<HH", rgce, 1)
+            else:
+                row, _, col = struct.unpack_from("<HHH", rgce, 1)
+            sheet_name = None
+            if (0 < itab <= len(sheets)):
+                sheet_name = sheets[itab - 1][0]
+            return (sheet_name, (row + 1, (col & 0x3FFF) + 1))
+    except struct.error:
+        pass
+    return (None, None)
+
+####################################################################
+def read_defined_names(stream, sheets):
+    """
+    Read the defined names (NAME records) from the workbook globals substream.
+
+    @param stream (bytes) The Workbook stream.
+    @param sheets (list) The BOUNDSHEET information (see read_bound_sheets()).
+
+    @return (list) A list of 3 element tuples of the form (name, sheet name, (row,
+    column)) in NAME record order, so ptgName tokens (1 based) can be looked up. The
+    sheet name is None if it is not known and the sheet name and cell are both None
+    if the name does not refer to a cell.
+    """
+
+    # Collect the NAME records and the sheets referenced by the EXTERNSHEET record.
+    name_recs = []
+    xti_sheets = []
+    for rec_type, pos, size in _iter_records(stream):
+        if (rec_type == REC_NAME):
+            name_recs.append((pos, size))
+        elif (rec_type == REC_EXTERNSHEET):
+            num_xti = struct.unpack_from("<H", stream, pos)[0]
+            num_xti = min(num_xti, (size - 2) // 6)
+            xti_sheets = [struct.unpack_from("<Hhh", stream, pos + 2 + (i * 6))[1] for i in range(0, num_xti)]
+        elif (rec_type == REC_EOF):
+            break
+
+    # Decode the names.
+    r = []
+    for pos, size in name_recs:
+        try:
+            flags, _, cch, cce, _, itab = struct.unpack_from("<HBBHHH", stream, pos)
+            is_builtin = ((flags & 0x0020) != 0)
+            high_byte = struct.unpack_from("<B", stream, pos + 14)[0] & 0x01
+            name_len = cch * 2 if high_byte else cch
+            raw_name = bytes(stream[pos + 15:pos + 15 + name_len])
+            name = raw_name.decode("utf-16-le" if high_byte else "latin-1", "replace")
+            if (is_builtin and (len(name) > 0)):
+                name = builtin_names.get(ord(name[0]), name)
+            rgce = bytes(stream[pos + 15 + name_len:min(pos + 15 + name_len + cce, pos + size)])
+        except struct.error:
+            r.append(("", None, None))
+            continue
+        sheet_name, cell_index = _read_name_cell(rgce, itab, xti_sheets, sheets)
+        r.append((name, sheet_name, cell_index))
+    return r
+
+####################################################################
+def _read_formula_cell_ref(rgce, pos):
+    """
+    Read the 1 based (row, column) from a RgceLoc cell reference.
+
+    @param rgce (bytes) The formula token data.
+    @param pos (int) The offset of the cell reference.
+
+    @return (tuple) A 2 element (row, column) tuple.
+    """
+    row, col = struct.unpack_from("<HH", rgce, pos)
+    return (row + 1, (col & 0x3FFF) + 1)
+
+####################################################################
+def _relative_cell_ref(row, col):
+    """
+    Convert the raw row and column of a RgceLocRel cell reference (ptgRefN/ptgAreaN)
+    to a cell reference. Relative parts of the reference are offsets from the cell
+    containing the formula.
+
+    @param row (int) The raw row field.
+    @param col (int) The raw column field, including the relative flag bits.
+
+    @return (stack_cell_ref object) The cell reference.
+    """
+    row_relative = (col & 0x8000) != 0
+    col_relative = (col & 0x4000) != 0
+    col = col & 0xFF
+    if row_relative:
+        if (row > 0x7FFF):
+            row -= 0x10000
+    else:
+        row += 1
+    if col_relative:
+        if (col > 0x7F):
+            col -= 0x100
+    else:
+        col += 1
+    r = stack_cell_ref(row, col)
+    r.row_relative = row_relative
+    r.col_relative = col_relative
+    return r
+
+####################################################################
+def _get_func_name(func_id):
+    """
+    Get the name of a BIFF8 function or command.
+
+    @param func_id (int) The function ID.
+
+    @return (str) The function name.
+    """
+    if (func_id in XLM.biff_functions.func_names):
+        return XLM.biff_functions.func_names[func_id]
+    return "*UNKNOWN FUNCTION*"
+
+####################################################################
+def parse_formula(rgce):
+    """
+    Decode the ptg tokens of a BIFF8 formula into stack items.
+
+    @param rgce (bytes) The formula token data.
+
+    @return (list) The stack_item objects for the formula, in evaluation order.
+    """
+
+    r = []
+    pos = 0
+    end = len(rgce)
+    try:
+        while (pos < end):
+
+            # Get the base token, ignoring the reference/value/array class bits.
+            ptg = struct.unpack_from("<B", rgce, pos)[0]
+            pos += 1
+            base = ptg
+            if (ptg >= 0x20):
+                base = (ptg & 0x1F) | 0x20
+
+            # Operators.
+            if (base in operator_ptgs):
+                r.append(operator_ptgs[base]())
+
+            # ptgExp
+            elif (base == 0x01):
+                row, col = _read_formula_cell_ref(rgce, pos)
+                pos += 4
+                r.append(stack_exp(row, col))
+
+            # ptgStr
+            elif (base == 0x17):
+                value, pos = _read_short_unicode_string(rgce, pos)
+                r.append(stack_str(value))
+
+            # ptgAttr
+            elif (base == 0x19):
+                flags, data = struct.unpack_from("<BH", rgce, pos)
+                pos += 3
+                # tAttrChoose is followed by a jump table.
+                if (flags & 0x04):
+                    pos += 2 * (data + 1)
+                r.append(stack_attr())
+
+            # ptgErr
+            elif (base == 0x1C):
+                err = struct.unpack_from("<B", rgce, pos)[0]
+                pos += 1
+                r.append(stack_error(error_values.get(err, "#N/A")))
+
+            # ptgBool
+            elif (base == 0x1D):
+                value = struct.unpack_from("<B", rgce, pos)[0]
+                pos += 1
+                r.append(stack_bool(value != 0))
+
+            # ptgInt
+            elif (base == 0x1E):
+                value = struct.unpack_from("<H", rgce, pos)[0]
+                pos += 2
+                r.append(stack_int(value))
+
+            # ptgNum
+            elif (base == 0x1F):
+                value = struct.unpack_from("<d", rgce, pos)[0]
+                pos += 8
+                if (value == int(value)):
+                    value = int(value)
+                r.append(stack_num(value))
+
+            # ptgArray. The array values are stored after the formula tokens.
+            elif (base == 0x20):
+                pos += 7
+                r.append(stack_array())
+
+            # ptgFunc
+            elif (base == 0x21):
+                func_id = struct.unpack_from("<H", rgce, pos)[0]
+                pos += 2
+                name = _get_func_name(func_id)
+                num_args = XLM.biff_functions.func_num_args.get(func_id, None)
+                r.append(stack_funcv(name, "0x%04x" % func_id, num_args))
+
+            # ptgFuncVar
+            elif (base == 0x22):
+                num_args, func_id = struct.unpack_from("<BH", rgce, pos)
+                pos += 3
+                num_args = num_args & 0x7F
+                r.append(stack_func_var(_get_func_name(func_id), num_args, "0x%04x" % func_id))
+
+            # ptgName
+            elif (base == 0x23):
+                index = struct.unpack_from("<I", rgce, pos)[0]
+                pos += 4
+                r.append(stack_name("0x%08x" % index))
+
+            # ptgRef
+            elif (base == 0x24):
+                row, col = _read_formula_cell_ref(rgce, pos)
+                pos += 4
+                r.append(stack_cell_ref(row, col))
+
+            # ptgArea
+            elif (base == 0x25):
+                row, _, col, _ = struct.unpack_from("<HHHH", rgce, pos)
+                pos += 8
+                r.append(stack_area(row + 1, (col & 0x3FFF) + 1))
+
+            # ptgMemArea, ptgMemErr, ptgMemNoMem. These are followed by the tokens
+            # of the reference subexpression they summarize, which are decoded
+            # as normal.
+            elif (base in (0x26, 0x27, 0x28)):
+                pos += 6
+
+            # ptgMemFunc, ptgMemAreaN, ptgMemNoMemN
+            elif (base in (0x29, 0x2E, 0x2F)):
+                pos += 2
+
+            # ptgRefErr
+            elif (base == 0x2A):
+                pos += 4
+                r.append(stack_ref_error())
+
+            # ptgAreaErr
+            elif (base == 0x2B):
+                pos += 8
+                r.append(stack_area_error())
+
+            # ptgRefN
+            elif (base == 0x2C):
+                row, col = struct.unpack_from("<HH", rgce, pos)
+                pos += 4
+                r.append(_relative_cell_ref(row, col))
+
+            # ptgAreaN
+            elif (base == 0x2D):
+                row, _, col, _ = struct.unpack_from("<HHHH", rgce, pos)
+                pos += 8
+                ref = _relative_cell_ref(row, col)
+                area = stack_area(ref.row, ref.column)
+                area.row_relative = ref.row_relative
+                area.col_relative = ref.col_relative
+                r.append(area)
+
+            # ptgNameX
+            elif (base == 0x39):
+                ixti, index = struct.unpack_from("<HH", rgce, pos)
+                pos += 6
+                r.append(stack_namex(str(ixti), index))
+
+            # ptgRef3d
+            elif (base == 0x3A):
+                row, col = _read_formula_cell_ref(rgce, pos + 2)
+                pos += 6
+                r.append(stack_cell_ref(row, col))
+
+            # ptgArea3d
+            elif (base == 0x3B):
+                pos += 10
+                r.append(stack_area_3d())
+
+            # ptgRefErr3d
+            elif (base == 0x3C):
+                pos += 6
+                r.append(stack_ref_error())
+
+            # ptgAreaErr3d
+            elif (base == 0x3D):
+                pos += 10
+                r.append(stack_area_error())
+
+            # Unhandled token. Stop parsing this formula.
+            else:
+                if debug:
+                    print("Unhandled ptg 0x%02x" % ptg)
+                r.append(unparsed())
+                break
+
+    except struct.error:
+        # Truncated formula.
+        r.append(unparsed())
+
+    # Done.
+    return r
+
+####################################################################
+def _decode_rk(rk):
+    """
+    Decode a RkNumber.
+
+    @param rk (int) The raw 32 bit RK value.
+
+    @return (int or float) The number.
+    """
+    if (rk & 0x02):
+        value = struct.unpack("<i", struct.pack("<I", rk))[0] >> 2
+    else:
+        value = struct.unpack("<d", struct.pack("<II", 0, rk & 0xFFFFFFFC))[0]
+    if (rk & 0x01):
+        value = value / 100.0
+    return value
+
+####################################################################
+def _number_str(value):
+    """
+    Convert a cell number to the string form used for data cells in a workbook
+    object.
+
+    @param value (int or float) The number.
+
+    @return (str) The string version of the number.
+    """
+    if (isinstance(value, float) and (value == int(value))):
+        value = int(value)
+    return str(value)
+
+####################################################################
+def _add_xlm_cell(xlm_cells, cell_index, stack):
+    """
+    Add a decoded formula cell to the XLM cells of a sheet.
+
+    @param xlm_cells (dict) The XLM cells, where dict[ROW][COL] gives the XLM cell
+    at (ROW, COL).
+    @param cell_index (tuple) The (row, column) of the cell.
+    @param stack (list) The stack_item objects of the formula.
+    """
+    if (cell_index[0] not in xlm_cells):
+        xlm_cells[cell_index[0]] = {}
+    xlm_cells[cell_index[0]][cell_index[1]] = XLM_Object(cell_index[0], cell_index[1], stack)
+
+####################################################################
+def _read_sheet(stream, offset, sst, is_macro_sheet):
+    """
+    Read the formula cells and value cells from a sheet substream.
+
+    @param stream (bytes) The Workbook stream.
+    @param offset (int) The stream offset of the BOF record of the sheet.
+    @param sst (list) The shared strings of the workbook.
+    @param is_macro_sheet (boolean) True if XLM formulas should be read from the sheet.
+
+    @return (tuple) A 2 element tuple where the 1st element is a dict of XLM formula
+    objects (XLM_Object objects) where dict[ROW][COL] gives the XLM cell at (ROW, COL)
+    and the 2nd element is a map from (row, column) tuples to cell values (str).
+    """
+    xlm_cells = {}
+    cells = {}
+    depth = 0
+    string_cell = None
+
+    # Cells of shared formula and array formula ranges only contain a ptgExp token
+    # pointing at the 1st cell of the range. The formula of the range is stored in
+    # the SHRFMLA or ARRAY record following the FORMULA record of the 1st cell.
+    exp_cells = {}
+    range_formulas = {}
+    for rec_type, pos, size in _iter_records(stream, offset):
+
+        # Track nested substreams (embedded charts, etc.).
+        if (rec_type == REC_BOF):
+            depth += 1
+            continue
+        if (rec_type == REC_EOF):
+            depth -= 1
+            if (depth <= 0):
+                break
+            continue
+        if (depth != 1):
+            continue
+
+        # String value of the previous formula?
+        if (rec_type == REC_STRING):
+            if (string_cell is not None):
+                cells[string_cell] = _read_unicode_string(stream, pos)
+            string_cell = None
+            continue
+
+        # Formula of a shared formula or array formula range. The STRING record of
+        # the 1st cell of the range comes after this.
+        if (rec_type in (REC_SHRFMLA, REC_ARRAY)):
+            cce_offset = 8 if (rec_type == REC_SHRFMLA) else 12
+            if (is_macro_sheet and (size >= (cce_offset + 2))):
+                row, col = struct.unpack_from("<HxxB", stream, pos)
+                cce = struct.unpack_from("<H", stream, pos + cce_offset)[0]
+                rgce_pos = pos + cce_offset + 2
+                range_formulas[(row + 1, col + 1)] = bytes(stream[rgce_pos:rgce_pos + cce])
+            continue
+        string_cell = None
+
+        # Formula cell.
+        if ((rec_type == REC_FORMULA) and (size >= 22)):
+
+            # Pull out the cell location and the cached formula value.
+            row, col = struct.unpack_from("<HH", stream, pos)
+            cell_index = (row + 1, col + 1)
+            if (struct.unpack_from("<H", stream, pos + 12)[0] == 0xFFFF):
+                value_type, value = struct.unpack_from("<BxB", stream, pos + 6)
+                if (value_type == 0):
+                    # The string value is in the following STRING record.
+                    string_cell = cell_index
+                elif (value_type == 1):
+                    cells[cell_index] = str(value != 0).upper()
+                elif (value_type == 2):
+                    cells[cell_index] = error_values.get(value, "#N/A")
+                elif (value_type == 3):
+                    cells[cell_index] = ""
+            else:
+                cells[cell_index] = _number_str(struct.unpack_from("<d", stream, pos + 6)[0])
+
+            # Decode the formula into an XLM object. ptgExp cells are decoded once
+            # the formula of their range has been read.
+            if is_macro_sheet:
+                cce = struct.unpack_from("<H", stream, pos + 20)[0]
+                rgce = stream[pos + 22:pos + 22 + cce]
+                if ((cce == 5) and (struct.unpack_from("<B", rgce, 0)[0] == 0x01)):
+                    exp_cells[cell_index] = _read_formula_cell_ref(rgce, 1)
+                else:
+                    _add_xlm_cell(xlm_cells, cell_index, parse_formula(rgce))
+            continue
+
+        # Value cells.
+        try:
+            if (rec_type == REC_LABELSST):
+                row, col, _, index = struct.unpack_from("<HHHI", stream, pos)
+                if (index < len(sst)):
+                    cells[(row + 1, col + 1)] = sst[index]
+            elif (rec_type == REC_NUMBER):
+                row, col, _, value = struct.unpack_from("<HHHd", stream, pos)
+                cells[(row + 1, col + 1)] = _number_str(value)
+            elif (rec_type == REC_RK):
+                row, col, _, rk = struct.unpack_from("<HHHI", stream, pos)
+                cells[(row + 1, col + 1)] = _number_str(_decode_rk(rk))
+            elif (rec_type == REC_MULRK):
+                row, col = struct.unpack_from("<HH", stream, pos)
+                num_values = (size - 6) // 6
+                for i in range(0, num_values):
+                    rk = struct.unpack_from("<I", stream, pos + 4 + (i * 6) + 2)[0]
+                    cells[(row + 1, col + 1 + i)] = _number_str(_decode_rk(rk))
+            elif (rec_type == REC_BOOLERR):
+                row, col, _, value, is_error = struct.unpack_from("<HHHBB", stream, pos)
+                if is_error:
+                    cells[(row + 1, col + 1)] = error_values.get(value, "#N/A")
+                else:
+                    cells[(row + 1, col + 1)] = str(value != 0).upper()
+            elif (rec_type == REC_LABEL):
+                row, col = struct.unpack_from("<HH", stream, pos)
+                cells[(row + 1, col + 1)] = _read_unicode_string(stream, pos + 6)
+        except struct.error:
+            if debug:
+                print("Truncated cell record 0x%04x" % rec_type)
+
+    # Decode the shared formula and array formula cells. The relative cell
+    # references (ptgRefN, ptgAreaN) of shared formulas are offsets from the cell
+    # being decoded, so the range formula is decoded again for each cell.
+    for cell_index, range_index in exp_cells.items():
+        if (range_index in range_formulas):
+            stack = parse_formula(range_formulas[range_index])
+        else:
+            if debug:
+                print("No SHRFMLA or ARRAY record for " + str(cell_index))
+            stack = [stack_exp(range_index[0], range_index[1])]
+        _add_xlm_cell(xlm_cells, cell_index, stack)
+
+    return (xlm_cells, cells)
+
+####################################################################
+def _read_sheet_values(stream, offset, sst):
+    """
+    Read the value cells from a sheet substream.
+
+    @param stream (bytes) The Workbook stream.
+    @param offset (int) The stream offset of the BOF record of the sheet.
+    @param sst (list) The shared strings of the workbook.
+
+    @return (dict) A map from (row, column) tuples to cell values (str).
+    """
+    return _read_sheet(stream, offset, sst, False)[1]
+
+####################################################################
+def read_excel_97_workbook(fname, data=None):
+    """
+    Read in the XLM formula cells of each macro sheet and the value cells of every
+    sheet in an Excel 97 file.
+
+    @param fname (str) The name of the Excel 97 file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    read if this is None.
+
+    @return (tuple) A 2 element tuple where the 1st element is a map from macro sheet
+    names (str) to a dict of XLM formula objects (XLM_Object objects) where
+    dict[ROW][COL] gives the XLM cell at (ROW, COL) and the 2nd element is an ExcelBook
+    object with every sheet. The value cells of the sheets that are not macro sheets
+    are read when they are first looked at (see XLM.utils.LazyCells). The defined names of the workbook (see
+    read_defined_names()) are saved in the defined_names field of the ExcelBook. The formula map is empty and the
+    workbook is None for password protected files. None is returned if the file
+    does not have a BIFF8 Workbook stream.
+    """
+
+    # Read in the BIFF8 Workbook stream.
+    stream = read_workbook_stream(fname, data)
+    if (stream is None):
+        return None
+
+    # Find the sheets.
+    sheets = read_bound_sheets(stream)
+    if (sheets is None):
+        XLM.color_print.output('y', "WARNING: " + XLM.utils.input_name(fname) + " is password protected. Not emulating.")
+        return ({}, None)
+
+    # Read in the formulas and values from each macro sheet. The values of the other
+    # sheets are only read when they are first looked at, so the substreams of sheets
+    # that are never looked at (often junk padding) are never read.
+    sst = _read_sst(stream)
+    formulas = {}
+    workbook = excel.ExcelBook(None)
+    for name, sheet_type, offset in sheets:
+        if (sheet_type not in (SHEET_TYPE_WORKSHEET, SHEET_TYPE_MACRO)):
+            continue
+        if (sheet_type != SHEET_TYPE_MACRO):
+            cells = XLM.utils.LazyCells(functools.partial(_read_sheet_values, stream, offset, sst))
+            workbook.sheets.append(excel.ExcelSheet(cells, name))
+            continue
+        xlm_cells, cells = _read_sheet(stream, offset, sst, True)
+        if (len(xlm_cells) > 0):
+            formulas[name] = xlm_cells
+        workbook.sheets.append(excel.ExcelSheet(cells, name))
+
+    # Save the defined names (like Auto_Open) in the workbook. This is done here
+    # directly so the ExcelBook class does not need to be changed.
+    workbook.defined_names = read_defined_names(stream, sheets)
+
+    # Done.
+    return (formulas, workbook)
+
+####################################################################
+def read_excel_97_XLM(fname, data=None):
+    """
+    Read in the XLM formula cells of each macro sheet in an Excel 97 file.
+
+    @param fname (str) The name of the Excel 97 file.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    read if this is None.
+
+    @return (dict) A map from macro sheet names (str) to a dict of XLM formula objects
+    (XLM_Object objects) where dict[ROW][COL] gives the XLM cell at (ROW, COL). An empty
+    dict is returned for password protected files and None is returned if the file
+    does not have a BIFF8 Workbook stream.
+    """
+    r = read_excel_97_workbook(fname, data)
+    if (r is None):
+        return None
+    return r[0]
+
+###########################################################################
+# Main Program (for testing).
+###########################################################################
+if __name__ == '__main__':
+    r = read_excel_97_XLM(sys.argv[1])
+    for sheet in r.keys():
+        print("\n------")
+        print(sheet)
+        print("")
+        for row in sorted(r[sheet].keys()):
+            for col in sorted(r[sheet][row].keys()):
+                print(str((row, col)) + " ---> " + str(r[sheet][row][col]))
@@ -0,0 +1,176 @@
+"""@package formula_cache
+
+Bounded LRU cache of parsed XLM formulas. Obfuscated macro sheets repeat the
+same formula shape over and over (like =CHAR(B2-123), =CHAR(B3-123), ... down
+a column), so formulas are cached by their text with plain A1 cell references
+rewritten as R1C1 references relative to the formula cell. The cached value is
+an immutable stack template that each cell relocates with
+XLM_Object.update_cell_id().
+"""
+
+from __future__ import print_function
+import collections
+import copy
+
+from XLM.stack_item import *
+from XLM.XLM_Object import *
+import XLM.utils
+
+## Default max # of cached formula templates.
+MAX_CACHED_FORMULAS = 4096
+
+####################################################################
+def normalize_formula(expression, cell_index):
+    """
+    Rewrite the relative A1 cell references in a formula (and the relative parts of
+    mixed references) as R1C1 references that are relative to the formula cell, so formulas with the same shape in different
+    cells have the same text. Text in string literals is not changed.
+
+    @param expression (str) The formula text.
+    @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+    the cell of the formula.
+
+    @return (str) The normalized formula text.
+    """
+
+    # Only formulas with a known cell can be normalized.
+    expression = XLM.utils.to_str(expression)
+    if ((not expression.startswith("=")) or (cell_index is None) or
+        (cell_index[0] < 1) or (cell_index[1] < 1)):
+        return expression
+    row, col = cell_index
+
+    # Rewrite the references outside of the string literals (the even numbered
+    # pieces between double quotes).
+    def relative_ref(m):
+        col_abs, ref_col, row_abs, ref_row = m.groups()
+        if ((col_abs != "") and (row_abs != "")):
+            return m.group(0)
+        ref_row, ref_col = XLM.utils.parse_cell_index(ref_col + ref_row)
+        if ((ref_row < 1) or (ref_col < 1)):
+            return m.group(0)
+
+        # Only the relative parts of a mixed reference (like C$3) are made relative.
+        if (row_abs != ""):
+            row_ref = "R" + str(ref_row)
+        else:
+            row_ref = "R[" + str(ref_row - row) + "]"
+        if (col_abs != ""):
+            col_ref = "C" + str(ref_col)
+        else:
+            col_ref = "C[" + str(ref_col - col) + "]"
+        return row_ref + col_ref
+    pieces = expression.split('"')
+    for i in range(0, len(pieces), 2):
+        pieces[i] = XLM.utils.a1_ref_pat.sub(relative_ref, pieces[i])
+    return '"'.join(pieces)
+
+####################################################################
+def relocate(template, cell_index):
+    """
+    Make an XLM_Object for a cell from a cached stack template.
+
+    @param template (tuple) The stack template (stack_item objects).
+    @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+    the cell of the formula. If this is None the formula is not relocated.
+
+    @return (XLM_Object) The formula for the cell.
+    """
+
+    # Cell references are updated in place when relocating, so they are the
+    # only stack items that need copying.
+    stack = [copy.copy(item) if isinstance(item, (stack_cell_ref, stack_area)) else item for item in template]
+    r = XLM_Object(-1, -1, stack)
+    if (cell_index is not None):
+        r.update_cell_id(cell_index)
+    return r
+
+####################################################################
+class FormulaCache(object):
+    """
+    Bounded LRU cache mapping normalized formula text to parsed stack templates.
+    """
+
+    ####################################################################
+    def __init__(self, max_size=MAX_CACHED_FORMULAS):
+        """
+        Constructor.
+
+        @param max_size (int) The max # of cached formulas.
+        """
+        self.max_size = max_size
+        self.templates = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    ####################################################################
+    def get(self, key):
+        """
+        Look up a cached stack template.
+
+        @param key (str) The normalized formula text.
+
+        @return (tuple) The stack template, None if the formula is not cached.
+        """
+        template = self.templates.get(key, None)
+        if (template is None):
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        # Mark this as the most recently used formula.
+        del self.templates[key]
+        self.templates[key] = template
+        return template
+
+    ####################################################################
+    def put(self, key, stack):
+        """
+        Cache the stack of a parsed formula.
+
+        @param key (str) The normalized formula text.
+        @param stack (list) The parsed stack. Cell references must be relative to
+        the formula cell.
+
+        @return (tuple) The cached stack template.
+        """
+        template = tuple(stack)
+        if (self.max_size < 1):
+            return template
+        if (key in self.templates):
+            del self.templates[key]
+        self.templates[key] = template
+
+        # Drop the least recently used formulas if the cache is full.
+        while (len(self.templates) > self.max_size):
+            self.templates.popitem(last=False)
+        return template
+
+    ####################################################################
+    def hit_rate(self):
+        """
+        Get the fraction of lookups found in the cache.
+
+        @return (float) The cache hit rate, 0.0 if nothing has been looked up.
+        """
+        total = self.hits + self.misses
+        if (total == 0):
+            return 0.0
+        return float(self.hits) / total
+
+    ####################################################################
+    def clear(self):
+        """
+        Empty the cache and reset the hit rate statistics.
+        """
+        self.templates.clear()
+        self.hits = 0
+        self.misses = 0
+
+    ####################################################################
+    def __str__(self):
+        return "Formula cache: %d/%d formulas, %d hits, %d misses (%.1f%% hit rate)" % \
+            (len(self.templates), self.max_size, self.hits, self.misses, self.hit_rate() * 100)
+
+## The shared formula cache.
+formula_cache = FormulaCache()
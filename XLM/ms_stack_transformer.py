@@ -5,33 +5,47 @@ Lark AST transformer to generate XLM_Objects from an AST generated by ms_xlm.bnf
 
 from __future__ import print_function
 import string
+import multiprocessing
 import os
 import sys
 import traceback
 
-from lark import Lark
 from lark import UnexpectedInput
 from lark import Transformer
+from lark.exceptions import VisitError
 
 from XLM.stack_item import *
 from XLM.XLM_Object import *
 
 import XLM.color_print
-
-# Load the MS XLM grammar.
-ms_xlm_grammar_file = os.path.join(os.path.abspath(os.path.dirname(__file__)), "ms_xlm.bnf")
-ms_xlm_grammar = None
-try:
-    f = open(ms_xlm_grammar_file, "r")
-    ms_xlm_grammar = f.read()
-    f.close()
-except IOError as e:
-    XLM.color_print.output('r', "ERROR: Cannot read MS XLM grammar file " + ms_xlm_grammar_file + ". " + str(e))
-    sys.exit(102)
+import XLM.formula_cache
+import XLM.parsers
 
 # Debugging flag.
 debug = False
+
+## Min # of formulas for which parsing is split across worker processes.
+PARALLEL_PARSE_MIN_FORMULAS = 5000
     
+####################################################################
+def _parse(expression):
+    """
+    Parse a MS XLM formula with the shared parser. The AST is transformed while
+    parsing unless we are debugging.
+
+    @param expression (str) The formula to parse.
+
+    @return (object) The transformed AST.
+
+    @throws UnexpectedInput Thrown if the formula cannot be parsed.
+    """
+    if debug:
+        xlm_ast = XLM.parsers.parse("ms_xlm", "start", expression)
+        print("MS XLM AST:")
+        print(xlm_ast.pretty())
+        return _transformer.transform(xlm_ast)
+    return XLM.parsers.parse("ms_xlm", "start", expression, _transformer)
+
 ####################################################################
 def parse_ms_xlm(expression):
     """
@@ -50,27 +64,41 @@ def parse_ms_xlm(expression):
     if (not expression.startswith("=")):
         expression = '="' + str(expression) + '"'
     
-    # Parse the given MS XLM.
-    xlm_parser = Lark(ms_xlm_grammar, start="start", parser='lalr')
-    xlm_ast = None
+    # Parse the given MS XLM and convert the AST to a XLM_Object.
+    r = None
     try:
-        xlm_ast = xlm_parser.parse(expression)
-    except UnexpectedInput as e:
+        r = _parse(expression)
+    except (UnexpectedInput, VisitError, ValueError) as e:
 
         # Maybe there is a problem with nested double quotes.
         expression = "=" + str(orig_expression)
         try:
-            xlm_ast = xlm_parser.parse(expression)
-        except UnexpectedInput as e:
+            r = _parse(expression)
+        except (UnexpectedInput, VisitError, ValueError) as e:
 
             # Parsing failed. Just return this as a string.
-            XLM.color_print.output('r', "ERROR: Cannot parse MS XLM expression '" + orig_expression + "'. " + str(e))
+            XLM.color_print.output('r', "ERROR: Cannot parse MS XLM expression '" + orig_expression + "'. " + XLM.parsers.describe_error(e))
             tmp_str = stack_str(orig_expression)
             r = XLM_Object(-1, -1, [tmp_str])
             return r
 
-    # Convert the AST to a XLM_Object.
-    r = MsStackTransformer().transform(xlm_ast)
+    # Done.
+    r = _to_xlm_object(r)
+    if debug:
+        print("MS XLM Parsing:")
+        print(expression)
+        print(r)
+    return r
+
+####################################################################
+def _to_xlm_object(r):
+    """
+    Convert the transformed AST of a formula to an XLM_Object.
+
+    @param r (object) The transformed AST.
+
+    @return (XLM_Object) The XLM object.
+    """
 
     # If we did not get a XLM_Object (just a stack_item), make an XLM_Object with the
     # single stack item on the stack.
@@ -80,15 +108,168 @@ def parse_ms_xlm(expression):
     if (isinstance(r, list)):
         stack = _load_stack_args([r], [])
         r = XLM_Object(-1, -1, stack)
-        
-    # Done.
-    if debug:
-        print("MS XLM Parsing:")
-        print(expression)
-        print(xlm_ast.pretty())
-        print(r)
     return r
+
+####################################################################
+def _parse_template(expression, cell_index):
+    """
+    Get the stack template of a formula (the parsed stack with the cell references
+    relative to the formula cell, see XLM.formula_cache). Parsed formulas are cached
+    by their normalized text, so formulas repeated in many cells are only parsed
+    once.
+
+    @param expression (str) The MS XLM to parse.
+    @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+    the cell of the formula. If None, the formula is not normalized.
+
+    @return (tuple) The stack template, None if the normalized formula cannot be
+    parsed.
+    """
+
+    # Already parsed this formula shape?
+    key = XLM.formula_cache.normalize_formula(expression, cell_index)
+    cache = XLM.formula_cache.formula_cache
+    template = cache.get(key)
+    if (template is not None):
+        return template
+
+    # Parse the normalized formula. Errors in the transformer (ValueError) are
+    # raised directly when it is applied while parsing and are wrapped in a
+    # VisitError when debugging.
+    if (key != expression):
+        try:
+            r = _to_xlm_object(_parse(key))
+        except (UnexpectedInput, VisitError, ValueError):
+            return None
+    else:
+        r = parse_ms_xlm(expression)
+    return cache.put(key, r.stack)
+
+####################################################################
+def parse_ms_xlm_cell(expression, cell_index=None):
+    """
+    Parse a XLM expression in the real MS XLM format (not plugin_biff) to an
+    XLM_Object for a given cell. Parsed formulas are cached by their normalized text
+    (see XLM.formula_cache), so formulas repeated in many cells are only parsed
+    once.
+
+    @param expression (str) The MS XLM to parse.
+    @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+    the cell of the formula. If None, the formula is not moved to a cell.
+
+    @return (XLM_Object) The parsed XLM object. If the expression cannot be parsed
+    the XLM object just contains the expression as a string.
+    """
+
+    # If the normalized formula cannot be parsed, parse the original formula and do
+    # not cache it.
+    expression = XLM.utils.to_str(expression)
+    template = _parse_template(expression, cell_index)
+    if (template is None):
+        r = parse_ms_xlm(expression)
+        if (cell_index is not None):
+            r.update_cell_id(cell_index)
+        return r
+    return XLM.formula_cache.relocate(template, cell_index)
+
+####################################################################
+class SharedFormula(object):
+    """
+    A shared formula of an Excel 2007+ sheet (a formula filled into a range of
+    cells). The formula of the 1st cell of the range is only parsed once and its
+    stack is relocated to each cell of the range, like Excel moves the relative
+    parts of the cell references when filling a formula.
+    """
+
+    ####################################################################
+    def __init__(self, formula, cell_index):
+        """
+        Constructor.
+
+        @param formula (str) The MS XLM formula of the 1st cell of the range.
+        @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+        the 1st cell of the range.
+        """
+        self.formula = XLM.utils.to_str(formula)
+        self.cell_index = cell_index
+        self._template = None
+        self._parsed = False
+
+    ####################################################################
+    def parse_cell(self, expression, cell_index):
+        """
+        Get the XLM_Object for a cell of the shared formula range.
+
+        @param expression (str) The moved MS XLM formula of the cell. This is only
+        parsed if the shared formula cannot be relocated.
+        @param cell_index (tuple) A 2 element tuple of the form (row, column) giving
+        the cell.
+
+        @return (XLM_Object) The XLM object for the cell.
+        """
+        if (not self._parsed):
+            self._template = _parse_template(self.formula, self.cell_index)
+            self._parsed = True
+        if (self._template is None):
+            return parse_ms_xlm_cell(expression, cell_index)
+        return XLM.formula_cache.relocate(self._template, cell_index)
     
+####################################################################
+def _parse_ms_xlm_chunk(formulas):
+    """
+    Parse a chunk of cell formulas. This is run in the parse worker processes.
+
+    @param formulas (list) 2 element tuples of the form (cell index, formula str)
+    where the cell index is a 2 element (row, column) tuple.
+
+    @return (list) 2 element tuples of the form (cell index, XLM_Object).
+    """
+    return [(cell_index, parse_ms_xlm_cell(formula, cell_index)) for cell_index, formula in formulas]
+
+####################################################################
+def parse_ms_xlm_cells(formulas, num_workers=1):
+    """
+    Parse the formulas of a group of cells. If there are a lot of formulas they
+    are split into chunks of neighboring cells that are parsed in a pool of worker
+    processes.
+
+    @param formulas (list) 2 element tuples of the form (cell index, formula str)
+    where the cell index is a 2 element (row, column) tuple.
+    @param num_workers (int) The max # of worker processes to use.
+
+    @return (list) 2 element tuples of the form (cell index, XLM_Object), in the
+    same order as the given formulas.
+    """
+
+    # Not worth starting up worker processes?
+    if ((num_workers <= 1) or (len(formulas) < PARALLEL_PARSE_MIN_FORMULAS)):
+        return _parse_ms_xlm_chunk(formulas)
+
+    # Split the formulas into chunks of neighboring cells, so cells with
+    # repeated formulas share the formula cache of a worker. Use a few chunks
+    # per worker to balance the load.
+    num_chunks = num_workers * 4
+    chunk_size = (len(formulas) + num_chunks - 1) // num_chunks
+    chunks = [formulas[i:i + chunk_size] for i in range(0, len(formulas), chunk_size)]
+
+    # Parse the chunks in parallel.
+    try:
+        pool = multiprocessing.Pool(num_workers)
+    except (OSError, ValueError) as e:
+        XLM.color_print.output('y', "WARNING: Cannot start formula parse workers. Parsing serially. " + str(e))
+        return _parse_ms_xlm_chunk(formulas)
+    try:
+        r = []
+        for parsed_chunk in pool.map(_parse_ms_xlm_chunk, chunks):
+            r.extend(parsed_chunk)
+    finally:
+        pool.close()
+        pool.join()
+    if debug:
+        print("Parsed " + str(len(r)) + " formulas in " + str(len(chunks)) + " chunks with " +
+              str(num_workers) + " workers.")
+    return r
+
 ####################################################################
 def _load_stack_args(args, stack):
     """
@@ -243,23 +424,28 @@ class MsStackTransformer(Transformer):
     def r1c1_notation_cell(self, items):
         row = -1
         col = -1
-        is_relative = False
+        row_relative = False
+        col_relative = False
         if (len(items) >= 2):
             row = items[1]
             if (isinstance(row, str) and (row.startswith("REF:"))):
-                is_relative = True
+                row_relative = True
                 row = row.replace("REF:", "")
             row = int(row)
         if (len(items) >= 4):
             col = items[3]
             if (isinstance(col, str) and (col.startswith("REF:"))):
-                is_relative = True
+                col_relative = True
                 col = col.replace("REF:", "")
             col = int(col)
         r = stack_cell_ref(row, col)
-        r.is_relative = is_relative
+        r.row_relative = row_relative
+        r.col_relative = col_relative
         return r
 
+    def r1c1_abs_row_cell(self, items):
+        return self.r1c1_notation_cell(["R"] + items)
+
     def expression(self, items):
         return items
     
@@ -347,9 +533,13 @@ class MsStackTransformer(Transformer):
     def NUMBER(self, items):
         return stack_int(str(items))
     
+    def ABS_ROW(self, items):
+        return int(str(items)[1:])
+    
     def DOLLAR_CELL_REF(self, items):
-        fields = str(items)[1:].split("$")
-        col = XLM.utils.excel_col_letter_to_index(fields[0])
-        row = int(fields[1])
+        row, col = XLM.utils.parse_cell_index(str(items).replace("$", ""))
         r = stack_cell_ref(row, col)
         return r
+
+## Shared transformer used while parsing.
+_transformer = MsStackTransformer()
@@ -0,0 +1,427 @@
+"""@package office_pool
+
+Pool of long lived worker processes for reading Excel data cells with
+office_dumper. office_dumper converts workbooks with a headless LibreOffice
+listener. The pool keeps that listener warm between conversions, runs each
+conversion in an idle worker process with a timeout, and restarts the
+listener and the worker if a conversion wedges.
+
+office_dumper always converts through the listener on port 2002, so all the
+workers share a single listener. Restarting the listener waits for the
+conversions still using it to finish (or time out), and conversions that time
+out together only restart it once. A listener that was not started by the pool
+(like the one started by docker-xlmulator.sh) cannot be restarted. Conversions
+through a wedged external listener keep timing out.
+"""
+
+from __future__ import print_function
+import atexit
+import multiprocessing
+import os
+import socket
+import subprocess
+import threading
+import time
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# https://github.com/kirk-sayre-work/office_dumper.git
+import excel
+
+import XLM.color_print
+
+# Debugging flag.
+debug = False
+
+## The soffice binary used to start a listener if one is not already running.
+SOFFICE_PATH = "/usr/lib/libreoffice/program/soffice.bin"
+
+## The port of the LibreOffice listener used by office_dumper.
+SOFFICE_PORT = 2002
+
+## Max # of seconds to wait for a started listener to accept connections.
+STARTUP_TIMEOUT = 30
+
+## Default max # of seconds a single workbook conversion can take.
+CONVERSION_TIMEOUT = 120
+
+## Default # of conversion worker processes.
+NUM_WORKERS = 1
+
+####################################################################
+def _worker_main(conn):
+    """
+    Main loop of a conversion worker process. Reads file names from the
+    connection and sends back the ExcelBook read by office_dumper.
+
+    @param conn (Connection object) The worker end of the pipe to the pool.
+    """
+    while True:
+        try:
+            fname = conn.recv()
+        except EOFError:
+            break
+        if (fname is None):
+            break
+        try:
+            r = excel.read_excel_sheets(fname)
+        except Exception as e:
+            if debug:
+                print("office_dumper failed on " + str(fname) + ": " + str(e))
+            r = None
+        conn.send(r)
+
+####################################################################
+class _Worker(object):
+    """
+    A conversion worker process and its pipe.
+    """
+
+    ####################################################################
+    def __init__(self):
+        """
+        Start a worker process.
+        """
+        self.conn, child_conn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=_worker_main, args=(child_conn,))
+        self.process.daemon = True
+        self.process.start()
+        child_conn.close()
+
+    ####################################################################
+    def convert(self, fname, timeout):
+        """
+        Have the worker read in a workbook.
+
+        @param fname (str) The name of the Excel file to read.
+        @param timeout (int) Max # of seconds to wait for the conversion.
+
+        @return (tuple) A 2 element tuple where the 1st element is True if the
+        worker finished in time and the 2nd element is the ExcelBook object (None on
+        error).
+        """
+        try:
+            self.conn.send(fname)
+            if (not self.conn.poll(timeout)):
+                return (False, None)
+            return (True, self.conn.recv())
+        except (EOFError, IOError, OSError):
+            return (False, None)
+
+    ####################################################################
+    def is_alive(self):
+        """
+        Check to see if the worker process is still running.
+
+        @return (boolean) True if the worker is running, False if not.
+        """
+        return self.process.is_alive()
+
+    ####################################################################
+    def stop(self):
+        """
+        Stop the worker process.
+        """
+        try:
+            self.conn.send(None)
+        except (IOError, OSError):
+            pass
+        self.process.join(1)
+        self.kill()
+
+    ####################################################################
+    def kill(self):
+        """
+        Forcibly kill the worker process.
+        """
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+
+####################################################################
+class _Listener(object):
+    """
+    A headless LibreOffice listener. An already running listener (like the one
+    started by docker-xlmulator.sh) is reused. Otherwise one is started.
+    """
+
+    ####################################################################
+    def __init__(self, port):
+        """
+        Constructor.
+
+        @param port (int) The port the listener accepts connections on.
+        """
+        self.port = port
+        self.process = None
+
+    ####################################################################
+    def is_listening(self):
+        """
+        Check to see if the listener is accepting connections.
+
+        @return (boolean) True if the listener is up, False if not.
+        """
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        s.settimeout(1)
+        try:
+            s.connect(("127.0.0.1", self.port))
+            return True
+        except (socket.error, socket.timeout):
+            return False
+        finally:
+            s.close()
+
+    ####################################################################
+    def start(self):
+        """
+        Start the listener if it is not already running.
+
+        @return (boolean) True if the listener is up, False if not.
+        """
+
+        # Already running?
+        if self.is_listening():
+            return True
+
+        # Start soffice.
+        soffice = SOFFICE_PATH
+        if (not os.path.exists(soffice)):
+            soffice = "soffice"
+        accept = "socket,host=127.0.0.1,port=" + str(self.port) + ",tcpNoDelay=1;urp;StarOffice.ComponentContext"
+        args = [soffice, "--headless", "--invisible", "--nocrashreport", "--nodefault",
+                "--nofirststartwizard", "--nologo", "--norestore", "--accept=" + accept]
+        try:
+            with open(os.devnull, "w") as null:
+                self.process = subprocess.Popen(args, stdout=null, stderr=null)
+        except OSError as e:
+            XLM.color_print.output('r', "ERROR: Cannot start LibreOffice listener. " + str(e))
+            return False
+
+        # Wait for it to accept connections.
+        end_time = time.time() + STARTUP_TIMEOUT
+        while (time.time() < end_time):
+            if self.is_listening():
+                return True
+            if (self.process.poll() is not None):
+                break
+            time.sleep(0.25)
+        XLM.color_print.output('r', "ERROR: LibreOffice listener on port " + str(self.port) + " did not start.")
+        return False
+
+    ####################################################################
+    def stop(self):
+        """
+        Stop the listener if it was started by us.
+        """
+        if ((self.process is not None) and (self.process.poll() is None)):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    ####################################################################
+    def restart(self):
+        """
+        Restart a wedged listener.
+
+        @return (boolean) True if the listener is up, False if not.
+        """
+        if ((self.process is None) and self.is_listening()):
+            XLM.color_print.output('y', "WARNING: LibreOffice listener on port " + str(self.port) +
+                                   " was not started by XLMulator and cannot be restarted.")
+        self.stop()
+        return self.start()
+
+####################################################################
+class OfficeConverterPool(object):
+    """
+    Dispatches office_dumper workbook reads to idle worker processes that share a
+    warm LibreOffice listener.
+    """
+
+    ####################################################################
+    def __init__(self, num_workers=NUM_WORKERS, timeout=CONVERSION_TIMEOUT, port=SOFFICE_PORT):
+        """
+        Constructor. Workers and the listener are started on the 1st conversion.
+
+        @param num_workers (int) The # of conversion worker processes.
+        @param timeout (int) Max # of seconds a single conversion can take.
+        @param port (int) The port of the LibreOffice listener.
+        """
+        self.num_workers = max(num_workers, 1)
+        self.timeout = timeout
+        self.listener = _Listener(port)
+        self.idle = queue.Queue()
+        self.workers = []
+        self.lock = threading.Lock()
+        self.started = False
+
+        # Listener restarts wait for the conversions running on the listener. The
+        # listener generation is bumped on each restart, so conversions that time
+        # out on the same listener only restart it once.
+        self.cond = threading.Condition(self.lock)
+        self.num_active = 0
+        self.restarting = False
+        self.generation = 0
+
+    ####################################################################
+    def _start(self):
+        """
+        Start the listener and the worker processes if needed.
+        """
+        with self.lock:
+            if self.started:
+                return
+            self.listener.start()
+            for _ in range(0, self.num_workers):
+                worker = _Worker()
+                self.workers.append(worker)
+                self.idle.put(worker)
+            self.started = True
+
+    ####################################################################
+    def _get_worker(self):
+        """
+        Get an idle worker. Workers that were lost (because a replacement could
+        not be started) are started again here.
+
+        @return (_Worker object) The worker.
+        """
+        with self.lock:
+            if ((self.idle.empty()) and (len(self.workers) < self.num_workers)):
+                worker = _Worker()
+                self.workers.append(worker)
+                return worker
+        return self.idle.get()
+
+    ####################################################################
+    def _release(self, worker):
+        """
+        Put a worker back on the idle queue. A worker that is no longer running
+        (like a worker killed after a timeout) is replaced with a new worker.
+
+        @param worker (_Worker object) The worker.
+        """
+        with self.lock:
+            if (not worker.is_alive()):
+                worker.kill()
+                if (worker in self.workers):
+                    self.workers.remove(worker)
+
+                # A lost worker may already have been started again by _get_worker().
+                if (len(self.workers) >= self.num_workers):
+                    return
+                try:
+                    worker = _Worker()
+                except (OSError, ValueError) as e:
+                    XLM.color_print.output('r', "ERROR: Cannot start LibreOffice conversion worker. " + str(e))
+                    return
+                self.workers.append(worker)
+            self.idle.put(worker)
+
+    ####################################################################
+    def _restart_listener(self, generation):
+        """
+        Restart a wedged listener once the other conversions using it are done.
+
+        @param generation (int) The listener generation the timed out conversion
+        ran on. The listener is not restarted again if it was already restarted
+        (or is being restarted) after that.
+        """
+        with self.cond:
+            if ((self.generation != generation) or self.restarting):
+                return
+            self.restarting = True
+            while (self.num_active > 0):
+                self.cond.wait()
+        try:
+            self.listener.restart()
+        finally:
+            with self.cond:
+                self.restarting = False
+                self.generation += 1
+                self.cond.notify_all()
+
+    ####################################################################
+    def read_excel_sheets(self, fname):
+        """
+        Read in the data cells of a workbook with office_dumper.
+
+        @param fname (str) The name of the Excel file to read.
+
+        @return (ExcelBook object) The workbook, None on error.
+        """
+        self._start()
+        worker = self._get_worker()
+        try:
+
+            # Wait for a listener restart to finish.
+            with self.cond:
+                while self.restarting:
+                    self.cond.wait()
+                self.num_active += 1
+                generation = self.generation
+
+            # Convert the file.
+            try:
+                finished, r = worker.convert(fname, self.timeout)
+            finally:
+                with self.cond:
+                    self.num_active -= 1
+                    self.cond.notify_all()
+
+            # Kill the wedged worker and restart the listener. The worker is
+            # replaced when it is released.
+            if (not finished):
+                XLM.color_print.output('r', "ERROR: Reading " + str(fname) + " with LibreOffice timed out after " +
+                                       str(self.timeout) + " seconds. Restarting LibreOffice.")
+                worker.kill()
+                self._restart_listener(generation)
+                r = None
+            return r
+        finally:
+            self._release(worker)
+
+    ####################################################################
+    def shutdown(self):
+        """
+        Stop the workers and any listener started by the pool.
+        """
+        with self.lock:
+            for worker in self.workers:
+                worker.stop()
+            self.workers = []
+            self.idle = queue.Queue()
+            self.listener.stop()
+            self.started = False
+
+## The shared converter pool.
+_pool = None
+
+####################################################################
+def get_pool():
+    """
+    Get the shared converter pool, creating it if needed.
+
+    @return (OfficeConverterPool object) The pool.
+    """
+    global _pool
+    if (_pool is None):
+        _pool = OfficeConverterPool()
+        atexit.register(_pool.shutdown)
+    return _pool
+
+####################################################################
+def read_excel_sheets(fname):
+    """
+    Read in the data cells of a workbook with office_dumper using the shared
+    converter pool.
+
+    @param fname (str) The name of the Excel file to read.
+
+    @return (ExcelBook object) The workbook, None on error.
+    """
+    return get_pool().read_excel_sheets(fname)
@@ -0,0 +1,196 @@
+"""@package parsers
+
+Registry of the Lark parsers used to parse XLM. Each grammar is loaded and
+its LALR tables are built once per process, the 1st time the parser is used.
+
+The built LALR tables are also saved in an on disk cache, keyed by a hash of
+the grammar, so new processes load the tables rather than rebuilding them.
+The cache directory can be set with the XLMULATOR_CACHE_DIR environment
+variable. The cache files are pickles, so they are only loaded from a directory
+that only the current user can write to.
+"""
+
+from __future__ import print_function
+import hashlib
+import os
+import stat
+import sys
+import tempfile
+
+# sudo pip install lark-parser
+import lark
+from lark import Lark
+
+import XLM.color_print
+
+## Directory containing the grammar files.
+grammar_dir = os.path.abspath(os.path.dirname(__file__))
+
+####################################################################
+def _default_cache_dir():
+    """
+    Get the default per user directory for the cached parser tables.
+
+    @return (str) The cache directory.
+    """
+    cache_home = os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache"))
+    if (not os.path.isabs(cache_home)):
+        uid = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+        return os.path.join(tempfile.gettempdir(), "xlmulator_parser_cache-" + str(uid))
+    return os.path.join(cache_home, "xlmulator_parser_cache")
+
+## Directory for the cached parser tables. Set to None to turn off caching.
+cache_dir = os.environ.get("XLMULATOR_CACHE_DIR", _default_cache_dir())
+
+## Map from grammar names to grammar text. Filled in as grammars are loaded.
+_grammars = {}
+
+## Map from (grammar name, start rule, transformer class) to built Lark parsers.
+_parsers = {}
+
+####################################################################
+def get_grammar(grammar_name):
+    """
+    Get the text of a grammar, reading the grammar file the 1st time the grammar
+    is asked for.
+
+    @param grammar_name (str) The name of the grammar. The grammar is read from
+    the .bnf file of the same name in the XLM package directory.
+
+    @return (str) The grammar text.
+    """
+    if (grammar_name not in _grammars):
+        grammar_file = os.path.join(grammar_dir, grammar_name + ".bnf")
+        try:
+            f = open(grammar_file, "r")
+            _grammars[grammar_name] = f.read()
+            f.close()
+        except IOError as e:
+            XLM.color_print.output('r', "ERROR: Cannot read grammar file " + grammar_file + ". " + str(e))
+            sys.exit(102)
+    return _grammars[grammar_name]
+
+####################################################################
+def _is_private(path):
+    """
+    Check to see if a file or directory belongs to the current user and cannot be
+    written by other users. Always True on systems without user IDs.
+
+    @param path (str) The file or directory.
+
+    @return (boolean) True if only the current user can change the path, False if not.
+    """
+    if (not hasattr(os, "getuid")):
+        return True
+    try:
+        info = os.lstat(path)
+    except OSError:
+        return False
+    if (stat.S_ISLNK(info.st_mode)):
+        return False
+    return ((info.st_uid == os.getuid()) and ((info.st_mode & (stat.S_IWGRP | stat.S_IWOTH)) == 0))
+
+####################################################################
+def _cache_file(grammar_name, start):
+    """
+    Get the name of the on disk cache file for a parser. The name includes a hash
+    of the grammar and the Lark and Python versions, so stale tables are never
+    loaded.
+
+    @param grammar_name (str) The name of the grammar.
+    @param start (str) The start rule of the grammar.
+
+    @return (str) The cache file name, None if caching is turned off, the cache
+    directory cannot be created or the cache directory or file could be changed by
+    other users.
+    """
+    if (cache_dir is None):
+        return None
+    try:
+        if (not os.path.isdir(cache_dir)):
+            os.makedirs(cache_dir, 0o700)
+    except OSError:
+        return None
+    if (not _is_private(cache_dir)):
+        XLM.color_print.output('y', "WARNING: Parser cache directory " + cache_dir + " can be changed by other users. Not using it.")
+        return None
+    grammar_hash = hashlib.sha256(get_grammar(grammar_name).encode("utf-8")).hexdigest()[:16]
+    version = getattr(lark, "__version__", "unknown")
+    name = "%s-%s-%s-lark%s-py%d%d.cache" % ((grammar_name, start, grammar_hash, version) + tuple(sys.version_info[:2]))
+    r = os.path.join(cache_dir, name)
+    if (os.path.lexists(r) and (not _is_private(r))):
+        XLM.color_print.output('y', "WARNING: Parser cache file " + r + " can be changed by other users. Not using it.")
+        return None
+    return r
+
+####################################################################
+def _build_parser(grammar_name, start, transformer):
+    """
+    Build a LALR parser, loading the parser tables from the on disk cache if
+    possible.
+
+    @param grammar_name (str) The name of the grammar.
+    @param start (str) The start rule of the grammar.
+    @param transformer (Transformer object) The transformer to apply while parsing
+    (None if no transformer is applied).
+
+    @return (Lark object) The parser.
+    """
+    grammar = get_grammar(grammar_name)
+    cache_file = _cache_file(grammar_name, start)
+    if (cache_file is not None):
+        try:
+            return Lark(grammar, start=start, parser='lalr', transformer=transformer, cache=cache_file)
+        except (TypeError, IOError, OSError, lark.exceptions.ConfigurationError):
+            # Older versions of Lark do not support caching, or the cache is not writable.
+            pass
+    return Lark(grammar, start=start, parser='lalr', transformer=transformer)
+
+####################################################################
+def get_parser(grammar_name, start, transformer=None):
+    """
+    Get the LALR parser for a grammar, building it if this is the 1st time the
+    parser is used.
+
+    @param grammar_name (str) The name of the grammar.
+    @param start (str) The start rule of the grammar.
+    @param transformer (Transformer object) If given, the transformer is applied
+    while parsing and the parser returns the transformed result rather than an AST.
+
+    @return (Lark object) The parser.
+    """
+    key = (grammar_name, start, None if (transformer is None) else transformer.__class__)
+    if (key not in _parsers):
+        _parsers[key] = _build_parser(grammar_name, start, transformer)
+    return _parsers[key]
+
+####################################################################
+def describe_error(e):
+    """
+    Describe where a parse error happened. str() is not used on the error, since
+    Lark replays the parser (and the transformer callbacks, on empty tokens) to
+    describe the expected tokens when a transformer is applied while parsing.
+
+    @param e (UnexpectedInput object) The parse error.
+
+    @return (str) The error description.
+    """
+    return e.__class__.__name__ + " at line " + str(getattr(e, "line", "?")) + \
+        ", column " + str(getattr(e, "column", "?"))
+
+####################################################################
+def parse(grammar_name, start, text, transformer=None):
+    """
+    Parse text with the shared parser for a grammar.
+
+    @param grammar_name (str) The name of the grammar.
+    @param start (str) The start rule of the grammar.
+    @param text (str) The text to parse.
+    @param transformer (Transformer object) If given, the transformer is applied
+    while parsing and the transformed result is returned rather than an AST.
+
+    @return (object) The AST (Tree object) or the transformed result.
+
+    @throws UnexpectedInput Thrown if the text cannot be parsed.
+    """
+    return get_parser(grammar_name, start, transformer).parse(text)
@@ -161,18 +161,21 @@ class stack_funcv(stack_item):
     """
     
     ####################################################################
-    def __init__(self, name, hexcode):
+    def __init__(self, name, hexcode, num_args=None):
         """
         Constructor.
 
         @param name (str) The name of the function.
         @param hexcode (str) The hex associated with this item by olevba.
+        @param num_args (int) The number of arguments the function takes, if known.
         """
         self.name = str(name)
         self.hexcode = str(hexcode)
 
         # Figure out how many args the function takes.
-        if (self.name in num_funcv_args.keys()):
+        if (num_args is not None):
+            self.num_args = int(num_args)
+        elif (self.name in num_funcv_args.keys()):
             self.num_args = num_funcv_args[self.name]
             # TODO: Handle functions that can take a variable # of arguments.
             if (isinstance(self.num_args, tuple)):
@@ -232,7 +235,10 @@ class stack_cell_ref(stack_item):
         self.column = column
         if (self.column > 49152):
             self.column -= 49152
-        self.is_relative = False
+
+        # Relative rows/columns are offsets from the cell containing the reference.
+        self.row_relative = False
+        self.col_relative = False
     
     ####################################################################
     def full_str(self):
@@ -566,6 +572,10 @@ class stack_area(stack_item):
         self.column = column
         if (self.column > 49152):
             self.column -= 49152
+
+        # Relative rows/columns are offsets from the cell containing the area.
+        self.row_relative = False
+        self.col_relative = False
     
     ####################################################################
     def full_str(self):
@@ -605,6 +615,28 @@ class stack_less_than(stack_item):
         """
         return "<"
 
+####################################################################
+class stack_less_equal(stack_item):
+    """
+    Less than or equal operator on the stack.
+    """
+    
+    ####################################################################
+    def __init__(self):
+        """
+        Constructor.
+        """
+        self.num_args = 2
+        self.is_infix_func = True
+        self.name = "_less_or_equal"
+    
+    ####################################################################
+    def full_str(self):
+        """
+        A human readable version of this stack item.
+        """
+        return "<="
+
 ####################################################################
 class stack_namex(stack_item):
     """
@@ -692,6 +724,32 @@ class stack_paren(stack_item):
 class unknown_token(unparsed):
     pass
 
+####################################################################
+class stack_error(stack_item):
+    """
+    Error constant (#N/A, #VALUE!, etc.) on the stack.
+    """
+
+    ####################################################################
+    def __init__(self, value):
+        """
+        Constructor.
+
+        @param value (str) The error string.
+        """
+        self.value = str(value)
+    
+    ####################################################################
+    def full_str(self):
+        """
+        A human readable version of this stack item.
+        """
+        return self.value
+
+    ####################################################################
+    def eval(self, sheet):
+        return self.value
+
 ####################################################################
 class stack_array(stack_item):
 
@@ -821,7 +879,7 @@ class stack_div(stack_item):
 ####################################################################
 class stack_uminus(stack_item):
     """
-    Unsigned minus operator on the stack.
+    Unary minus operator on the stack (like -A1). This takes a single argument.
     """
     
     ####################################################################
@@ -829,7 +887,7 @@ class stack_uminus(stack_item):
         """
         Constructor.
         """
-        self.num_args = 2
+        self.num_args = 1
         self.is_infix_func = True
         self.name = "_unsigned_minus"
     
@@ -838,12 +896,12 @@ class stack_uminus(stack_item):
         """
         A human readable version of this stack item.
         """
-        return "-u"
+        return "-"
 
 ####################################################################
 class stack_uplus(stack_item):
     """
-    Unsigned plus operator on the stack.
+    Unary plus operator on the stack (like +A1). This takes a single argument.
     """
     
     ####################################################################
@@ -851,7 +909,7 @@ class stack_uplus(stack_item):
         """
         Constructor.
         """
-        self.num_args = 2
+        self.num_args = 1
         self.is_infix_func = True
         self.name = "_unsigned_plus"
     
@@ -860,7 +918,7 @@ class stack_uplus(stack_item):
         """
         A human readable version of this stack item.
         """
-        return "+u"    
+        return "+"    
 
 ####################################################################
 class stack_greater_equal(stack_item):
@@ -0,0 +1,139 @@
+"""@package stack_optimizer
+
+Simplification passes over parsed XLM stacks. Obfuscated XLM pads formulas
+with operations on literals (like CHAR(100+5-2) or "a"&"b"&"c") that give the
+same result every time they are emulated. These are folded into single literal
+stack items when the formula is parsed.
+"""
+
+from XLM.stack_item import *
+import XLM.xlm_library
+import XLM.utils
+
+####################################################################
+def _is_int_literal(value):
+    return (isinstance(value, int) and (not isinstance(value, bool)))
+
+####################################################################
+def _all_ints(args):
+    """
+    Check to see if all the arguments of a function are int literals.
+
+    @param args (list) The literal argument values.
+
+    @return (boolean) True if all the arguments are ints, False if not.
+    """
+    for arg in args:
+        if (not _is_int_literal(arg)):
+            return False
+    return True
+
+####################################################################
+def _can_fold_char(args):
+    return (_is_int_literal(args[0]) and (0 <= args[0] < 0x110000))
+
+####################################################################
+def _can_fold_mid(args):
+    if ((not isinstance(args[0], str)) or (not _all_ints(args[1:]))):
+        return False
+    return ((1 <= args[1] <= (len(args[0]) + 1)) and (args[2] >= 0))
+
+## Map from the names of functions that can be folded to checks of whether the
+## function can be folded for the given literal argument values. The checks
+## make sure the function has no side effects (like printing warnings) for the
+## arguments.
+_foldable_funcs = {
+    "_concat" : lambda args: True,
+    "CONCATENATE" : lambda args: True,
+    "_plus" : _all_ints,
+    "_minus" : _all_ints,
+    "_times" : _all_ints,
+    "_unsigned_minus" : _all_ints,
+    "_unsigned_plus" : _all_ints,
+    "CHAR" : _can_fold_char,
+    "LOWER" : lambda args: isinstance(args[0], str),
+    "LEN" : lambda args: True,
+    "MID" : _can_fold_mid,
+}
+
+####################################################################
+def _literal_value(item):
+    """
+    Get the value of a literal stack item.
+
+    @param item (stack_item object) The stack item.
+
+    @return (str or int) The value of the literal, None if the item is not a
+    str or int literal.
+    """
+    if (isinstance(item, stack_str)):
+        return item.value
+    if (isinstance(item, stack_int) and _is_int_literal(item.value)):
+        return item.value
+    return None
+
+####################################################################
+def _make_literal(value):
+    """
+    Make a literal stack item for a folded value.
+
+    @param value (any) The folded value.
+
+    @return (stack_item object) The literal stack item, None if the value cannot
+    be represented as a str or int literal.
+    """
+    if (isinstance(value, str)):
+        # The stack_str constructor unescapes '&apos;', which must not happen to
+        # computed values.
+        r = stack_str("")
+        r.value = value
+        return r
+    if (_is_int_literal(value)):
+        return stack_int(value)
+    return None
+
+####################################################################
+def fold_constants(stack):
+    """
+    Fold the operators and pure functions in a stack whose arguments are all
+    literals into single literal stack items.
+
+    @param stack (list) The stack_item objects of a formula.
+
+    @return (list) The simplified stack. The given stack is not modified.
+    """
+
+    # Simulate the stack. Each function pops its arguments off the stack being
+    # built, so the arguments of a function are the top items on the stack.
+    r = []
+    for item in stack:
+        r.append(item)
+        if ((not isinstance(item, stack_item)) or (not item.is_function())):
+            continue
+        name = getattr(item, "name", None)
+        if (name not in _foldable_funcs):
+            continue
+        num_args = item.get_num_args()
+        if ((num_args < 1) or (len(r) <= num_args)):
+            continue
+
+        # Are all the arguments literals?
+        args = [_literal_value(arg) for arg in r[-num_args - 1:-1]]
+        if (None in args):
+            continue
+        if (not _foldable_funcs[name](args)):
+            continue
+
+        # Fold the function into its value.
+        try:
+            value = XLM.xlm_library.func_lookup[name](args, None)
+        except (ValueError, TypeError, IndexError, OverflowError):
+            continue
+        literal = _make_literal(value)
+        if (literal is None):
+            continue
+        del r[-num_args - 1:]
+        r.append(literal)
+
+    # Done.
+    return r
@@ -10,124 +10,488 @@ import os
 import re
 
 # sudo pip install lark-parser
-from lark import Lark
 from lark import Transformer
 from lark import UnexpectedInput
+from lark.exceptions import VisitError
 
 import XLM.color_print
+import XLM.parsers
 from XLM.stack_item import *
 from XLM.XLM_Object import *
 import XLM.utils
 
-## Load the olevba XLM grammar.
-xlm_grammar_file = os.path.join(os.path.abspath(os.path.dirname(__file__)), "olevba_xlm.bnf")
-xlm_grammar = None
-try:
-    f = open(xlm_grammar_file, "r")
-    xlm_grammar = f.read()
-    f.close()
-except IOError as e:
-    XLM.color_print.output('r', "ERROR: Cannot read XLM grammar file " + xlm_grammar_file + ". " + str(e))
-    sys.exit(102)
-    
 # Debugging flag.
 debug = False
 
+####################################################################
+def _split_xlm_lines(xlm_code):
+    """
+    Split olevba XLM code into lines if needed.
+
+    @param xlm_code (str or iterable) The olevba XLM code as a single string or
+    an iterable of lines.
+
+    @return (iterable) The XLM code lines.
+    """
+    if isinstance(xlm_code, (str, bytes)):
+        return XLM.utils.to_str(xlm_code).strip().split("\n")
+    return xlm_code
+
+## Matches a single olevba XLM line in a line joined with its continuation lines.
+_xlm_line_pat = re.compile(r"' \d\d\d\d {1,10}\d{1,6} [^\n]+")
+
+## Matches a ptgStr string. plugin_biff does not escape double quotes in strings, so
+## the string runs up to the next ptg.
+_olevba_str_pat = re.compile(r"Str \"(.*?)\" ptg")
+
+####################################################################
+def _fixed_olevba_xlm_lines(line_parts):
+    """
+    Join an olevba XLM line with its continuation lines and generate the fixed
+    XLM lines found in the result.
+
+    @param line_parts (list) The XLM line followed by its continuation lines.
+
+    @return (generator) Generates the modified olevba XLM code lines (str).
+    """
+    for line in _xlm_line_pat.findall("\\n".join(line_parts)):
+        yield _fix_olevba_xlm_line(line)
+
 ####################################################################
 def fix_olevba_xlm(xlm_code):
     """
     plugin_biff.py does not escape some string characters that need escaping, so
     escape them.
 
-    @param xlm_code (str) The olevba XLM code to modify.
+    @param xlm_code (str or iterable) The olevba XLM code to modify, as a single
+    string or an iterable of lines.
 
-    @return (str) The modified olevba XLM code.
+    @return (generator) Generates the modified olevba XLM code lines (str).
     """
 
-    # plugin_biff does not escape newlines in strings. Try to find them and fix them.
-    xlm_code = xlm_code.strip().encode()
-    r = b""
-    mod_chunk = b""
-    lines = xlm_code.split(b"\n")
-    pos = -1
-    new_line = b""
-    xlm_pat = br"' \d\d\d\d {1,10}\d{1,6} [^\n]+\n"
-    while (pos < (len(lines) - 1)):
+    # plugin_biff does not escape newlines in strings. Try to find them and fix them
+    # by joining lines that are not the start of an XLM line with the XLM line they
+    # continue.
+    line_parts = None
+    for curr_line in _split_xlm_lines(xlm_code):
+        curr_line = XLM.utils.to_str(curr_line).rstrip("\n")
 
         # Start putting together an aggregated line?
-        pos += 1
-        curr_line = lines[pos]
-        if (curr_line.startswith(b"' ")):
-            mod_chunk += new_line + b"\n"
-            new_line = curr_line
+        if (curr_line.startswith("' ")):
+            if (line_parts is not None):
+                for line in _fixed_olevba_xlm_lines(line_parts):
+                    yield line
+            line_parts = [curr_line]
             continue
 
         # This line is part of a string with unescaped newlines.
-        new_line += b"\\n" + curr_line
-    if (len(new_line) > 0):
-        mod_chunk += b"\n" + new_line
-    mod_chunk = mod_chunk.strip() + b"\n"
-
-    # Handle double quotes in strings.
-    for line in re.findall(xlm_pat, mod_chunk):
-
-        # plugin_biff does not escape double quotes in strings. Try to find them
-        # and fix them.
-        #
-        # ' 0006     72 FORMULA : Cell Formula - R9C1 len=50 ptgRefV R7C49153 ptgStr "Set wsh = CreateObject("WScript.Shell")" ptgFuncV FWRITELN (0x0089) 
-        str_pat = b"Str \".*?\" ptg"
-        str_pat1 = b"Str \"(.*?)\" ptg"
-        for old_str in re.findall(str_pat, line):
-            tmp_str = re.findall(str_pat1, old_str)[0]
-            if (b'"' in tmp_str):
-                # Escape single quotes.
-                escaped_str = old_str[5:-5].replace(b"'", b"&apos;")
-                new_str = b"Str '" + escaped_str + b"' ptg"
-
-                line = line.replace(old_str, new_str)
-        r += line
-
-    # Done.
-    return r
+        if (line_parts is not None):
+            line_parts.append(curr_line)
+    if (line_parts is not None):
+        for line in _fixed_olevba_xlm_lines(line_parts):
+            yield line
+
+####################################################################
+def _escape_olevba_str(m):
+    """
+    re.sub() callback to rewrite a ptgStr string containing double quotes as a
+    single quoted string.
+
+    @param m (Match object) The _olevba_str_pat match.
+
+    @return (str) The replacement text.
+    """
+    if ('"' not in m.group(1)):
+        return m.group(0)
+    # Escape single quotes.
+    return "Str '" + m.group(1).replace("'", "&apos;") + "' ptg"
+
+####################################################################
+def _fix_olevba_xlm_line(line):
+    """
+    Escape double quotes in the strings of a single olevba XLM line.
+
+    @param line (str) The olevba XLM line to modify.
+
+    @return (str) The modified olevba XLM line.
+    """
+
+    # plugin_biff does not escape double quotes in strings. Try to find them
+    # and fix them.
+    #
+    # ' 0006     72 FORMULA : Cell Formula - R9C1 len=50 ptgRefV R7C49153 ptgStr "Set wsh = CreateObject("WScript.Shell")" ptgFuncV FWRITELN (0x0089) 
+    #
+    # A string with embedded double quotes has at least 3 double quotes.
+    if (line.count('"') < 3):
+        return line
+    return _olevba_str_pat.sub(_escape_olevba_str, line)
     
+####################################################################
+## Fast path parsing of olevba XLM lines. olevba XLM lines have a very regular
+## format, so most lines are parsed directly into stack_item objects with a
+## dispatch table keyed by ptg name. Lines the fast path does not understand are
+## parsed with the Lark grammar.
+####################################################################
+
+## The line header: ' <record #> <record length> <line type> :
+_line_header_pat = re.compile(r"' \d+ {3,6}\d+ (BOUNDSHEET|LABEL|FORMULA|STRING|DCONN) : ")
+
+## The start of a formula line.
+_formula_header_pat = re.compile(r"Cell Formula - R(\d+)C(\d+) len=\d+")
+
+## Literals in ptg arguments.
+_cell_pat = re.compile(r"R(\d+)C(\d+)(?= |$)")
+_number_pat = re.compile(r"\d+(?= |$)")
+_hex_pat = re.compile(r"0x[0-9a-f]+(?= |$)")
+_decimal_pat = re.compile(r"[+-]?(?:\d+\.\d*|\.\d+)(?= |$)")
+_funcv_pat = re.compile(r"([\w\.]+) \((0x[0-9a-f]+)\)(?= |$)")
+_func_var_pat = re.compile(r"args (\d+) func (User Defined Function|[\w\.]+) \((0x[0-9a-f]+)\)(?= |$)")
+_func_pat = re.compile(r"(\*UNKNOWN FUNCTION\*|[\w\.]+)(?= |$)")
+_namex_pat = re.compile(r" *([\w\.]+) (\d+)(?= |$)")
+_bool_pat = re.compile(r"(TRUE|FALSE)(?= |$)")
+
+## Text marking the rest of a formula as unparsed by plugin_biff.
+_incomplete_marker = "*INCOMPLETE FORMULA PARSING*"
+_unknown_token_marker = "*UNKNOWN TOKEN* "
+
+####################################################################
+def _fast_cell(line, pos):
+    """
+    Match a simple R<row>C<col> cell reference.
+
+    @param line (str) The XLM line.
+    @param pos (int) The position of the reference.
+
+    @return (tuple) A 3 element tuple of the form (row, col, new position), None if
+    this is not a simple cell reference.
+    """
+    m = _cell_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (int(m.group(1)), int(m.group(2)), m.end())
+
+####################################################################
+def _fast_int(line, pos):
+    m = _number_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_int(int(m.group(0))), m.end())
+
+####################################################################
+def _fast_funcv(line, pos):
+    m = _funcv_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_funcv(m.group(1), m.group(2)), m.end())
+
+####################################################################
+def _fast_cell_ref(line, pos):
+    cell = _fast_cell(line, pos)
+    if (cell is None):
+        return None
+    return (stack_cell_ref(cell[0], cell[1]), cell[2])
+
+####################################################################
+def _fast_exp(line, pos):
+    cell = _fast_cell(line, pos)
+    if (cell is None):
+        return None
+    return (stack_exp(cell[0], cell[1]), cell[2])
+
+####################################################################
+def _fast_str(line, pos):
+    if ((pos >= len(line)) or (line[pos] not in "\"'")):
+        return None
+    end = line.find(line[pos], pos + 1)
+    if (end < 0):
+        return None
+    return (stack_str(line[pos + 1:end]), end + 1)
+
+####################################################################
+def _fast_bool(line, pos):
+    m = _bool_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_bool(m.group(1)), m.end())
+
+####################################################################
+def _fast_name(line, pos):
+    m = _hex_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_name(m.group(0)), m.end())
+
+####################################################################
+def _fast_num(line, pos):
+    if line.startswith("FLOAT", pos):
+        return (stack_str("FLOAT"), pos + len("FLOAT"))
+    m = _decimal_pat.match(line, pos)
+    if (m is None):
+        return None
+    value = float(m.group(0))
+    value_str = str(value)
+    if ("." not in value_str):
+        return None
+    if (value_str[value_str.index("."):] == ".0"):
+        value = int(value)
+    return (stack_num(value), m.end())
+
+####################################################################
+def _fast_func(line, pos):
+    m = _func_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_func(m.group(1)), m.end())
+
+####################################################################
+def _fast_func_var(line, pos):
+    m = _func_var_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_func_var(m.group(2), int(m.group(1)), m.group(3)), m.end())
+
+####################################################################
+def _fast_namex(line, pos):
+    m = _namex_pat.match(line, pos)
+    if (m is None):
+        return None
+    return (stack_namex(m.group(1), int(m.group(2))), m.end())
+
+####################################################################
+def _fast_mem_area(line, pos):
+    if line.startswith("REFERENCE-EXPRESSION", pos):
+        pos += len("REFERENCE-EXPRESSION")
+    return (stack_mem_area(), pos)
+
+####################################################################
+def _fast_simple(item_class):
+    """
+    Make a fast path handler for a ptg with no arguments.
+
+    @param item_class (class) The stack_item class for the ptg.
+
+    @return (function) The handler.
+    """
+    return lambda line, pos: (item_class(), pos)
+
+####################################################################
+def _ptg_variants(base, suffixes):
+    """
+    Generate the names of a ptg with optional suffixes.
+
+    @param base (str) The base ptg name.
+    @param suffixes (list) The optional suffixes, in order.
+
+    @return (list) All the ptg names.
+    """
+    r = [base]
+    for suffix in suffixes:
+        r = r + [name + suffix for name in r]
+    return r
+
+## Map from ptg name to a fast path handler. A handler takes the XLM line and the
+## position of the ptg arguments (after the space following the ptg name for ptgs
+## with arguments) and returns a 2 element tuple of the form (stack item, new
+## position), or None if the arguments are not understood.
+_ptg_handlers = {
+    "ptgInt" : _fast_int,
+    "ptgFuncV" : _fast_funcv,
+    "ptgStr" : _fast_str,
+    "ptgBool" : _fast_bool,
+    "ptgExp" : _fast_exp,
+    "ptgName" : _fast_name,
+    "ptgNum" : _fast_num,
+    "ptgFunc" : _fast_func,
+    "ptgNameX" : _fast_namex,
+    "ptgMemArea" : _fast_mem_area,
+}
+for _name in _ptg_variants("ptgRef", ["3d", "V"]):
+    _ptg_handlers[_name] = _fast_cell_ref
+for _name in _ptg_variants("ptgFuncVar", ["A", "V"]):
+    _ptg_handlers[_name] = _fast_func_var
+for _name, _item_class in [("ptgConcat", stack_concat), ("ptgAttr", stack_attr), ("ptgAdd", stack_add),
+                           ("ptgSub", stack_sub), ("ptgMissArg", stack_missing_arg), ("ptgNameV", stack_namev),
+                           ("ptgLT", stack_less_than), ("ptgNE", stack_not_equal), ("ptgMul", stack_mul),
+                           ("ptgParen", stack_paren), ("ptgArray", stack_array), ("ptgEQ", stack_equal),
+                           ("ptgGT", stack_greater_than), ("ptgGE", stack_greater_equal),
+                           ("ptgMemFunc", stack_mem_func), ("ptgPower", stack_power), ("ptgDiv", stack_div),
+                           ("ptgUminus", stack_uminus), ("ptgUplus", stack_uplus),
+                           ("ptgEndSheet", stack_end_sheet), ("ptgMemErr", stack_mem_error),
+                           ("ptgPercent", stack_percent), ("ptgRange", stack_range)]:
+    _ptg_handlers[_name] = _fast_simple(_item_class)
+for _name in _ptg_variants("ptgRefErr", ["3d", "A", "V"]):
+    _ptg_handlers[_name] = _fast_simple(stack_ref_error)
+for _name in _ptg_variants("ptgMemNoMem", ["A", "V"]):
+    _ptg_handlers[_name] = _fast_simple(stack_mem_no_mem)
+for _name in _ptg_variants("ptgAreaErrV", ["A", "V"]):
+    _ptg_handlers[_name] = _fast_simple(stack_area_error)
+for _name in _ptg_variants("ptgArea3d", ["A", "V"]):
+    _ptg_handlers[_name] = _fast_simple(stack_area_3d)
+
+## ptgs that take arguments after a space.
+_ptgs_with_args = set(["ptgInt", "ptgFuncV", "ptgStr", "ptgBool", "ptgExp", "ptgName",
+                       "ptgNum", "ptgFunc", "ptgNameX"] +
+                      _ptg_variants("ptgRef", ["3d", "V"]) +
+                      _ptg_variants("ptgFuncVar", ["A", "V"]))
+
+####################################################################
+def _fast_parse_olevba_xlm_line(xlm_line):
+    """
+    Parse a single olevba XLM line directly into XLM_Object objects without
+    using the Lark grammar.
+
+    @param xlm_line (str) The olevba XLM line to parse.
+
+    @return (dict) A dict of XLM formula objects (XLM_Object objects) where
+    dict[ROW][COL] gives the XLM cell at (ROW, COL). The dict is empty for lines
+    that are not cell formulas. None is returned if the line is not understood.
+    """
+
+    # Only formula lines give XLM cells.
+    m = _line_header_pat.match(xlm_line)
+    if (m is None):
+        return None
+    if (m.group(1) != "FORMULA"):
+        return {}
+    m = _formula_header_pat.match(xlm_line, m.end())
+    if (m is None):
+        return None
+    row = int(m.group(1))
+    col = int(m.group(2))
+    pos = m.end()
+
+    # Read the stack items.
+    stack = []
+    end = len(xlm_line.rstrip(" "))
+    while (pos < end):
+
+        # Items are separated by a single space.
+        if (xlm_line[pos] != " "):
+            return None
+        pos += 1
+
+        # Out of band information from plugin_biff.
+        if (xlm_line[pos] == "*"):
+            if (xlm_line.startswith(_incomplete_marker, pos) and (len(stack) > 0)):
+                stack.append(unparsed())
+                break
+            if xlm_line.startswith(_unknown_token_marker, pos):
+                m = _hex_pat.match(xlm_line, pos + len(_unknown_token_marker))
+                if (m is None):
+                    return None
+                stack.append(unparsed())
+                pos = m.end()
+                continue
+            return None
+
+        # Look up the handler for the ptg.
+        name_end = xlm_line.find(" ", pos)
+        if ((name_end < 0) or (name_end > end)):
+            name_end = end
+        ptg = xlm_line[pos:name_end]
+        handler = _ptg_handlers.get(ptg, None)
+        if (handler is None):
+            return None
+        pos = name_end
+        if (ptg in _ptgs_with_args):
+            pos += 1
+        elif ((ptg == "ptgMemArea") and xlm_line.startswith(" REFERENCE-EXPRESSION", pos)):
+            pos += 1
+        r = handler(xlm_line, pos)
+        if (r is None):
+            return None
+        item, pos = r
+        stack.append(item)
+
+    # A formula has at least 1 stack item.
+    if (len(stack) == 0):
+        return None
+    return {row : {col : XLM_Object(row, col, stack)}}
+
+####################################################################
+def _unparsed_line_cells(xlm_line, e):
+    """
+    Handle an olevba XLM line that could not be parsed. If the cell of a bad
+    formula line can be found, the cell is treated as an unparsed formula so
+    the rest of the formulas can still be emulated.
+
+    @param xlm_line (str) The olevba XLM line that could not be parsed.
+    @param e (Exception) The parse error.
+
+    @return (dict) A dict of XLM formula objects (XLM_Object objects) where
+    dict[ROW][COL] gives the XLM cell at (ROW, COL). This is empty if the cell of
+    the bad line cannot be found.
+    """
+
+    # Report the bad line.
+    XLM.color_print.output('r', "ERROR: Parsing olevba XLM line failed.\n" + XLM.parsers.describe_error(e))
+    col_num = max(getattr(e, "column", 1) - 1, 0)
+    bad_line = xlm_line[:col_num] + "...ERROR START...-->" + xlm_line[col_num:]
+    XLM.color_print.output('r', "BAD LINE: " + bad_line)
+
+    # Can we tell what cell this is?
+    m = _line_header_pat.match(xlm_line)
+    if ((m is None) or (m.group(1) != "FORMULA")):
+        return {}
+    m = _formula_header_pat.match(xlm_line, m.end())
+    if (m is None):
+        XLM.color_print.output('y', "WARNING: Skipping olevba XLM line with unknown cell.")
+        return {}
+    row = int(m.group(1))
+    col = int(m.group(2))
+    return {row : {col : XLM_Object(row, col, [unparsed()])}}
+
 ####################################################################
 def parse_olevba_xlm(xlm_code):
     """
     Parse the given olevba XLM code into an internal object representation 
-    that can be emulated.
+    that can be emulated. The code is parsed a line at a time, so the lines can
+    be generated as they are read from olevba.
 
-    @param xlm_code (str) The olevba XLM code to parse.
+    @param xlm_code (str or iterable) The olevba XLM code to parse, as a single
+    string or an iterable of lines.
 
     @return (dict) A dict of XLM formula objects (XLM_Object objects) where
-    dict[ROW][COL] gives the XLM cell at (ROW, COL).
+    dict[ROW][COL] gives the XLM cell at (ROW, COL). Formula lines that cannot be
+    parsed give cells whose formula is unparsed.
     """
 
-    # Fix some escaping issues before parsing.
-    xlm_code = XLM.utils.to_str(fix_olevba_xlm(xlm_code))
-    
-    # Parse the olevba XLM.
-    xlm_ast = None
-    try:
-        xlm_parser = Lark(xlm_grammar, start="lines", parser='lalr')
-        xlm_ast = xlm_parser.parse(xlm_code)
-    except UnexpectedInput as e:
-        XLM.color_print.output('r', "ERROR: Parsing olevba XLM failed.\n" + str(e))
-        num_pat = r"at line (\d+), column (\d+)"
-        error_loc = re.findall(num_pat, str(e))[0]
-        line_num = int(error_loc[0]) - 1
-        col_num = int(error_loc[1]) - 1
-        lines = xlm_code.split("\n")
-        bad_line = lines[line_num]
-        bad_line = bad_line[:col_num] + "...ERROR START...-->" + bad_line[col_num:]
-        XLM.color_print.output('r', "BAD LINE: " + bad_line)
-        return None
+    # Parse each olevba XLM line, fixing some escaping issues before parsing. The
+    # AST is transformed into XLM_Object objects while parsing unless we need to
+    # look at the AST.
+    formula_cells = {}
+    for xlm_line in fix_olevba_xlm(xlm_code):
+
+        # Try the fast path 1st.
+        line_cells = None
+        if (not debug):
+            line_cells = _fast_parse_olevba_xlm_line(xlm_line)
+        if (line_cells is not None):
+            for row, cols in line_cells.items():
+                if (row not in formula_cells):
+                    formula_cells[row] = {}
+                formula_cells[row].update(cols)
+            continue
+
+        # Fall back to the Lark grammar.
+        try:
+            if debug:
+                xlm_ast = XLM.parsers.parse("olevba_xlm", "lines", xlm_line + "\n")
+                print("=========== START XLM AST ==============")
+                print(xlm_ast.pretty())
+                print("=========== DONE XLM AST ==============")
+                line_cells = _transformer.transform(xlm_ast)
+            else:
+                line_cells = XLM.parsers.parse("olevba_xlm", "lines", xlm_line + "\n", _transformer)
+        except (UnexpectedInput, VisitError) as e:
+            line_cells = _unparsed_line_cells(xlm_line, e)
+
+        # Save the XLM_Object objects.
+        for row, cols in line_cells.items():
+            if (row not in formula_cells):
+                formula_cells[row] = {}
+            formula_cells[row].update(cols)
 
-    # Transform the AST into XLM_Object objects.
-    if debug:
-        print("=========== START XLM AST ==============")
-        print(xlm_ast.pretty())
-        print("=========== DONE XLM AST ==============")
-    formula_cells = StackTransformer().transform(xlm_ast)
     if debug:
         print("=========== START XLM TRANSFORMED ==============")
         print(formula_cells)
@@ -217,7 +581,8 @@ class StackTransformer(Transformer):
         return stack_str(items[0])
     
     def stack_bool(self, items):
-        return stack_bool(items[0])
+        # BOOLEAN already gives a stack_bool.
+        return items[0]
     
     def stack_attr(self, items):
         return stack_attr()
@@ -380,3 +745,6 @@ class StackTransformer(Transformer):
             r = int(r)
         return r
     
+
+## Shared transformer used while parsing.
+_transformer = StackTransformer()
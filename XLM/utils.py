@@ -2,11 +2,24 @@
 Utility functions.
 """
 
+import gc
+import io
+import mmap
+import os
+import re
 import string
-import subprocess
+import struct
+import zipfile
 from functools import reduce
 
 import XLM.color_print
+import XLM.compound_file
+
+## Matches an A1 cell reference in a formula. Groups are the optional '$' and
+## letters of the column and the optional '$' and digits of the row. Names that
+## look like cell references are not matched when they are part of a longer name,
+## a function name, a method call or a sheet name (like Doc1 in Doc1!A1).
+a1_ref_pat = re.compile(r"(?<![\w\$\.])(\$?)([A-Za-z]{1,3})(\$?)(\d+)(?![\w\(\.\$!'])")
 
 ####################################################################
 def convert_num(num_str):
@@ -50,6 +63,278 @@ def strip_unprintable(the_str):
     # Done.
     return r
 
+## File type verdicts returned by get_excel_file_type().
+EXCEL_97 = "Excel 97"
+EXCEL_2007 = "Excel 2007+"
+
+# ZIP file signature.
+ZIP_MAGIC = b"PK\x03\x04"
+
+###################################################################################################
+def input_name(fname):
+    """
+    Get a printable name for an input file. In memory data has no file name.
+
+    @param fname (str) The name of the input file, None for in memory data.
+
+    @return (str) The name to use in messages.
+    """
+    if (fname is None):
+        return "<in memory data>"
+    return str(fname)
+
+###################################################################################################
+def map_file(fname):
+    """
+    Memory map a file for reading. Only the parts of the file that are actually
+    accessed are read from disk.
+
+    @param fname (str) The name of the file to map.
+
+    @return (mmap object) The read only file mapping. An empty bytes object is
+    returned for empty files (these cannot be mapped). The caller closes the
+    mapping with close_mapped_file().
+
+    @throws IOError Thrown if the file cannot be opened.
+    """
+    with open(fname, "rb") as f:
+        if (os.fstat(f.fileno()).st_size == 0):
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+###################################################################################################
+def close_mapped_file(data):
+    """
+    Close a file mapping made by map_file(). Anything that is not a file
+    mapping (like file contents read into memory) is left alone.
+
+    @param data (mmap object) The file mapping.
+    """
+    if (not isinstance(data, mmap.mmap)):
+        return
+    try:
+        data.close()
+    except BufferError:
+
+        # Views of the mapping are still held by reference cycles (ZIP and CFB
+        # readers). Collect them and try again. If the mapping is still in use it is
+        # closed when the last view is freed.
+        gc.collect()
+        try:
+            data.close()
+        except BufferError:
+            pass
+
+###################################################################################################
+class BufferFile(io.RawIOBase):
+    """
+    Read only, seekable file object over a buffer (bytes, memoryview or mmap).
+    Unlike io.BytesIO the buffer is not copied. Only the ranges actually read are
+    copied out of the buffer.
+    """
+
+    ###################################################################################################
+    def __init__(self, data):
+        """
+        Constructor.
+
+        @param data (bytes) The buffer to read from.
+        """
+        super(BufferFile, self).__init__()
+        self.view = memoryview(data)
+        self.pos = 0
+
+    ###################################################################################################
+    def readable(self):
+        """
+        @return (boolean) Always True.
+        """
+        return True
+
+    ###################################################################################################
+    def seekable(self):
+        """
+        @return (boolean) Always True.
+        """
+        return True
+
+    ###################################################################################################
+    def tell(self):
+        """
+        @return (int) The current read position.
+        """
+        return self.pos
+
+    ###################################################################################################
+    def seek(self, offset, whence=io.SEEK_SET):
+        """
+        Change the read position.
+
+        @param offset (int) The new position, relative to whence.
+        @param whence (int) io.SEEK_SET, io.SEEK_CUR or io.SEEK_END.
+
+        @return (int) The new read position.
+        """
+        if (whence == io.SEEK_CUR):
+            offset += self.pos
+        elif (whence == io.SEEK_END):
+            offset += len(self.view)
+        if (offset < 0):
+            raise ValueError("Negative seek position " + str(offset) + ".")
+        self.pos = offset
+        return self.pos
+
+    ###################################################################################################
+    def readinto(self, b):
+        """
+        Read bytes into a preallocated buffer.
+
+        @param b (bytearray) The buffer to fill.
+
+        @return (int) The # of bytes read.
+        """
+        chunk = self.view[self.pos:self.pos + len(b)]
+        n = len(chunk)
+        b[:n] = chunk
+        self.pos += n
+        return n
+
+###################################################################################################
+class LazyCells(dict):
+    """
+    The cells of a sheet (a map from (row, column) tuples to cell values), read
+    in the 1st time they are looked at. Sheets that are never looked at (often junk
+    padding) are never read.
+    """
+
+    ###################################################################################################
+    def __init__(self, read_cells):
+        """
+        Constructor.
+
+        @param read_cells (function) Function with no arguments that reads the
+        cells of the sheet and returns them as a dict.
+        """
+        super(LazyCells, self).__init__()
+        self.read_cells = read_cells
+
+    ###################################################################################################
+    def load(self):
+        """
+        Read in the cells if they have not been read yet.
+
+        @return (LazyCells object) This object.
+        """
+        if (self.read_cells is not None):
+            read_cells = self.read_cells
+            self.read_cells = None
+            dict.update(self, read_cells())
+        return self
+
+    def __getitem__(self, key):
+        return dict.__getitem__(self.load(), key)
+
+    def __setitem__(self, key, value):
+        dict.__setitem__(self.load(), key, value)
+
+    def __delitem__(self, key):
+        dict.__delitem__(self.load(), key)
+
+    def __contains__(self, key):
+        return dict.__contains__(self.load(), key)
+
+    def __iter__(self):
+        return dict.__iter__(self.load())
+
+    def __len__(self):
+        return dict.__len__(self.load())
+
+    def __eq__(self, other):
+        return dict.__eq__(self.load(), other)
+
+    def __ne__(self, other):
+        return dict.__ne__(self.load(), other)
+
+    def __repr__(self):
+        return dict.__repr__(self.load())
+
+    def get(self, key, default=None):
+        return dict.get(self.load(), key, default)
+
+    def keys(self):
+        return dict.keys(self.load())
+
+    def values(self):
+        return dict.values(self.load())
+
+    def items(self):
+        return dict.items(self.load())
+
+    def copy(self):
+        return dict(self.load())
+
+    def pop(self, *args):
+        return dict.pop(self.load(), *args)
+
+    def setdefault(self, key, default=None):
+        return dict.setdefault(self.load(), key, default)
+
+    def update(self, *args, **kwargs):
+        dict.update(self.load(), *args, **kwargs)
+
+###################################################################################################
+def get_excel_file_type(maldoc, data=None):
+    """
+    Figure out what type of Excel file (if any) the given file is. This is done
+    in process by looking at the file magic, the OLE2 directory (for a Workbook or Book
+    stream) and the ZIP [Content_Types].xml part (for spreadsheet content types).
+
+    @param maldoc (str) The name of the file to check.
+
+    @param data (bytes) The contents of the file, if already read. The file is
+    memory mapped if this is None, so only the OLE2 header and directory or the
+    ZIP central directory and [Content_Types].xml are read from disk.
+
+    @return (str) EXCEL_97 if the file is an Excel 97 file, EXCEL_2007 if it is an
+    Excel 2007+ file, None if it is not an Excel file.
+    """
+
+    # Map the file.
+    if (data is None):
+        try:
+            data = map_file(maldoc)
+        except (IOError, ValueError, mmap.error) as e:
+            XLM.color_print.output('r', "ERROR: Cannot read " + str(maldoc) + ". " + str(e))
+            return None
+        try:
+            return get_excel_file_type(maldoc, data)
+        finally:
+            close_mapped_file(data)
+
+    # OLE2 file with a Workbook stream?
+    if (XLM.compound_file.is_cfb_data(data)):
+        try:
+            ole = XLM.compound_file.CompoundFile(data)
+        except (ValueError, struct.error):
+            return None
+        if (ole.has_stream("Workbook") or ole.has_stream("Book")):
+            return EXCEL_97
+        return None
+
+    # ZIP file with spreadsheet content types?
+    if (bytes(data[:len(ZIP_MAGIC)]) == ZIP_MAGIC):
+        try:
+            unzipped_data = zipfile.ZipFile(BufferFile(data), 'r')
+            content_types = unzipped_data.read("[Content_Types].xml")
+        except (zipfile.BadZipfile, KeyError, IOError, RuntimeError):
+            return None
+        if ((b"spreadsheetml" in content_types) or (b"ms-excel" in content_types)):
+            return EXCEL_2007
+        return None
+
+    # Not an Excel file.
+    return None
+
 ###################################################################################################
 def is_excel_file(maldoc):
     """
@@ -59,7 +344,7 @@ def is_excel_file(maldoc):
 
     @return (bool) True if the file is an Excel file, False if not.
     """
-    return (is_excel_file_97(maldoc) or is_excel_file_2007(maldoc))
+    return (get_excel_file_type(maldoc) is not None)
 
 ###################################################################################################
 def is_excel_file_2007(maldoc):
@@ -70,10 +355,7 @@ def is_excel_file_2007(maldoc):
 
     @return (bool) True if the file is an Excel file, False if not.
     """
-    typ = subprocess.check_output(["file", maldoc])
-    if (b"Excel 2007+" in typ):
-        return True
-    return False
+    return (get_excel_file_type(maldoc) == EXCEL_2007)
 
 ###################################################################################################
 def is_excel_file_97(maldoc):
@@ -84,13 +366,7 @@ def is_excel_file_97(maldoc):
 
     @return (bool) True if the file is an Excel file, False if not.
     """
-    typ = str(subprocess.check_output(["file", maldoc]))
-    if ("Composite Document File" not in typ):
-        return False
-    if ("Excel" in typ):
-        return True
-    typ = str(subprocess.check_output(["exiftool", maldoc]))
-    return (("ms-excel" in typ) or ("Worksheets" in typ))
+    return (get_excel_file_type(maldoc) == EXCEL_97)
 
 ####################################################################
 def excel_col_letter_to_index(x): 
@@ -104,6 +380,22 @@ def excel_col_letter_to_index(x):
     """
     return reduce(lambda s,a:s*26+ord(a)-ord('A')+1, x, 0)
 
+####################################################################
+def excel_col_index_to_letter(col):
+    """
+    Convert an integer Excel column index to its 'AH','C', etc. style letter
+    equivalent.
+
+    @param col (int) The integer column index (1 based).
+
+    @return (str) The letter style Excel column reference.
+    """
+    r = ""
+    while (col > 0):
+        col, rem = divmod(col - 1, 26)
+        r = chr(ord('A') + rem) + r
+    return r
+
 ####################################################################
 def parse_cell_index(cell_id_raw):
     """
@@ -90,15 +90,13 @@ func_lookup["_divide"] = _divide
 
 def _unsigned_minus(params, sheet):
     r = 0
-    # TODO: This is probably wrong.
-    r = XLM.utils.convert_num(params[0]) - XLM.utils.convert_num(params[1])
+    r = -XLM.utils.convert_num(params[0])
     return r
 func_lookup["_unsigned_minus"] = _unsigned_minus
 
 def _unsigned_plus(params, sheet):
     r = 0
-    # TODO: This is probably wrong.
-    r = XLM.utils.convert_num(params[0]) + XLM.utils.convert_num(params[1])
+    r = XLM.utils.convert_num(params[0])
     return r
 func_lookup["_unsigned_plus"] = _unsigned_plus
 
@@ -108,6 +106,12 @@ def _greater_or_equal(params, sheet):
     return r
 func_lookup["_greater_or_equal"] = _greater_or_equal
 
+def _less_or_equal(params, sheet):
+    r = False
+    r = XLM.utils.convert_num(params[0]) <= XLM.utils.convert_num(params[1])
+    return r
+func_lookup["_less_or_equal"] = _less_or_equal
+
 def CHAR(params, sheet):
     try:
         r = chr(int(XLM.utils.convert_num(params[0])))
@@ -519,7 +523,7 @@ func_lookup["INDEX"] = INDEX
 def SET_VALUE(params, sheet):
     update_fields = str(params[0]).replace("$C", ":").replace("$R", "").split(":")
     update_index = (int(update_fields[0]), int(update_fields[1]))
-    sheet.cells[update_index] = params[1]
+    _write_cell(sheet, update_index, params[1])
     return "SET.VALUE"
 func_lookup["SET.VALUE"] = SET_VALUE
 
@@ -591,6 +595,11 @@ def FORMULA_FILL(params, sheet):
     return "FORMULA.FILL"
 func_lookup["FORMULA.FILL"] = FORMULA_FILL
 
+def FOR(params, sheet):
+    # STUBBED
+    return "FOR"
+func_lookup["FOR"] = FOR
+
 def FOR_CELL(params, sheet):
     # STUBBED
     return "FOR.CELL"
@@ -642,7 +651,7 @@ def ACTIVE_CELL(params, sheet):
 func_lookup["ACTIVE.CELL"] = ACTIVE_CELL
 
 def LEN(params, sheet):
-    return len(str(params)) - 2
+    return len(str(params[0]))
 func_lookup["LEN"] = LEN
 
 def ELSE(params, sheet):
@@ -650,6 +659,11 @@ def ELSE(params, sheet):
     return "ELSE"
 func_lookup["ELSE"] = ELSE
 
+def ELSE_IF(params, sheet):
+    # STUBBED
+    return "ELSE.IF"
+func_lookup["ELSE.IF"] = ELSE_IF
+
 def COUNTA(params, sheet):
     # STUBBED
     return "COUNTA"
@@ -713,6 +727,23 @@ def _is_interesting_cell(cell):
     cell_str = str(cell).replace('"', '').strip()
     return (len(cell_str) > 0)
 
+####################################################################
+def _write_cell(sheet, cell_index, value):
+    """
+    Write a value to a cell. If the sheet has a cell dependency graph (see
+    XLM.cell_graph) the cells depending on the written cell are marked to be
+    emulated again.
+
+    @param sheet (ExcelSheet) The sheet containing the cell.
+    @param cell_index (tuple) The (row, column) of the cell.
+    @param value (any) The new cell value (str or XLM_Object).
+    """
+    old_value = sheet.cells.get(cell_index, None)
+    sheet.cells[cell_index] = value
+    cell_graph = getattr(sheet, "cell_graph", None)
+    if (cell_graph is not None):
+        cell_graph.cell_changed(cell_index, old_value)
+
 ####################################################################
 def eval(func_name, params, sheet):
     """
@@ -754,15 +785,14 @@ def eval(func_name, params, sheet):
 
         # r is something in the real XLM format. Need to parse real XLM to an XLM object.
         import XLM.ms_stack_transformer
-        new_cell = XLM.ms_stack_transformer.parse_ms_xlm(str(r))
-        new_cell.update_cell_id(update_index)
+        new_cell = XLM.ms_stack_transformer.parse_ms_xlm_cell(str(r), update_index)
 
         # Only do the update if it looks interesting.
         if debug:
             print("FORMULA:")
             print("orig string: '" + str(r) + "'")
         if (_is_interesting_cell(new_cell)):
-            sheet.cells[update_index] = new_cell
+            _write_cell(sheet, update_index, new_cell)
             if debug:
                 print("'" + str(new_cell) + "'")
                 print(new_cell.cell_id)
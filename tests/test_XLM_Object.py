@@ -0,0 +1,160 @@
+"""
+Tests for emulating XLM cells (XLM.XLM_Object).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import unittest
+
+import excel
+
+import XLM.color_print
+import XLM.ms_stack_transformer
+import XLM.XLM_Object
+
+XLM.color_print.quiet = True
+
+####################################################################
+def _make_sheet(formulas, values=None):
+    """
+    Make a macro sheet.
+
+    @param formulas (dict) Map from cell indices to the formulas of the XLM cells.
+    @param values (dict) Map from cell indices to the values of the value cells.
+
+    @return (ExcelSheet object) The sheet.
+    """
+    sheet = excel.ExcelSheet(dict(values or {}), "Macro1")
+    sheet.xlm_cell_indices = sorted(formulas.keys())
+    for cell_index, formula in formulas.items():
+        sheet.cells[cell_index] = XLM.ms_stack_transformer.parse_ms_xlm_cell(formula, cell_index)
+    return sheet
+
+####################################################################
+class TestCompiledStacks(unittest.TestCase):
+    """
+    Compiled stacks give the same results as the stack interpreter.
+    """
+
+    ## Value cells of the test sheets.
+    values = {(1, 2) : "100", (2, 2) : "abcdef", (3, 2) : "7"}
+
+    ## Formulas evaluated in A1 of the test sheets. B4 and B5 are XLM cells.
+    formulas = [
+        '=B1+5-2',
+        '=CHAR(B1-35)&"bc"',
+        '=MID(B2,2,3)&LEN(B2)',
+        '=IF(B3>5,"big","small")',
+        '=CONCATENATE(B2,B3,LOWER("XY"),CHAR(B3+90))',
+        '=B4&B5',
+        '=B3*2-LEN(B5)',
+        '=B3>5',
+        '=SET.VALUE(B6,B3*3)',
+        '=FORMULA("=B3+1",B7)',
+    ]
+
+    ## XLM cells referenced by the formulas.
+    referenced = {(4, 2) : '=MID(B2,B3-5,2)', (5, 2) : '=B4&CHAR(B1+1)'}
+
+    def tearDown(self):
+        XLM.XLM_Object.MAX_COMPILED_NESTING = 150
+
+    def _eval(self, formula, nesting):
+        XLM.XLM_Object.MAX_COMPILED_NESTING = nesting
+        formulas = dict(self.referenced)
+        formulas[(1, 1)] = formula
+        sheet = _make_sheet(formulas, self.values)
+        xlm_cell = sheet.cells[(1, 1)]
+        r = XLM.XLM_Object._eval_cell(xlm_cell, sheet, [])
+        cells = dict((cell_index, str(sheet.cells.get(cell_index, None))) for cell_index in ((6, 2), (7, 2)))
+        return (r, cells, xlm_cell)
+
+    def test_same_results(self):
+        for formula in self.formulas:
+            compiled_r, compiled_cells, xlm_cell = self._eval(formula, 150)
+            self.assertIsNotNone(xlm_cell.compiled(), formula)
+            interpreted_r, interpreted_cells, _ = self._eval(formula, 0)
+            self.assertEqual(compiled_r, interpreted_r, formula)
+            self.assertEqual(compiled_cells, interpreted_cells, formula)
+
+    def test_compiled_once(self):
+        sheet = _make_sheet({(1, 1) : '=CHAR(B1-35)&"bc"'}, self.values)
+        xlm_cell = sheet.cells[(1, 1)]
+        for i in range(0, 3):
+            xlm_cell.value = None
+            self.assertEqual(XLM.XLM_Object._eval_cell(xlm_cell, sheet, []), "Abc")
+            if (i == 0):
+                compiled = xlm_cell.compiled()
+            self.assertIs(xlm_cell.compiled(), compiled)
+
+    def test_long_reference_chain(self):
+        # Each cell appends a 'b' to the cell above it. Chains longer than the
+        # Python recursion limit fall back to the stack interpreter.
+        num_cells = 2000
+        formulas = {}
+        for row in range(2, num_cells + 1):
+            formulas[(row, 1)] = '=MID(CONCATENATE(A' + str(row - 1) + ',CHAR(98)),1,5)'
+        sheet = _make_sheet(formulas, {(1, 1) : "a"})
+        r = XLM.XLM_Object._eval_cell(sheet.cells[(num_cells, 1)], sheet, [])
+        self.assertEqual(r, "abbbb")
+
+####################################################################
+class TestControlFlow(unittest.TestCase):
+    """
+    Following the control flow runs the executed cells in execution order.
+    """
+
+    def _run(self, formulas, values=None):
+        sheet = _make_sheet(formulas, values)
+        sheet.defined_names = [("Auto_Open", None, (1, 1))]
+        actions, _ = XLM.XLM_Object.eval_control_flow(sheet)
+        return [action[1] for action in actions]
+
+    def test_jumps(self):
+        formulas = {(1, 1) : '=ALERT("a")',
+                    (2, 1) : '=GOTO(A5)',
+                    (3, 1) : '=ALERT("skipped")',
+                    (5, 1) : '=RUN(C1)',
+                    (6, 1) : '=ALERT("b")',
+                    (1, 3) : '=ALERT("sub")',
+                    (2, 3) : '=RETURN()',
+                    (3, 3) : '=ALERT("after return")'}
+        self.assertEqual(self._run(formulas), ["ALERT('a')", "ALERT('sub')", "ALERT('b')"])
+
+    def test_block_if(self):
+        formulas = {(1, 1) : '=IF(B1>5)',
+                    (2, 1) : '=ALERT("big")',
+                    (3, 1) : '=ELSE.IF(B1>1)',
+                    (4, 1) : '=ALERT("medium")',
+                    (5, 1) : '=ELSE()',
+                    (6, 1) : '=ALERT("small")',
+                    (7, 1) : '=END.IF()',
+                    (8, 1) : '=ALERT("done")'}
+        for value, branch in (("10", "big"), ("3", "medium"), ("0", "small")):
+            self.assertEqual(self._run(formulas, {(1, 2) : value}), ["ALERT('" + branch + "')", "ALERT('done')"])
+
+    def test_while(self):
+        formulas = {(1, 1) : '=SET.VALUE(B1,0)',
+                    (2, 1) : '=WHILE(B1<3)',
+                    (3, 1) : '=SET.VALUE(B1,B1+1)',
+                    (4, 1) : '=ALERT(B1)',
+                    (5, 1) : '=NEXT()',
+                    (6, 1) : '=ALERT("end")'}
+        self.assertEqual(self._run(formulas), ["ALERT(1)", "ALERT(2)", "ALERT(3)", "ALERT('end')"])
+
+    def test_for_runs_once(self):
+        formulas = {(1, 1) : '=FOR("i",1,3)',
+                    (2, 1) : '=ALERT("body")',
+                    (3, 1) : '=NEXT()',
+                    (4, 1) : '=ALERT("end")'}
+        warnings = []
+        saved_output = XLM.color_print.output
+        XLM.color_print.output = lambda color, text: warnings.append(text)
+        try:
+            self.assertEqual(self._run(formulas), ["ALERT('body')", "ALERT('end')"])
+        finally:
+            XLM.color_print.output = saved_output
+        self.assertEqual(len([text for text in warnings if ("FOR() loop in cell (1, 1)" in text)]), 1)
+
+if __name__ == '__main__':
+    unittest.main()
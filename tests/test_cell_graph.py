@@ -0,0 +1,61 @@
+"""
+Tests for the dependency graph of XLM cells (XLM.cell_graph).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import unittest
+
+import excel
+
+import XLM.cell_graph
+import XLM.color_print
+import XLM.XLM_Object
+
+XLM.color_print.quiet = True
+
+####################################################################
+class TestLazyCells(unittest.TestCase):
+    """
+    Building the graph does not parse lazily parsed cells.
+    """
+
+    ## The formulas of the test sheet. A1 reads B1, which is written by A2.
+    formulas = {
+        (1, 1) : '=CHAR(B1)&"A2"',
+        (2, 1) : '=SET.VALUE(B1, 65)',
+        (3, 1) : '=HALT()',
+    }
+
+    def setUp(self):
+        self.sheet = excel.ExcelSheet({}, "Macro1")
+        self.sheet.xlm_cell_indices = sorted(self.formulas.keys())
+        for cell_index, formula in self.formulas.items():
+            self.sheet.cells[cell_index] = XLM.XLM_Object.LazyXLM_Object(cell_index[0], cell_index[1], formula)
+
+    def test_not_parsed(self):
+        graph = XLM.cell_graph.CellGraph(self.sheet)
+        for cell_index in self.formulas:
+            self.assertFalse(self.sheet.cells[cell_index].is_parsed())
+        self.assertEqual(graph.readers[(1, 2)], set([(1, 1)]))
+        self.assertEqual(graph.writers[(1, 2)], set([(2, 1)]))
+
+    def test_order(self):
+        graph = XLM.cell_graph.CellGraph(self.sheet)
+        order = []
+        cell_index = graph.next_cell()
+        while (cell_index is not None):
+            order.append(cell_index)
+            cell_index = graph.next_cell()
+        self.assertEqual(order, [(2, 1), (1, 1), (3, 1)])
+
+    def test_parsed_dependencies(self):
+        for cell_index, formula in self.formulas.items():
+            xlm_cell = self.sheet.cells[cell_index]
+            text_deps = xlm_cell.dependencies()
+            xlm_cell.stack
+            self.assertTrue(xlm_cell.is_parsed())
+            self.assertEqual(xlm_cell.dependencies(), text_deps)
+
+if __name__ == '__main__':
+    unittest.main()
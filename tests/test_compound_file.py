@@ -0,0 +1,144 @@
+"""
+Tests for reading OLE2 compound files (XLM.compound_file).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import struct
+import unittest
+
+import XLM.compound_file
+from XLM.compound_file import CompoundFile, ENDOFCHAIN, FATSECT, FREESECT
+
+## Size of the regular sectors of the test files.
+SECTOR_SIZE = 512
+
+## Size of the mini sectors of the test files.
+MINI_SECTOR_SIZE = 64
+
+####################################################################
+def _pad(data, size):
+    """
+    Pad data with 0 bytes to a multiple of the given size.
+
+    @param data (bytes) The data to pad.
+    @param size (int) The block size.
+
+    @return (bytes) The padded data.
+    """
+    return data + (b"\x00" * ((-len(data)) % size))
+
+####################################################################
+def _dir_entry(name, entry_type, start_sector, size):
+    """
+    Make a 128 byte directory entry.
+
+    @param name (str) The entry name.
+    @param entry_type (int) The entry type (STGTY_*).
+    @param start_sector (int) The 1st sector of the entry data.
+    @param size (int) The size of the entry data.
+
+    @return (bytes) The directory entry.
+    """
+    raw_name = (name + "\x00").encode("utf-16-le")
+    r = raw_name.ljust(64, b"\x00")
+    r += struct.pack("<HBB", len(raw_name), entry_type, 1)
+    r += struct.pack("<III", FREESECT, FREESECT, FREESECT)
+    r += b"\x00" * 36
+    r += struct.pack("<III", start_sector, size, 0)
+    return r
+
+####################################################################
+def make_cfb(streams, fragmented=False):
+    """
+    Make an OLE2 compound file with 512 byte sectors. Streams smaller than 4096
+    bytes are stored in the mini stream.
+
+    @param streams (list) The (name, data) tuples of the streams.
+    @param fragmented (boolean) If True the sectors of each stream (and mini
+    stream) chain are stored in reverse order, so no chain is contiguous.
+
+    @return (bytes) The contents of the compound file.
+    """
+
+    # Sector 0 is the FAT, sector 1 the directory and sector 2 the mini FAT.
+    fat = {0 : FATSECT, 1 : ENDOFCHAIN, 2 : ENDOFCHAIN}
+    mini_fat = {}
+    def add_chain(data, chain_fat, blocks, block_size):
+        data = _pad(data, block_size)
+        ids = list(range(len(blocks), len(blocks) + max(len(data) // block_size, 1)))
+        if fragmented:
+            ids.reverse()
+        blocks.extend([b""] * len(ids))
+        for i, block_id in enumerate(ids):
+            chain_fat[block_id] = ids[i + 1] if ((i + 1) < len(ids)) else ENDOFCHAIN
+            blocks[block_id] = data[(i * block_size):((i + 1) * block_size)].ljust(block_size, b"\x00")
+        return ids[0]
+
+    # Put the small streams in the mini stream and the mini stream and the big
+    # streams in regular sectors.
+    sectors = [b"", b"", b""]
+    mini_sectors = []
+    entries = []
+    for name, data in streams:
+        if (len(data) < 4096):
+            entries.append((name, add_chain(data, mini_fat, mini_sectors, MINI_SECTOR_SIZE), len(data)))
+    mini_stream = b"".join(mini_sectors)
+    root_start = add_chain(mini_stream, fat, sectors, SECTOR_SIZE)
+    for name, data in streams:
+        if (len(data) >= 4096):
+            entries.append((name, add_chain(data, fat, sectors, SECTOR_SIZE), len(data)))
+    directory = [_dir_entry("Root Entry", XLM.compound_file.STGTY_ROOT, root_start, len(mini_stream))]
+    for name, start, size in entries:
+        directory.append(_dir_entry(name, XLM.compound_file.STGTY_STREAM, start, size))
+
+    # Build the header and the special sectors.
+    header = XLM.compound_file.CFB_MAGIC + (b"\x00" * 16)
+    header += struct.pack("<HHHHH", 0x3E, 3, 0xFFFE, 9, 6) + (b"\x00" * 10)
+    header += struct.pack("<IIIIIIII", 1, 1, 0, 4096, 2, 1, ENDOFCHAIN, 0)
+    header += struct.pack("<109I", *([0] + ([FREESECT] * 108)))
+    sectors[0] = struct.pack("<128I", *[fat.get(i, FREESECT) for i in range(0, 128)])
+    sectors[1] = _pad(b"".join(directory), SECTOR_SIZE)
+    sectors[2] = struct.pack("<128I", *[mini_fat.get(i, FREESECT) for i in range(0, 128)])
+    return header + b"".join(sectors)
+
+####################################################################
+class TestCompoundFile(unittest.TestCase):
+    """
+    Streams are read from contiguous, fragmented and mini stream sector chains.
+    """
+
+    ## The test streams. Workbook spans several regular sectors and Small spans
+    ## several mini sectors.
+    streams = [("Workbook", bytes(bytearray(i % 251 for i in range(0, 5000)))),
+               ("Small", b"0123456789" * 20)]
+
+    def _check_streams(self, ole):
+        self.assertEqual(sorted(ole.stream_names()), ["Small", "Workbook"])
+        self.assertTrue(ole.has_stream("workbook"))
+        self.assertFalse(ole.has_stream("Book"))
+        for name, data in self.streams:
+            self.assertEqual(ole.stream_size(name), len(data))
+            self.assertEqual(bytes(ole.read_stream(name)), data)
+            self.assertEqual(bytes(ole.read_stream(name, 100)), data[:100])
+        self.assertIsNone(ole.read_stream("Book"))
+
+    def test_contiguous(self):
+        ole = CompoundFile(make_cfb(self.streams))
+        self._check_streams(ole)
+
+        # Contiguous chains are not copied out of the file data.
+        self.assertIsInstance(ole.read_stream("Workbook"), memoryview)
+
+    def test_fragmented(self):
+        ole = CompoundFile(make_cfb(self.streams, fragmented=True))
+        self._check_streams(ole)
+        self.assertIsInstance(ole.read_stream("Workbook"), bytes)
+
+    def test_not_cfb(self):
+        self.assertFalse(XLM.compound_file.is_cfb_data(b"PK\x03\x04"))
+        self.assertRaises(ValueError, CompoundFile, b"PK\x03\x04" + (b"\x00" * 1024))
+        self.assertRaises(ValueError, CompoundFile, XLM.compound_file.CFB_MAGIC)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+Tests for reading Excel 2007+ files (XLM.excel2007).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import io
+import unittest
+import zipfile
+
+import XLM.color_print
+import XLM.excel2007
+import XLM.XLM_Object
+from XLM.ms_stack_transformer import SharedFormula
+from XLM.stack_item import stack_cell_ref
+
+XLM.color_print.quiet = True
+
+## xl/workbook.xml of the test workbook.
+_WORKBOOK_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+          xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">
+ <sheets><sheet name="Macro1" sheetId="1" r:id="rId1"/><sheet name="Data" sheetId="2" r:id="rId2"/></sheets>
+</workbook>"""
+
+## xl/_rels/workbook.xml.rels of the test workbook.
+_RELS_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">
+ <Relationship Id="rId1" Type="http://schemas.microsoft.com/office/2006/relationships/xlMacrosheet" Target="macrosheets/sheet1.xml"/>
+ <Relationship Id="rId2" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" Target="worksheets/sheet1.xml"/>
+</Relationships>"""
+
+## The macro sheet of the test workbook. A1:A3 and B5:D5 are shared formula
+## ranges with relative, absolute and mixed cell references.
+_MACROSHEET_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<xm:macrosheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+               xmlns:xm="http://schemas.microsoft.com/office/excel/2006/main">
+ <sheetData>
+  <row r="1"><c r="A1" t="str"><f t="shared" ref="A1:A3" si="0">B1&amp;$C$1&amp;D$1&amp;$E1</f><v>a</v></c></row>
+  <row r="2"><c r="A2" t="str"><f t="shared" si="0"/><v>b</v></c></row>
+  <row r="3"><c r="A3" t="str"><f t="shared" si="0"/><v>c</v></c></row>
+  <row r="5">
+   <c r="B5"><f t="shared" ref="B5:D5" si="1">A5+$A$1+A$1+$A5</f><v>1</v></c>
+   <c r="C5"><f t="shared" si="1"/><v>2</v></c>
+   <c r="D5"><f t="shared" si="1"/><v>3</v></c>
+  </row>
+ </sheetData>
+</xm:macrosheet>"""
+
+## A worksheet that is not referenced by name in the macro formulas.
+_WORKSHEET_XML = """<?xml version="1.0" encoding="UTF-8" standalone="yes"?>
+<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">
+ <sheetData>
+  <row r="1"><c r="A1" t="inlineStr"><is><t>calc</t></is></c><c r="B1"><v>42</v></c></row>
+ </sheetData>
+</worksheet>"""
+
+####################################################################
+def _make_workbook():
+    """
+    Make the test Excel 2007+ workbook.
+
+    @return (bytes) The contents of the workbook file.
+    """
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as z:
+        z.writestr("xl/workbook.xml", _WORKBOOK_XML)
+        z.writestr("xl/_rels/workbook.xml.rels", _RELS_XML)
+        z.writestr("xl/macrosheets/sheet1.xml", _MACROSHEET_XML)
+        z.writestr("xl/worksheets/sheet1.xml", _WORKSHEET_XML)
+    return data.getvalue()
+
+####################################################################
+def _cell_refs(xlm_cell):
+    """
+    Get the cells referenced by an XLM cell.
+
+    @param xlm_cell (XLM_Object object) The XLM cell.
+
+    @return (list) The (row, column) tuples of the referenced cells.
+    """
+    return [(item.row, item.column) for item in xlm_cell.stack if isinstance(item, stack_cell_ref)]
+
+####################################################################
+class TestSharedFormulas(unittest.TestCase):
+    """
+    The cells of a shared formula range move the relative parts of the cell
+    references of the 1st cell of the range.
+    """
+
+    ## The cells referenced by the shared formula cells, in formula order.
+    expected_refs = {
+        (1, 1) : [(1, 2), (1, 3), (1, 4), (1, 5)],
+        (2, 1) : [(2, 2), (1, 3), (1, 4), (2, 5)],
+        (3, 1) : [(3, 2), (1, 3), (1, 4), (3, 5)],
+        (5, 2) : [(5, 1), (1, 1), (1, 1), (5, 1)],
+        (5, 3) : [(5, 2), (1, 1), (1, 2), (5, 1)],
+        (5, 4) : [(5, 3), (1, 1), (1, 3), (5, 1)],
+    }
+
+    def setUp(self):
+        self.formulas, self.workbook = XLM.excel2007.read_excel_2007_workbook(None, _make_workbook())
+
+    def test_shift_formula(self):
+        self.assertEqual(XLM.excel2007._shift_formula("Doc1!A1+B2", 1, 0), "Doc1!A2+B3")
+        self.assertEqual(XLM.excel2007._shift_formula('B1&$C$1&D$1&$E1&"A1"', 2, 1), 'C3&$C$1&E$1&$E3&"A1"')
+
+    def test_shared_formula_cells(self):
+        shared_cells = self.workbook.shared_formula_cells["Macro1"]
+        self.assertEqual(sorted(shared_cells.keys()), sorted(self.expected_refs.keys()))
+        for cell_index in self.expected_refs:
+            master_index = (1, 1) if (cell_index[1] == 1) else (5, 2)
+            self.assertEqual(shared_cells[cell_index][0], master_index)
+        self.assertEqual(self.formulas["Macro1"][(3, 1)][0], "B3&$C$1&D$1&$E3")
+        self.assertEqual(self.formulas["Macro1"][(5, 4)][0], "C5+$A$1+C$1+$A5")
+
+    def test_relocate_shared_formulas(self):
+        shared_cells = self.workbook.shared_formula_cells["Macro1"]
+        shared_formulas = {}
+        for cell_index, (master_index, master_formula) in shared_cells.items():
+            if (master_index not in shared_formulas):
+                shared_formulas[master_index] = SharedFormula("=" + master_formula, master_index)
+            formula = "=" + self.formulas["Macro1"][cell_index][0]
+            xlm_cell = XLM.XLM_Object.LazyXLM_Object(cell_index[0], cell_index[1], formula, shared_formulas[master_index])
+            self.assertEqual(_cell_refs(xlm_cell), self.expected_refs[cell_index])
+
+####################################################################
+class TestSheetValues(unittest.TestCase):
+    """
+    The values of sheets that are not macro sheets are read when they are first
+    looked at, even if the sheet name is built at run time.
+    """
+
+    def test_read_on_lookup(self):
+        _, workbook = XLM.excel2007.read_excel_2007_workbook(None, _make_workbook())
+        self.assertEqual(workbook.sheet_names(), ["Macro1", "Data"])
+        cells = workbook.sheet_by_name("Data").cells
+        self.assertIsNotNone(cells.read_cells)
+        self.assertEqual(cells.get((1, 2)), "42")
+        self.assertIsNone(cells.read_cells)
+        self.assertEqual(dict(cells), {(1, 1) : "calc", (1, 2) : "42"})
+
+if __name__ == '__main__':
+    unittest.main()
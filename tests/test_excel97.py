@@ -0,0 +1,200 @@
+"""
+Tests for reading Excel 97 files (XLM.excel97).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import struct
+import unittest
+
+import excel
+
+import XLM.color_print
+import XLM.excel97
+import XLM.XLM_Object
+from XLM.excel97 import REC_BOF, REC_BOUNDSHEET, REC_CONTINUE, REC_EOF, REC_FORMULA, REC_LABELSST, \
+    REC_NUMBER, REC_SHRFMLA, REC_SST, REC_STRING
+from XLM.stack_item import stack_cell_ref
+
+from test_compound_file import make_cfb
+
+XLM.color_print.quiet = True
+
+####################################################################
+def _record(rec_type, data):
+    """
+    Make a BIFF8 record.
+
+    @param rec_type (int) The record type.
+    @param data (bytes) The record data.
+
+    @return (bytes) The record.
+    """
+    return struct.pack("<HH", rec_type, len(data)) + data
+
+####################################################################
+def _formula(row, col, rgce, value=None):
+    """
+    Make a FORMULA record.
+
+    @param row (int) The 0 based row of the cell.
+    @param col (int) The 0 based column of the cell.
+    @param rgce (bytes) The formula tokens.
+    @param value (float) The cached value of the formula, None if the value is a
+    string stored in the following STRING record.
+
+    @return (bytes) The record.
+    """
+    if (value is None):
+        raw_value = b"\x00" * 6 + b"\xff\xff"
+    else:
+        raw_value = struct.pack("<d", value)
+    return _record(REC_FORMULA, struct.pack("<HHH", row, col, 0) + raw_value +
+                   struct.pack("<HIH", 0, 0, len(rgce)) + rgce)
+
+## BOF record of the workbook globals and the sheet substreams.
+_BOF = _record(REC_BOF, struct.pack("<HHHHII", 0x0600, 0x0005, 0, 0, 0, 0))
+
+## SST with 2 strings. The 2nd string is split over a CONTINUE record and
+## switches to UTF-16 in the continuation.
+_SST = (_record(REC_SST, struct.pack("<II", 2, 2) + struct.pack("<HB", 5, 0) + b"hello" +
+                struct.pack("<HB", 5, 0) + b"wo") +
+        _record(REC_CONTINUE, b"\x01" + u"rld".encode("utf-16-le")))
+
+## Cells of the macro sheet:
+##   A1: =B1&CHAR(65)
+##   B1: "hello"
+##   A2:A3: Shared formula =B2*10 (relative reference to the cell on the right).
+##          A2 has the string value "x".
+##   B2: 2, B3: 3
+_MACRO_CELLS = (
+    _formula(0, 0, b"\x24\x00\x00\x01\x00" + b"\x1e\x41\x00" + b"\x21\x6f\x00" + b"\x08", 0.0) +
+    _record(REC_LABELSST, struct.pack("<HHHI", 0, 1, 0, 0)) +
+    _formula(1, 0, b"\x01\x01\x00\x00\x00") +
+    _record(REC_SHRFMLA, struct.pack("<HHBBBBH", 1, 2, 0, 0, 0, 2, 9) +
+            b"\x2c\x00\x00\x01\xc0" + b"\x1e\x0a\x00" + b"\x05") +
+    _record(REC_STRING, struct.pack("<HB", 1, 0) + b"x") +
+    _record(REC_NUMBER, struct.pack("<HHHd", 1, 1, 0, 2.0)) +
+    _formula(2, 0, b"\x01\x01\x00\x00\x00", 30.0) +
+    _record(REC_NUMBER, struct.pack("<HHHd", 2, 1, 0, 3.0)))
+
+## Cells of the worksheet. A1 is the 2nd shared string.
+_DATA_CELLS = _record(REC_LABELSST, struct.pack("<HHHI", 0, 0, 0, 1))
+
+####################################################################
+def _boundsheet(offset, sheet_type, name):
+    """
+    Make a BOUNDSHEET record.
+
+    @param offset (int) The stream offset of the sheet substream.
+    @param sheet_type (int) The sheet type.
+    @param name (str) The sheet name.
+
+    @return (bytes) The record.
+    """
+    return _record(REC_BOUNDSHEET, struct.pack("<IBBBB", offset, 0, sheet_type, len(name), 0) + name.encode("latin-1"))
+
+####################################################################
+def _make_workbook_stream():
+    """
+    Make the Workbook stream of the test workbook, a macro sheet and a worksheet.
+
+    @return (bytes) The Workbook stream.
+    """
+    sheets = [("Macro1", XLM.excel97.SHEET_TYPE_MACRO, _MACRO_CELLS),
+              ("Data", XLM.excel97.SHEET_TYPE_WORKSHEET, _DATA_CELLS)]
+    globals_size = len(_BOF) + len(_SST) + len(_record(REC_EOF, b""))
+    globals_size += sum([len(_boundsheet(0, sheet_type, name)) for name, sheet_type, _ in sheets])
+    r = _BOF
+    substreams = b""
+    for name, sheet_type, cells in sheets:
+        r += _boundsheet(globals_size + len(substreams), sheet_type, name)
+        substreams += _BOF + cells + _record(REC_EOF, b"")
+    r += _SST + _record(REC_EOF, b"") + substreams
+
+    # Pad the stream so it is stored in regular sectors.
+    return r + (b"\x00" * (5000 - len(r)))
+
+####################################################################
+class TestParseFormula(unittest.TestCase):
+    """
+    ptg tokens are decoded into stack items.
+    """
+
+    def test_tokens(self):
+        rgce = b"\x1e\x41\x00" + b"\x21\x6f\x00" + b"\x17\x02\x00bc" + b"\x08"
+        stack = XLM.excel97.parse_formula(rgce)
+        self.assertEqual([item.__class__.__name__ for item in stack],
+                         ["stack_int", "stack_funcv", "stack_str", "stack_concat"])
+        xlm_cell = XLM.XLM_Object.XLM_Object(1, 1, stack)
+        self.assertEqual(XLM.XLM_Object._eval_cell(xlm_cell, excel.ExcelSheet({}, "Macro1"), []), "Abc")
+
+    def test_relative_ref(self):
+        # ptgRefN to the cell 1 row down and 2 columns left of the formula cell.
+        stack = XLM.excel97.parse_formula(b"\x2c\x01\x00\xfe\xc0")
+        xlm_cell = XLM.XLM_Object.XLM_Object(5, 5, stack)
+        self.assertEqual([(item.row, item.column) for item in xlm_cell.stack], [(6, 3)])
+
+    def test_truncated(self):
+        stack = XLM.excel97.parse_formula(b"\x1e\x41")
+        self.assertEqual([item.__class__.__name__ for item in stack], ["unparsed"])
+
+####################################################################
+class TestReadWorkbook(unittest.TestCase):
+    """
+    Formula and value cells are read from a BIFF8 Workbook stream.
+    """
+
+    def setUp(self):
+        self.stream = _make_workbook_stream()
+
+    def test_sst(self):
+        self.assertEqual(XLM.excel97._read_sst(self.stream), ["hello", "world"])
+
+    def test_bound_sheets(self):
+        sheets = XLM.excel97.read_bound_sheets(self.stream)
+        self.assertEqual([(name, sheet_type) for name, sheet_type, _ in sheets], [("Macro1", 1), ("Data", 0)])
+
+    def _check_workbook(self, data):
+        formulas, workbook = XLM.excel97.read_excel_97_workbook(None, data)
+        self.assertEqual(workbook.sheet_names(), ["Macro1", "Data"])
+
+        # Formula cells. The shared formula cells reference the cell to their right.
+        xlm_cells = formulas["Macro1"]
+        self.assertEqual(sorted((row, col) for row in xlm_cells for col in xlm_cells[row]), [(1, 1), (2, 1), (3, 1)])
+        for row in (2, 3):
+            refs = [(item.row, item.column) for item in xlm_cells[row][1].stack if isinstance(item, stack_cell_ref)]
+            self.assertEqual(refs, [(row, 2)])
+
+        # Value cells. The string value of A2 follows the SHRFMLA record.
+        cells = workbook.sheet_by_name("Macro1").cells
+        self.assertEqual(cells[(1, 2)], "hello")
+        self.assertEqual(cells[(2, 1)], "x")
+        self.assertEqual(cells[(3, 1)], "30")
+        self.assertEqual(cells[(2, 2)], "2")
+
+        # The worksheet is read on first lookup.
+        data_cells = workbook.sheet_by_name("Data").cells
+        self.assertIsNotNone(data_cells.read_cells)
+        self.assertEqual(data_cells[(1, 1)], "world")
+
+        # Emulate the shared formula cell.
+        sheet = workbook.sheet_by_name("Macro1")
+        for row in xlm_cells:
+            for col in xlm_cells[row]:
+                sheet.cells[(row, col)] = xlm_cells[row][col]
+        self.assertEqual(str(XLM.XLM_Object._eval_cell(xlm_cells[3][1], sheet, [])), "30")
+        self.assertEqual(XLM.XLM_Object._eval_cell(xlm_cells[1][1], sheet, []), "helloA")
+
+    def test_read_workbook(self):
+        self._check_workbook(make_cfb([("Workbook", self.stream)]))
+
+    def test_read_fragmented_workbook(self):
+        self._check_workbook(make_cfb([("Workbook", self.stream)], fragmented=True))
+
+    def test_has_XLM(self):
+        self.assertTrue(XLM.excel97.has_excel_97_XLM(None, make_cfb([("Workbook", self.stream)])))
+        self.assertFalse(XLM.excel97.has_excel_97_XLM(None, make_cfb([("Workbook", _BOF + _record(REC_EOF, b""))])))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+"""
+Tests for parsing MS XLM formulas (XLM.ms_stack_transformer).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import unittest
+
+import excel
+
+import XLM.color_print
+import XLM.ms_stack_transformer
+import XLM.XLM_Object
+
+XLM.color_print.quiet = True
+
+####################################################################
+class TestUnparseableFormulas(unittest.TestCase):
+    """
+    Formulas the grammar cannot handle are kept as string cells.
+    """
+
+    ## Formulas the MS XLM grammar cannot parse.
+    bad_formulas = ['=A1+)',
+                    '=SUM(A1:B4)',
+                    '=Sheet1!A1+B2',
+                    '=R3C4',
+                    '=FORMULA("=EXEC(""x"")",A5)']
+
+    def test_parse_ms_xlm(self):
+        for formula in self.bad_formulas:
+            r = XLM.ms_stack_transformer.parse_ms_xlm(formula)
+            self.assertEqual(len(r.stack), 1)
+            self.assertEqual(r.stack[0].value, formula)
+
+    def test_parse_ms_xlm_cell(self):
+        for formula in self.bad_formulas:
+            r = XLM.ms_stack_transformer.parse_ms_xlm_cell(formula, (3, 3))
+            self.assertEqual(len(r.stack), 1)
+            self.assertEqual(r.stack[0].value, formula)
+
+    def test_emulate_sheet(self):
+        sheet = excel.ExcelSheet({}, "Macro1")
+        sheet.xlm_cell_indices = []
+        formulas = self.bad_formulas + ['=HALT()']
+        for row in range(1, len(formulas) + 1):
+            cell_index = (row, 1)
+            sheet.cells[cell_index] = XLM.ms_stack_transformer.parse_ms_xlm_cell(formulas[row - 1], cell_index)
+            sheet.xlm_cell_indices.append(cell_index)
+        actions, _ = XLM.XLM_Object.eval(sheet)
+        self.assertEqual(actions, [("HALT", "HALT", "Done.")])
+
+if __name__ == '__main__':
+    unittest.main()
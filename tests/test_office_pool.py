@@ -0,0 +1,128 @@
+"""
+Tests for the office_dumper conversion pool (XLM.office_pool).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import multiprocessing
+import threading
+import time
+import unittest
+
+import excel
+
+import XLM.color_print
+import XLM.office_pool
+
+XLM.color_print.quiet = True
+
+####################################################################
+def _fake_read_excel_sheets(fname):
+    """
+    Stand in for office_dumper in the worker processes. Files named 'hang'
+    never finish converting and files named 'slow' take 0.8 seconds.
+
+    @param fname (str) The name of the Excel file to read.
+
+    @return (str) The file name.
+    """
+    if (fname == "hang"):
+        time.sleep(60)
+    if (fname == "slow"):
+        time.sleep(0.8)
+    return fname
+
+####################################################################
+class _FakeListener(object):
+    """
+    Listener that records restarts instead of running LibreOffice.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.restarts = []
+
+    def start(self):
+        return True
+
+    def stop(self):
+        pass
+
+    def restart(self):
+        # Record the # of conversions still running on the listener.
+        self.restarts.append(self.pool.num_active)
+        return True
+
+####################################################################
+@unittest.skipUnless(multiprocessing.get_start_method() == "fork", "workers need to inherit the fake office_dumper")
+class TestOfficeConverterPool(unittest.TestCase):
+    """
+    Wedged conversions restart the shared listener and replace their worker.
+    """
+
+    def setUp(self):
+        self.saved_read = excel.read_excel_sheets
+        excel.read_excel_sheets = _fake_read_excel_sheets
+        self.pool = XLM.office_pool.OfficeConverterPool(num_workers=2, timeout=1)
+        self.listener = _FakeListener(self.pool)
+        self.pool.listener = self.listener
+
+    def tearDown(self):
+        self.pool.shutdown()
+        excel.read_excel_sheets = self.saved_read
+
+    def test_convert(self):
+        self.assertEqual(self.pool.read_excel_sheets("a.xls"), "a.xls")
+        self.assertEqual(self.pool.read_excel_sheets("b.xls"), "b.xls")
+        self.assertEqual(self.listener.restarts, [])
+
+    def test_timeout(self):
+        self.assertIsNone(self.pool.read_excel_sheets("hang"))
+        self.assertEqual(self.listener.restarts, [0])
+
+        # The killed worker is replaced and not put back on the idle queue.
+        self.assertEqual(len(self.pool.workers), 2)
+        self.assertEqual(self.pool.idle.qsize(), 2)
+        self.assertTrue(all(worker.is_alive() for worker in self.pool.workers))
+        self.assertEqual(self.pool.read_excel_sheets("a.xls"), "a.xls")
+        self.assertEqual(self.pool.read_excel_sheets("b.xls"), "b.xls")
+
+    def test_restart_waits_for_conversions(self):
+        results = {}
+        def convert(fname):
+            results[fname] = self.pool.read_excel_sheets(fname)
+        slow = threading.Thread(target=convert, args=("slow",))
+        hang = threading.Thread(target=convert, args=("hang",))
+        # The slow conversion is still running when the hang conversion times out.
+        hang.start()
+        time.sleep(0.5)
+        slow.start()
+        hang.join()
+        slow.join()
+
+        # The slow conversion finished before the listener was restarted.
+        self.assertEqual(results, {"hang" : None, "slow" : "slow"})
+        self.assertEqual(self.listener.restarts, [0])
+
+    def test_timeouts_restart_once(self):
+        threads = [threading.Thread(target=self.pool.read_excel_sheets, args=("hang",)) for _ in range(0, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.listener.restarts, [0])
+        self.assertEqual(len(self.pool.workers), 2)
+        self.assertEqual(self.pool.read_excel_sheets("a.xls"), "a.xls")
+
+    def test_dead_worker_not_queued(self):
+        self.pool._start()
+        worker = self.pool.idle.get()
+        worker.kill()
+        self.pool._release(worker)
+        self.assertNotIn(worker, self.pool.workers)
+        self.assertEqual(len(self.pool.workers), 2)
+        self.assertEqual(self.pool.idle.qsize(), 2)
+        self.assertTrue(all(worker.is_alive() for worker in self.pool.workers))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+"""
+Tests for simplifying parsed XLM stacks (XLM.stack_optimizer).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import unittest
+
+import XLM.color_print
+import XLM.ms_stack_transformer
+import XLM.stack_optimizer
+import XLM.XLM_Object
+from XLM.stack_item import *
+
+XLM.color_print.quiet = True
+
+####################################################################
+class TestFoldedValues(unittest.TestCase):
+    """
+    Folded formulas give the value Excel computes for them.
+    """
+
+    ## Formulas with literal arguments and the values Excel gives for them.
+    excel_values = [
+        ('=LEN("ab")', 2),
+        ('=LEN("")', 0),
+        ('=LEN(12345)', 5),
+        ('=MID("ABCDA",2,2)', "BC"),
+        ('=MID(CONCATENATE("AB","CD",CHAR(65)),2,LEN("ab"))', "BC"),
+        ('=MID("abc",4,2)', ""),
+        ('=CHAR(100+5-2)', "g"),
+        ('=LOWER("AbC")&"d"', "abcd"),
+        ('=CONCATENATE("a",1,"b")', "a1b"),
+    ]
+
+    def test_fold(self):
+        for formula, value in self.excel_values:
+            stack = XLM.ms_stack_transformer.parse_ms_xlm(formula).stack
+            self.assertEqual(len(stack), 1, formula)
+            self.assertEqual(stack[0].value, value, formula)
+
+    def test_not_folded(self):
+        # Excel gives #VALUE! for these, so they are left to the emulator.
+        for formula in ['=MID("abc",0,2)', '=MID("abc",1,-1)']:
+            stack = XLM.ms_stack_transformer.parse_ms_xlm(formula).stack
+            self.assertEqual(stack[-1].name, "MID", formula)
+
+####################################################################
+class TestUnaryOperators(unittest.TestCase):
+    """
+    The unary minus and plus operators take a single argument.
+    """
+
+    def test_fold(self):
+        # --1 and +-2 in Excel 97 (ptg) order.
+        stack = XLM.stack_optimizer.fold_constants([stack_int(1), stack_uminus(), stack_uminus()])
+        self.assertEqual([item.value for item in stack], [1])
+        stack = XLM.stack_optimizer.fold_constants([stack_int(2), stack_uminus(), stack_uplus()])
+        self.assertEqual([item.value for item in stack], [-2])
+
+    def test_not_folded(self):
+        stack = [stack_cell_ref(1, 1), stack_uminus()]
+        self.assertEqual(XLM.stack_optimizer.fold_constants(stack), stack)
+
+    def test_str(self):
+        xlm_cell = XLM.XLM_Object.XLM_Object(2, 1, [stack_cell_ref(1, 1), stack_uminus(), stack_int(3), stack_add()])
+        self.assertEqual(str(xlm_cell), "-$R1$C1+3")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""
+Tests for the file reading utilities (XLM.utils).
+
+Run from the top of the repository with 'python -m unittest discover tests'.
+"""
+
+import os
+import tempfile
+import unittest
+import zipfile
+
+import XLM
+import XLM.color_print
+import XLM.utils
+
+XLM.color_print.quiet = True
+
+####################################################################
+class TestMappedFiles(unittest.TestCase):
+    """
+    File mappings made by map_file() are closed once the file has been read.
+    """
+
+    def setUp(self):
+        fd, self.fname = tempfile.mkstemp()
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"not an Excel file")
+        self.saved_map_file = XLM.utils.map_file
+        self.mappings = []
+        def map_file(fname):
+            data = self.saved_map_file(fname)
+            self.mappings.append(data)
+            return data
+        XLM.utils.map_file = map_file
+
+    def tearDown(self):
+        XLM.utils.map_file = self.saved_map_file
+        os.remove(self.fname)
+
+    def test_close_mapped_file(self):
+        data = XLM.utils.map_file(self.fname)
+        view = memoryview(data)
+        XLM.utils.close_mapped_file(data)
+        self.assertFalse(data.closed)
+        view.release()
+        XLM.utils.close_mapped_file(data)
+        self.assertTrue(data.closed)
+        XLM.utils.close_mapped_file(b"")
+
+    def test_emulate_closes_mapping(self):
+        self.assertEqual(XLM.emulate(self.fname), ([], ""))
+        self.assertEqual(len(self.mappings), 1)
+        self.assertTrue(self.mappings[0].closed)
+
+    def test_excel_file_type(self):
+        self.assertFalse(XLM.utils.is_excel_file(self.fname))
+        with zipfile.ZipFile(self.fname, "w") as z:
+            z.writestr("[Content_Types].xml", '<Types><Override ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/></Types>')
+        self.assertTrue(XLM.utils.is_excel_file_2007(self.fname))
+        self.assertFalse(XLM.utils.is_excel_file_97(self.fname))
+        self.assertEqual(len(self.mappings), 3)
+        self.assertTrue(all(data.closed for data in self.mappings))
+
+if __name__ == '__main__':
+    unittest.main()
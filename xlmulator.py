@@ -31,22 +31,28 @@ def emulate_XLM(maldoc, debug=False, out_file_name=None):
     by the sheet, 2nd element is the human readable XLM code.
     """
 
-    # Does the file exist?
+    # Memory map the file. The mapping is shared by the rest of the emulation
+    # pipeline, so only the parts of the file that are looked at are read.
     try:
-        f = open(maldoc, 'r')
-        f.close()
-    except IOError:
+        data = XLM.utils.map_file(maldoc)
+    except (IOError, ValueError):
         XLM.color_print.output('r', "ERROR: File '" + str(maldoc) + "' cannot be opened. Not emulating.")
         return ([], "")
         
-    # Only emulate Excel files.
-    if (not XLM.utils.is_excel_file(maldoc)):
-        XLM.color_print.output('y', "WARNING: '" + str(maldoc) + "' is not an Excel file. Not emulating.")
-        return ([], "")
-    
-    # Emulate the XLM macros.
-    XLM.set_debug(debug)
-    r = XLM.emulate(maldoc)
+    try:
+
+        # Only emulate Excel files. The file type is computed once here and passed
+        # along to the rest of the emulation pipeline.
+        file_type = XLM.utils.get_excel_file_type(maldoc, data)
+        if (file_type is None):
+            XLM.color_print.output('y', "WARNING: '" + str(maldoc) + "' is not an Excel file. Not emulating.")
+            return ([], "")
+
+        # Emulate the XLM macros.
+        XLM.set_debug(debug)
+        r = XLM.emulate(maldoc, file_type, data)
+    finally:
+        XLM.utils.close_mapped_file(data)
     
     print(':'.join(get_xlmfuncset(r[1])))
 
@@ -157,8 +163,19 @@ if __name__ == '__main__':
     parser.add_argument('-q', '--quiet',
                         action='store_true',
                         help="Do not print progress or error messages.")
+    parser.add_argument('-j', '--parse-workers', type=int, default=1,
+                        help="# of worker processes used to parse the formulas of large Excel 2007+ macro sheets.")
+    parser.add_argument('-f', '--follow-flow',
+                        action='store_true',
+                        help="Only emulate the XLM cells run when following the control flow from the Auto_Open cells.")
     args = parser.parse_args()
 
+    # Parsing large macro sheets in parallel?
+    XLM.set_parse_workers(args.parse_workers)
+
+    # Following the control flow of the macros?
+    XLM.set_follow_control_flow(args.follow_flow)
+
     # Disabling progress output?
     if (args.quiet):
         XLM.color_print.quiet = True